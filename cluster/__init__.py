@@ -1,7 +1,4 @@
-# this is a namespace package
-try:
-    import pkg_resources
-    pkg_resources.declare_namespace(__name__)
-except ImportError:
-    import pkgutil
-    __path__ = pkgutil.extend_path(__path__, __name__)
+# this is a namespace package, pkg_resources is not used to declare it as
+# it's slow to import and would delay every command line start
+import pkgutil
+__path__ = pkgutil.extend_path(__path__, __name__)
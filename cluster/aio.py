@@ -0,0 +1,253 @@
+"""asyncio interface to drive many cluster operations at once"""
+import asyncio
+import collections
+import functools
+import types
+
+from concurrent import futures
+
+from cluster import cluster
+from cluster import watch
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class AsyncCluster:
+    """Coroutine versions of :py:class:`cluster.cluster.Cluster` commands
+    sharing the event loop and a single :py:class:`Cluster`, so its http
+    client and keep-alive connection pool::
+
+        async def redeploy(apps):
+            with AsyncCluster(cluster.Cluster('http://localhost:8500')) as aio:
+                await asyncio.gather(*[
+                    aio.deploy(repo, branch) for repo, branch in apps
+                ])
+
+    Waiting events are consumed does not hold a thread per command: a
+    single :py:class:`cluster.watch.SharedWatch` thread follows keys of all
+    waiting commands. consulate (and requests under it) only provide a
+    blocking http client, so short requests (resolving apps, firing events)
+    run in a pool of ``max_workers`` threads.
+
+    Commands do not ask for confirmation.
+
+    :param cluster: the shared :py:class:`Cluster` instance
+    :param max_workers: max number of short requests sent at the same time
+    """
+
+    def __init__(self, cluster, max_workers=DEFAULT_MAX_WORKERS):
+        self.cluster = cluster
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._watch = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.stop()
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, function, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs)
+        )
+
+    async def nodes(self):
+        return await self._run(lambda: self.cluster.nodes)
+
+    async def checks(self, *args, **kwargs):
+        """see :py:meth:`Cluster.checks`"""
+        return await self._run(self.cluster.checks, *args, **kwargs)
+
+    async def inspect_node(self, *args, **kwargs):
+        """see :py:meth:`Cluster.inspect_node`"""
+        return await self._run(self.cluster.inspect_node, *args, **kwargs)
+
+    async def deploy(
+            self,
+            repo_name,
+            branch,
+            master=None,
+            slave=None,
+            no_wait=False,
+            timeout=cluster.DEFAULT_TIMEOUT,
+            update=False
+    ):
+        """see :py:meth:`Cluster.deploy`
+
+        :return: the event id
+        """
+        key, app = await self._run(
+            self.cluster.get_kv_application, repo_name, branch
+        )
+        deployment = await self._run(
+            self.cluster._plan_deployment,
+            key,
+            app,
+            repo_name,
+            branch,
+            master=master,
+            slave=slave,
+            update=update
+        )
+        return await self._deploy(deployment, no_wait, timeout)
+
+    async def _deploy(self, deployment, no_wait, timeout):
+        return await self._fire_event(
+            deployment.kv_key,
+            'deploy',
+            cluster.Cluster._deploy_payload(
+                deployment.repo_url,
+                deployment.branch,
+                deployment.master,
+                slave=deployment.slave,
+                update=deployment.update
+            ),
+            no_wait,
+            cluster.Cluster.deploy_finished,
+            timeout
+        )
+
+    async def migrate(
+            self,
+            source_repo,
+            source_branch,
+            target_branch,
+            target_repo=None,
+            no_wait=False,
+            timeout=cluster.DEFAULT_TIMEOUT,
+            no_update=False
+    ):
+        """see :py:meth:`Cluster.migrate`
+
+        :return: the event id
+        """
+        _, target_key, payload = await self._run(
+            self.cluster._plan_migration,
+            source_repo,
+            source_branch,
+            target_branch,
+            target_repo=target_repo,
+            no_update=no_update
+        )
+        return await self._fire_event(
+            target_key,
+            'migrate',
+            payload,
+            no_wait,
+            cluster.Cluster.migrate_finished,
+            timeout
+        )
+
+    async def move_masters_from(
+            self,
+            node,
+            master=None,
+            no_wait=False,
+            timeout=cluster.DEFAULT_TIMEOUT,
+            parallel=1,
+            max_per_node=None
+    ):
+        """see :py:meth:`Cluster.move_masters_from`, services are moved
+        ``parallel`` at a time
+
+        :return: see :py:meth:`Cluster._deploy_many`, in deployments order
+        """
+        deployments = await self._run(
+            self.cluster._plan_move_masters, node, master=master
+        )
+        running = asyncio.Semaphore(parallel)
+        per_node = collections.defaultdict(
+            lambda: asyncio.Semaphore(max_per_node or parallel)
+        )
+
+        async def deploy(deployment):
+            # a deployment waiting its node does not hold a running slot
+            async with per_node[deployment.master]:
+                async with running:
+                    try:
+                        await self._deploy(deployment, no_wait, timeout)
+                    except Exception as error:
+                        return deployment, error
+            return deployment, None
+
+        return await asyncio.gather(
+            *[deploy(deployment) for deployment in deployments]
+        )
+
+    async def _fire_event(
+            self,
+            kv_key,
+            event_name,
+            payload,
+            no_wait,
+            event_consumed,
+            timeout
+    ):
+        """see :py:meth:`Cluster._fire_event`"""
+        app_before, event_id = await self._run(
+            self.cluster._fire, kv_key, event_name, payload
+        )
+        if no_wait:
+            return event_id
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        changes = asyncio.Queue()
+        keys = [kv_key, kv_key.replace("app/", "maintenance/")]
+        token = self._shared_watch().follow(
+            keys,
+            lambda records: loop.call_soon_threadsafe(
+                changes.put_nowait, records
+            )
+        )
+        # event_consumed state (ie: migrations seen in maintenance)
+        owner = types.SimpleNamespace(was_maintenance=False)
+        try:
+            # the watch only notifies changes once keys are followed
+            _, records = await self._run(
+                self.cluster.event_consul.txn.get_records, keys
+            )
+            while not cluster.Cluster._event_consumed(
+                    event_consumed, app_before, kv_key, records, owner
+            ):
+                try:
+                    records = await asyncio.wait_for(
+                        changes.get(), max(deadline - loop.time(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "Event (id: {}) was not processed in the "
+                        "expected time ({}s),".format(event_id, timeout)
+                    )
+                if isinstance(records, Exception):
+                    raise records
+        finally:
+            self._shared_watch().unfollow(token)
+        return event_id
+
+    def _shared_watch(self):
+        if self._watch is None:
+            consul = self.cluster.event_consul
+            self._watch = watch.SharedWatch(consul.kv, consul.txn)
+        return self._watch
+
+    async def gather(self, *commands, limit=None):
+        """Run the given coroutines with at most ``limit`` of them running at
+        the same time.
+
+        :return: a list of results or exceptions in the commands order
+        """
+        semaphore = asyncio.Semaphore(limit or len(commands) or 1)
+
+        async def limited(command):
+            async with semaphore:
+                return await command
+
+        return await asyncio.gather(
+            *[limited(command) for command in commands],
+            return_exceptions=True
+        )
@@ -0,0 +1,99 @@
+"""Consul http api defaults and helpers decoding its responses, light to
+import: the consulate based client is :py:mod:`cluster.consul_api`
+"""
+import base64
+import codecs
+import json
+import re
+
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_POOL_SIZE = 32
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+CONSISTENCY_MODES = ['default', 'stale', 'consistent']
+DEFAULT_CONSISTENCY = 'default'
+
+
+def wait_seconds(wait):
+    """Convert a consul duration (ie: ``'10s'``, ``'5m'``) to seconds"""
+    match = re.match(r'^(\d+(?:\.\d+)?)(ms|s|m|h)?$', wait.strip())
+    if not match:
+        raise ValueError("Invalid consul duration: {}".format(wait))
+    value, unit = match.groups()
+    return float(value) * {
+        'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1
+    }[unit]
+
+
+def iter_array(chunks):
+    """Decode items of a json array as soon as they are received
+
+    :param chunks: iterator of the array bytes
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer.startswith('null', position):
+                    return
+                if buffer[position] != '[':
+                    raise ValueError("A json array is expected")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # incomplete item, wait the next chunk
+                break
+            yield item
+        buffer = buffer[position:]
+    if buffer.strip() or started:
+        raise ValueError("Unterminated json array")
+
+
+def decode_value(row):
+    """Decode the base64 ``Value`` of a kv record in place"""
+    if isinstance(row, dict) and row.get('Value') is not None:
+        row['Value'] = base64.b64decode(row['Value'])
+        try:
+            row['Value'] = row['Value'].decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return row
+
+
+def blocking_params(index=None, wait=None):
+    """Query params of a blocking query, none if ``index`` is not set"""
+    query_params = {}
+    if index:
+        query_params['index'] = index
+        if wait:
+            query_params['wait'] = wait
+    return query_params
+
+
+def index_header(response):
+    """``X-Consul-Index`` of a response"""
+    return int(response.headers.get('X-Consul-Index', 0))
+
+
+def response_rows(response):
+    """Records of a response listing records, empty if not found"""
+    if response.status_code != 200:
+        return []
+    # consulate unwraps lists of a single element
+    if isinstance(response.body, list):
+        return response.body
+    return [response.body]
@@ -0,0 +1,250 @@
+"""Benchmark cluster commands against synthetic registries served by
+:py:mod:`cluster.fake_consul`::
+
+    python -m cluster.bench --sizes 100 1000 10000 50000 -o bench.json
+
+For each registry size and command, the wall time, the client peak memory
+(tracemalloc), the number of consul requests and the bytes received are
+reported as json to compare releases. The fake consul runs in a child
+process so its own allocations are not accounted. Commands waiting events
+are measured with each given ``--wait-strategy``.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from cluster import watch
+from cluster.cluster import Cluster
+from cluster.fake_consul import FakeConsul
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+DEFAULT_NODES = 20
+DEFAULT_CHECKS = 5000
+DEFAULT_AGENT_DELAY = 1
+BRANCHES = ['prod', 'qualif', 'dev']
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-{}'
+
+
+def populate(fake, apps, checks):
+    """Register ``apps`` apps, one out of two replicated, and ``checks``
+    health checks (5% critical) spread over the fake consul nodes
+    """
+    nodes = fake.nodes
+    for i in range(apps):
+        fake.put_app(
+            REPO_URL.format(i),
+            BRANCHES[i % len(BRANCHES)],
+            nodes[i % len(nodes)],
+            nodes[(i + 1) % len(nodes)] if i % 2 else None
+        )
+    for i in range(checks):
+        critical = i % 20 == 0
+        fake.add_check(
+            nodes[i % len(nodes)],
+            'check-{}'.format(i),
+            'critical' if critical else 'passing',
+            service_id='service-{}'.format(i),
+            service_name='repo-{}'.format(i % max(apps, 1)),
+            output='Connection refused' if critical else 'HTTP 200 OK'
+        )
+
+
+def commands(apps, nodes):
+    """:return: a list of ``(name, waits, function(cluster))``"""
+    repo = apps // 2
+    return [
+        ('get_kv_application', False, lambda cluster: (
+            cluster.get_kv_application(
+                'repo-{}'.format(repo), BRANCHES[repo % len(BRANCHES)]
+            )
+        )),
+        ('inspect_node', False, lambda cluster: (
+            cluster.inspect_node(nodes[0], slaves=True)
+        )),
+        ('checks', False, lambda cluster: cluster.checks()),
+        ('move_masters_from', False, lambda cluster: (
+            cluster.move_masters_from(
+                nodes[0], master=nodes[1], no_wait=True, ask_user=False
+            )
+        )),
+        # waits for the fake agent to consume the event
+        ('deploy', True, lambda cluster: (
+            cluster.deploy('repo-0', BRANCHES[0], ask_user=False, timeout=60)
+        )),
+    ]
+
+
+def _serve(connection, apps, checks, nodes, latency):
+    fake = FakeConsul(nodes=nodes, latency=latency, agent_delay=None)
+    populate(fake, apps, checks)
+    fake.start()
+    connection.send(fake.url)
+    while True:
+        command, args = connection.recv()
+        if command == 'stop':
+            break
+        if command == 'stats':
+            connection.send((dict(fake.requests), fake.bytes_sent))
+            fake.reset_stats()
+        elif command == 'set':
+            setattr(fake, *args)
+            connection.send(None)
+    fake.stop()
+    connection.send(None)
+
+
+def _call(connection, command, *args):
+    connection.send((command, args))
+    return connection.recv()
+
+
+def measure(connection, url, run, wait_strategy=watch.DEFAULT_STRATEGY):
+    """Run a command twice on fresh clusters: timed then traced, as
+    tracemalloc slows down the code it traces
+    """
+    _call(connection, 'stats')
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            run(Cluster(url, wait_strategy=wait_strategy))
+            wall_time = time.perf_counter() - start
+            endpoints, received = _call(connection, 'stats')
+            tracemalloc.start()
+            try:
+                run(Cluster(url, wait_strategy=wait_strategy))
+                _, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    _call(connection, 'stats')
+    return {
+        'wall_time': round(wall_time, 6),
+        'peak_memory': peak_memory,
+        'requests': sum(endpoints.values()),
+        'bytes': received,
+        'endpoints': endpoints,
+    }
+
+
+def bench(sizes, nodes=DEFAULT_NODES, checks=DEFAULT_CHECKS, latency=0,
+          only=None, agent_delay=DEFAULT_AGENT_DELAY, wait_strategies=None):
+    """:return: a list of results, one per registry size and command (and
+        wait strategy for commands waiting events)
+    """
+    wait_strategies = wait_strategies or [watch.DEFAULT_STRATEGY]
+    # warm up imports so they are not accounted to the first command
+    from cluster import consul_api  # noqa
+    nodes = ['node-{:02d}'.format(i) for i in range(nodes)]
+    results = []
+    for size in sizes:
+        connection, child_connection = multiprocessing.Pipe()
+        server = multiprocessing.Process(
+            target=_serve,
+            args=(child_connection, size, checks, nodes, latency),
+            daemon=True
+        )
+        server.start()
+        try:
+            url = connection.recv()
+            for name, waits, run in commands(size, nodes):
+                if only and name not in only:
+                    continue
+                _call(
+                    connection, 'set', 'agent_delay',
+                    agent_delay if waits else None
+                )
+                for strategy in wait_strategies if waits else [None]:
+                    result = {
+                        'size': size, 'command': name,
+                        'wait_strategy': strategy,
+                    }
+                    result.update(measure(
+                        connection, url, run,
+                        wait_strategy=strategy or watch.DEFAULT_STRATEGY
+                    ))
+                    results.append(result)
+        finally:
+            _call(connection, 'stop')
+            server.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m cluster.bench',
+        description="Benchmark cluster commands against synthetic "
+                    "registries served by a local fake consul"
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, metavar='N',
+        help="Number of apps (``app/`` kv keys) of the registries"
+    )
+    parser.add_argument(
+        '--nodes', type=int, default=DEFAULT_NODES,
+        help="Number of cluster nodes"
+    )
+    parser.add_argument(
+        '--checks', type=int, default=DEFAULT_CHECKS,
+        help="Number of health checks"
+    )
+    parser.add_argument(
+        '--latency', type=float, default=0, metavar='SECONDS',
+        help="Time added to each consul request"
+    )
+    parser.add_argument(
+        '--agent-delay', type=float, default=DEFAULT_AGENT_DELAY,
+        metavar='SECONDS',
+        help="Time the fake cluster takes to consume events"
+    )
+    parser.add_argument(
+        '--wait-strategy', dest='wait_strategies', action='append',
+        choices=watch.STRATEGIES,
+        help="Wait strategy used by commands waiting events (can be "
+             "repeated to compare them, default to {})".format(
+                 watch.DEFAULT_STRATEGY
+             )
+    )
+    parser.add_argument(
+        '--command', dest='commands', action='append', metavar='NAME',
+        choices=[name for name, _, _ in commands(0, [])],
+        help="Only benchmark the given command (can be repeated)"
+    )
+    parser.add_argument(
+        '-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help="File where to write json results (default to stdout)"
+    )
+    args = parser.parse_args(argv)
+    if args.nodes < 2:
+        parser.error("At least 2 nodes are required")
+    results = bench(
+        args.sizes,
+        nodes=args.nodes,
+        checks=args.checks,
+        latency=args.latency,
+        only=args.commands,
+        agent_delay=args.agent_delay,
+        wait_strategies=args.wait_strategies
+    )
+    json.dump(
+        {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'nodes': args.nodes,
+            'checks': args.checks,
+            'latency': args.latency,
+            'agent_delay': args.agent_delay,
+            'results': results,
+        },
+        args.output,
+        indent=2
+    )
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,99 @@
 import argparse
 import json
 import logging
+import os
+import signal
+import sys
 
+from cluster import api
 from cluster import cluster
+from cluster import completion
+from cluster import daemon
+from cluster import registry
+from cluster import shell
+from cluster import stats
+from cluster import util
+from cluster import watch
+
+OUTPUT_FORMATS = ['text', 'json', 'ndjson']
+
+
+def positive_int(value):
+    """argparse type of counts of services"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            "{} is not a positive integer".format(value)
+        )
+    return number
+
+
+def print_checks(checks):
+    for node, services in checks.items():
+        print("Node {}:".format(node))
+        for _, service in services.items():
+            print(" - Service {}:".format(service['name']))
+            for name, status, _ in service['checks']:
+                print("    - Check ({}): {}".format(status, name))
+
+
+def print_per_datacenter(results, errors, print_result):
+    """Display results of each datacenter then failing datacenters"""
+    for datacenter in sorted(results):
+        print("Datacenter {}:".format(datacenter))
+        print_result(results[datacenter])
+    for datacenter in sorted(errors):
+        print("Datacenter {}: unreachable ({})".format(
+            datacenter, errors[datacenter]
+        ))
+    raise_unreachable(results, errors)
+
+
+def write_records(records, output_format):
+    """Print records as soon as they are produced, as a json list
+    (``json``) or one json document per line (``ndjson``)
+    """
+    if output_format == 'ndjson':
+        for record in records:
+            print(json.dumps(record), flush=True)
+        return
+    print('[', end='')
+    separator = '\n'
+    for record in records:
+        print(separator + json.dumps(record), end='', flush=True)
+        separator = ',\n'
+    print('\n]' if separator != '\n' else ']')
+
+
+def write_per_datacenter(results, errors, output_format):
+    """Print records of each datacenter with a ``datacenter`` key, failing
+    datacenters are reported on stderr
+    """
+    write_records(
+        (
+            dict(record, datacenter=datacenter)
+            for datacenter in sorted(results)
+            for record in results[datacenter]
+        ),
+        output_format
+    )
+    for datacenter in sorted(errors):
+        print(
+            "Datacenter {}: unreachable ({})".format(
+                datacenter, errors[datacenter]
+            ),
+            file=sys.stderr
+        )
+    raise_unreachable(results, errors)
+
+
+def raise_unreachable(results, errors):
+    if errors:
+        raise RuntimeError(
+            "{} on {} datacenter(s) did not answer".format(
+                len(errors), len(results) + len(errors)
+            )
+        )
 
 
 def main():
@@ -19,6 +110,96 @@ def main():
         '-y', '--assume-yes', action='store_true',
         help="Always answers ``yes`` to any questions."
     )
+    parser.add_argument(
+        '--cache-dir',
+        default=registry.default_cache_dir(),
+        help="Directory where to cache the app registry"
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Do not use the app registry cache"
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help="Unix socket of the ``serve`` daemon, by default a socket per "
+             "consul url and datacenter in $XDG_RUNTIME_DIR or the cache "
+             "directory"
+    )
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        help="Query consul directly even if the ``serve`` daemon is running"
+    )
+    http_group = parser.add_argument_group(
+        'Consul http connection params'
+    )
+    http_group.add_argument(
+        '--pool-size',
+        type=int,
+        default=api.DEFAULT_POOL_SIZE,
+        help="Max number of connections kept alive to consul"
+    )
+    http_group.add_argument(
+        '--connect-timeout',
+        type=float,
+        default=api.DEFAULT_CONNECT_TIMEOUT,
+        metavar='SECONDS',
+        help="Consul connection timeout"
+    )
+    http_group.add_argument(
+        '--read-timeout',
+        type=float,
+        default=api.DEFAULT_READ_TIMEOUT,
+        metavar='SECONDS',
+        help="Consul read timeout (blocking queries wait time is added)"
+    )
+    http_group.add_argument(
+        '--datacenter',
+        metavar='DC[,DC...]',
+        help="Datacenter to query, the consul agent one by default. "
+             "``checks`` and ``inspect`` accept a comma separated list of "
+             "datacenters or ``all`` to query many datacenters at once"
+    )
+    http_group.add_argument(
+        '--datacenter-timeout',
+        type=float,
+        default=cluster.DEFAULT_DATACENTER_TIMEOUT,
+        metavar='SECONDS',
+        help="Max time to wait each datacenter when querying many "
+             "datacenters, late datacenters are reported as unreachable"
+    )
+    http_group.add_argument(
+        '--consistency',
+        choices=api.CONSISTENCY_MODES,
+        default=api.DEFAULT_CONSISTENCY,
+        help="Consistency mode of reads: ``stale`` lets any consul server "
+             "answer (lower load on the leader, data may be slightly late), "
+             "``consistent`` checks the leader is still the leader. Reads "
+             "waiting events are consumed always use the default mode"
+    )
+    http_group.add_argument(
+        '--wait-strategy',
+        choices=watch.STRATEGIES,
+        default=watch.DEFAULT_STRATEGY,
+        help="How to wait events are consumed: consul blocking queries, "
+             "polling every second or polling at intervals growing from "
+             "{}s to {}s".format(watch.BACKOFF_INITIAL, watch.BACKOFF_CEILING)
+    )
+    stats_group = parser.add_argument_group(
+        'Statistics params'
+    )
+    stats_group.add_argument(
+        '--stats',
+        action='store_true',
+        help="Print time spent per command phase and consul requests "
+             "(count, bytes received and latency per endpoint) at exit"
+    )
+    stats_group.add_argument(
+        '--stats-json',
+        type=argparse.FileType('w'),
+        metavar='FILE',
+        help="Write statistics as json in the given file (``-`` for stdout)"
+    )
     logging_group = parser.add_argument_group(
         'Logging params'
     )
@@ -46,20 +227,62 @@ def main():
         '-a', '--all', action='store_true',
         help='Display all checks (any states)'
     )
+    parser_checks.add_argument(
+        '--node',
+        metavar='NODE',
+        help='Only display checks of the given node'
+    )
+    parser_checks.add_argument(
+        '--service',
+        metavar='NAME',
+        help='Only display checks of the given service name'
+    )
+    parser_checks.add_argument(
+        '-o', '--output',
+        choices=OUTPUT_FORMATS,
+        default='text',
+        help='Output format, ``json`` and ``ndjson`` (one json document '
+             'per line) print one record per check as soon as it is received'
+    )
 
     parser_deploy = subparsers.add_parser(
         'deploy', help='Deploy or re-deploy a service'
     )
     parser_deploy.add_argument(
         'repo',
+        nargs='?',
         help='The repo name or whole form ('
              'ssh://git@git.example.com:22/project-slug/repo-name) '
              'for new service'
     )
     parser_deploy.add_argument(
         'branch',
+        nargs='?',
         help='The branch to deploy'
     )
+    parser_deploy.add_argument(
+        '--from-file',
+        metavar='PLAN',
+        help='Deploy all services listed in the given json or yaml file '
+             'instead of a single repo / branch. The file contains a list '
+             'of mappings with repo, branch and optional master, slave and '
+             'update keys.'
+    )
+    parser_deploy.add_argument(
+        '-p', '--parallel',
+        type=positive_int,
+        default=cluster.DEFAULT_PARALLEL,
+        metavar='N',
+        help='Number of services deployed at the same time (used with '
+             '``--from-file``, default: %(default)s)'
+    )
+    parser_deploy.add_argument(
+        '--max-per-node',
+        type=positive_int,
+        metavar='N',
+        help='Max number of services deployed at the same time on a same '
+             'master node (used with ``--from-file``)'
+    )
     parser_deploy.add_argument(
         '--master',
         metavar='NODE',
@@ -70,6 +293,18 @@ def main():
         metavar='NODE',
         help='Slave node'
     )
+    parser_deploy.add_argument(
+        '--auto-place',
+        action='store_true',
+        help='Choose master and slave of a new service: the healthy node '
+             'hosting the fewest masters and another healthy node hosting '
+             'the fewest slaves'
+    )
+    parser_deploy.add_argument(
+        '--explain',
+        action='store_true',
+        help='Display node scores used by ``--auto-place``'
+    )
     parser_deploy.add_argument(
         '-u', '--update',
         action='store_true',
@@ -170,30 +405,275 @@ def main():
              'raising an exception (ignored with ``--no-wait`` option)'
     )
 
+    parser_move_masters_from.add_argument(
+        '-p', '--parallel',
+        type=positive_int,
+        default=1,
+        metavar='N',
+        help='Number of services to move at the same time. When greater '
+             'than 1, a failing service does not stop the others and '
+             'the outcome of each service is reported at the end'
+    )
+    parser_move_masters_from.add_argument(
+        '--max-per-node',
+        type=positive_int,
+        metavar='N',
+        help='Max number of services deployed at the same time on a same '
+             'target node (used with ``--parallel`` or ``--wave-size``)'
+    )
+    parser_move_masters_from.add_argument(
+        '--wave-size',
+        type=positive_int,
+        metavar='N',
+        help='Rolling drain: move services by waves of at most N services '
+             'at the same time. After each wave, wait until checks of moved '
+             'services pass, stop if they still do not after '
+             '``--health-timeout``. Waves are halved when other checks of '
+             'target nodes start failing'
+    )
+    parser_move_masters_from.add_argument(
+        '--health-timeout',
+        type=int,
+        default=cluster.DEFAULT_HEALTH_TIMEOUT,
+        metavar='SECONDS',
+        help='Max time to wait services of a wave are healthy (used with '
+             '``--wave-size``)'
+    )
+
+    parser_rebalance = subparsers.add_parser(
+        'rebalance',
+        help='Move masters of services so nodes host the same number of '
+             'masters (or the same total weight).'
+    )
+    parser_rebalance.add_argument(
+        '--weight',
+        metavar='FIELD',
+        help='Registry field holding services weight (services without '
+             'numeric weight weight 1). Number of masters per node is '
+             'evened out if not set.'
+    )
+    parser_rebalance.add_argument(
+        '-n', '--dry-run',
+        action='store_true',
+        help='Only display the plan'
+    )
+    parser_rebalance.add_argument(
+        '-d', '--no-wait',
+        action='store_true',
+        help='Run the script in detached mode : do not wait the end of '
+             'deployment to stop the script.'
+    )
+    parser_rebalance.add_argument(
+        '-t', '--timeout',
+        type=int,
+        default=cluster.DEFAULT_TIMEOUT,
+        help='Time in second to let a chance to deploy the service before '
+             'raising an exception (ignored with ``--no-wait`` option)'
+    )
+    parser_rebalance.add_argument(
+        '-p', '--parallel',
+        type=positive_int,
+        default=cluster.DEFAULT_PARALLEL,
+        metavar='N',
+        help='Number of services to move at the same time'
+    )
+    parser_rebalance.add_argument(
+        '--max-per-node',
+        type=positive_int,
+        metavar='N',
+        help='Max number of services deployed at the same time on a same '
+             'target node'
+    )
+
     parser_inspect = subparsers.add_parser(
         'inspect',
-        help='Display all master services of given node.'
+        help='Display all master services of given nodes.'
     )
     parser_inspect.add_argument(
         'node',
-        help='Node where services should be inspected.'
+        nargs='*',
+        help='Nodes where services should be inspected.'
+    )
+    parser_inspect.add_argument(
+        '-a', '--all',
+        action='store_true',
+        help='Inspect all nodes of the cluster.'
+    )
+    parser_inspect.add_argument(
+        '-s', '--slaves',
+        action='store_true',
+        help='Display slave (replicate) services as well.'
+    )
+    parser_inspect.add_argument(
+        '--max-stale',
+        type=int,
+        metavar='SECONDS',
+        help='Use the cached app registry without checking it is up to '
+             'date if it is younger than the given number of seconds.'
+    )
+    parser_inspect.add_argument(
+        '-o', '--output',
+        choices=OUTPUT_FORMATS,
+        default='text',
+        help='Output format, ``json`` and ``ndjson`` (one json document '
+             'per line) print one record per app and node as soon as it is '
+             'decoded (use ``--no-cache`` to stream apps from consul)'
+    )
+
+    parser_serve = subparsers.add_parser(
+        'serve',
+        help='Run a daemon holding nodes, the app registry and health checks '
+             'in memory, kept up to date with consul blocking queries. Other '
+             'commands of the same consul and datacenter use it while it is '
+             'running.'
+    )
+
+    parser_shell = subparsers.add_parser(
+        'shell',
+        help='Run commands interactively against a single cluster client: '
+             'connections, nodes and the app registry are reused from a '
+             'command to the next one, nodes, repos and branches are '
+             'completed with tab.'
+    )
+    parser_shell.add_argument(
+        '--ttl',
+        type=int,
+        default=cluster.DEFAULT_MEMORY_TTL,
+        metavar='SECONDS',
+        help='Time nodes and the app registry are kept in memory, '
+             '``refresh`` drops them at once'
     )
 
-    def init(args):
+    parser_completion = subparsers.add_parser(
+        'completion',
+        help='Print the bash or zsh completion script of nodes, repos and '
+             'branches (ie: ``source <(cluster completion bash)``), or '
+             'refresh the local index it reads.'
+    )
+    parser_completion.add_argument(
+        'action',
+        choices=['bash', 'zsh', 'refresh'],
+        help='Shell of the script to print, ``refresh`` updates the index '
+             'from consul (the script runs it in background)'
+    )
+
+    def datacenters(args):
+        return [
+            name.strip() for name in (args.datacenter or '').split(',')
+            if name.strip()
+        ]
+
+    def many_datacenters(args):
+        names = datacenters(args)
+        return names == ['all'] or len(names) > 1
+
+    def single_datacenter(args, command_parser):
+        if many_datacenters(args):
+            command_parser.error("a single datacenter is required")
+
+    def socket_path(args):
+        return args.socket or daemon.default_socket_path(
+            args.consul, args.datacenter
+        )
+
+    # cluster of the running ``shell`` command, shared by its commands
+    shell_cluster = None
+
+    def init(args, use_daemon=True, **params):
+        if shell_cluster is not None:
+            return shell_cluster
+        daemon_client = None
+        if use_daemon and not args.no_daemon and not many_datacenters(args):
+            path = socket_path(args)
+            if os.path.exists(path):
+                daemon_client = daemon.Client(path)
         return cluster.Cluster(
-            args.consul
+            args.consul,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            pool_size=args.pool_size,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            stats=command_stats,
+            wait_strategy=args.wait_strategy,
+            consistency=args.consistency,
+            datacenter=None if many_datacenters(args) else next(
+                iter(datacenters(args)), None
+            ),
+            daemon=daemon_client,
+            **params
+        )
+
+    def per_datacenter(args, cluster, function):
+        names = datacenters(args)
+        return cluster.per_datacenter(
+            cluster.datacenters if names == ['all'] else names,
+            function,
+            timeout=args.datacenter_timeout
         )
 
     def cluster_checks(args):
         cluster = init(args)
-        for node, services in cluster.checks(all=args.all).items():
-            print("Node {}:".format(node))
-            for _, service in services.items():
-                print(" - Service {}:".format(service['name']))
-                for name, status, _ in service['checks']:
-                    print("    - Check ({}): {}".format(status, name))
+        if args.output != 'text':
+            if many_datacenters(args):
+                write_per_datacenter(
+                    *per_datacenter(args, cluster, lambda dc_cluster: list(
+                        dc_cluster.iter_checks(
+                            all=args.all, node=args.node, service=args.service
+                        )
+                    )),
+                    output_format=args.output
+                )
+                return
+            write_records(
+                cluster.iter_checks(
+                    all=args.all, node=args.node, service=args.service
+                ),
+                args.output
+            )
+            return
+        if many_datacenters(args):
+            print_per_datacenter(
+                *per_datacenter(args, cluster, lambda dc_cluster: (
+                    dc_cluster.checks(
+                        all=args.all, node=args.node, service=args.service
+                    )
+                )),
+                print_result=print_checks
+            )
+            return
+        print_checks(cluster.checks(
+            all=args.all, node=args.node, service=args.service
+        ))
 
     def cluster_deploy(args):
+        single_datacenter(args, parser_deploy)
+        if args.from_file:
+            if (
+                    args.repo or args.master or args.slave or args.update or
+                    args.auto_place or args.explain
+            ):
+                parser_deploy.error(
+                    "--from-file can't be used with repo, branch, --master, "
+                    "--slave, --update, --auto-place or --explain"
+                )
+            cluster = init(args)
+            cluster.deploy_plan(
+                util.load_plan(args.from_file),
+                no_wait=args.no_wait,
+                timeout=args.timeout,
+                ask_user=not args.assume_yes,
+                parallel=args.parallel,
+                max_per_node=args.max_per_node
+            )
+            return
+        if not args.branch:
+            parser_deploy.error("repo and branch are required")
+        if args.auto_place and (args.master or args.slave):
+            parser_deploy.error(
+                "--auto-place can't be used with --master or --slave"
+            )
+        if args.explain and not args.auto_place:
+            parser_deploy.error("--explain requires --auto-place")
         cluster = init(args)
         cluster.deploy(
             args.repo,
@@ -203,10 +683,13 @@ def main():
             no_wait=args.no_wait,
             timeout=args.timeout,
             ask_user=not args.assume_yes,
-            update=args.update
+            update=args.update,
+            auto_place=args.auto_place,
+            explain=args.explain
         )
 
     def cluster_migrate(cmd_args):
+        single_datacenter(cmd_args, parser_migrate)
         cluster = init(cmd_args)
         cluster.migrate(
             cmd_args.source_repo,
@@ -220,24 +703,139 @@ def main():
         )
 
     def cluster_move_masters_from(args):
+        single_datacenter(args, parser_move_masters_from)
+        if args.wave_size and (args.no_wait or args.parallel > 1):
+            parser_move_masters_from.error(
+                "--wave-size can't be used with --no-wait or --parallel"
+            )
         cluster = init(args)
         cluster.move_masters_from(
             args.node,
             master=args.master,
             no_wait=args.no_wait,
             timeout=args.timeout,
-            ask_user=not args.assume_yes
+            ask_user=not args.assume_yes,
+            parallel=args.parallel,
+            max_per_node=args.max_per_node,
+            wave_size=args.wave_size,
+            health_timeout=args.health_timeout
+        )
+
+    def cluster_rebalance(args):
+        single_datacenter(args, parser_rebalance)
+        cluster = init(args)
+        cluster.rebalance(
+            weight=args.weight,
+            no_wait=args.no_wait,
+            timeout=args.timeout,
+            ask_user=not args.assume_yes,
+            parallel=args.parallel,
+            max_per_node=args.max_per_node,
+            dry_run=args.dry_run
         )
 
     def cluster_inspect(args):
+        if not args.node and not args.all:
+            parser_inspect.error("a node or --all option is required")
+        cluster = init(args)
+        if args.output != 'text':
+            if many_datacenters(args):
+                write_per_datacenter(
+                    *per_datacenter(args, cluster, lambda dc_cluster: list(
+                        dc_cluster.iter_node_apps(
+                            *(dc_cluster.nodes if args.all else args.node),
+                            max_stale=args.max_stale,
+                            slaves=args.slaves
+                        )
+                    )),
+                    output_format=args.output
+                )
+                return
+            write_records(
+                cluster.iter_node_apps(
+                    *(cluster.nodes if args.all else args.node),
+                    max_stale=args.max_stale,
+                    slaves=args.slaves
+                ),
+                args.output
+            )
+            return
+        if many_datacenters(args):
+            print_per_datacenter(
+                *per_datacenter(args, cluster, lambda dc_cluster: (
+                    dc_cluster.nodes if args.all else args.node,
+                    dc_cluster.get_node_index(max_stale=args.max_stale)
+                )),
+                print_result=lambda result: cluster.print_node_apps(
+                    result[1], result[0], slaves=args.slaves
+                )
+            )
+            return
+        cluster.inspect_node(
+            *(cluster.nodes if args.all else args.node),
+            max_stale=args.max_stale,
+            slaves=args.slaves
+        )
+
+    def cluster_serve(args):
+        single_datacenter(args, parser_serve)
+        server = daemon.Daemon(
+            init(args, use_daemon=False), socket_path(args)
+        )
+        server.start()
+        # let the socket be removed on ``kill``
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        print("Serving {} on {}".format(args.consul, server.path), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+
+    def cluster_shell(args):
+        nonlocal shell_cluster
+        single_datacenter(args, parser_shell)
+        shell_cluster = init(args, memory_ttl=args.ttl)
+
+        def run(argv):
+            # global options are the shell ones
+            command_args = parser.parse_args(
+                argv, namespace=argparse.Namespace(**vars(args))
+            )
+            command_args.func(command_args)
+
+        shell.Shell(shell_cluster, run, {
+            name: command_parser
+            for name, command_parser in subparsers.choices.items()
+            if name not in ('serve', 'shell', 'completion')
+        }).cmdloop()
+
+    def cluster_completion(args):
+        if args.action != 'refresh':
+            print(completion.script(
+                parser, subparsers.choices, shell=args.action
+            ))
+            return
+        single_datacenter(args, parser_completion)
         cluster = init(args)
-        cluster.inspect_node(args.node)
+        completion.write_index(
+            completion.index_path(
+                args.cache_dir, args.consul, args.datacenter
+            ),
+            cluster.nodes,
+            cluster.get_kv_registry()
+        )
 
     parser_checks.set_defaults(func=cluster_checks)
     parser_deploy.set_defaults(func=cluster_deploy)
     parser_migrate.set_defaults(func=cluster_migrate)
     parser_move_masters_from.set_defaults(func=cluster_move_masters_from)
+    parser_rebalance.set_defaults(func=cluster_rebalance)
     parser_inspect.set_defaults(func=cluster_inspect)
+    parser_serve.set_defaults(func=cluster_serve)
+    parser_shell.set_defaults(func=cluster_shell)
+    parser_completion.set_defaults(func=cluster_completion)
 
     arguments = parser.parse_args()
 
@@ -252,7 +850,19 @@ def main():
         except json.JSONDecodeError:
             logging.config.fileConfig(arguments.logging_file.name)
 
+    command_stats = None
+    if arguments.stats or arguments.stats_json:
+        command_stats = stats.Stats()
+
     if hasattr(arguments, 'func'):
-        arguments.func(arguments)
+        try:
+            arguments.func(arguments)
+        finally:
+            if command_stats and arguments.stats:
+                print(command_stats.format(), file=sys.stderr)
+            if command_stats and arguments.stats_json:
+                json.dump(command_stats.report(), arguments.stats_json)
+                arguments.stats_json.write('\n')
+                arguments.stats_json.flush()
     else:
         parser.print_help()
@@ -1,54 +1,308 @@
-import consulate
+import collections
+import contextlib
+import functools
 import hashlib
 import json
 import logging
 import os
+import threading
 import time
 
+from concurrent import futures
 from datetime import datetime
 from urllib import parse
 
+from cluster import daemon
+from cluster import placement
+from cluster import registry
 from cluster import util
+from cluster import watch
+from cluster.api import (
+    DEFAULT_CONSISTENCY,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+)
 
 DEFAULT_TIMEOUT = 300
+DEFAULT_DATACENTER_TIMEOUT = 10
+# consul requests of late datacenters end that long after they are given up
+DATACENTER_TIMEOUT_MARGIN = 1
+DEFAULT_PARALLEL = 4
+DEFAULT_HEALTH_TIMEOUT = 300
+DEFAULT_HEALTH_INTERVAL = 2
+DEFAULT_MEMORY_TTL = 60
 APP_KEY_SEPARATOR = '.'  # app key prefix/md5 separator
 APP_KV_FIND_PATTERN = 'app/{repo}_{branch}{separator}'
 logger = logging.getLogger(__name__)
 
+Deployment = collections.namedtuple(
+    'Deployment', ['kv_key', 'repo_url', 'branch', 'master', 'slave', 'update']
+)
+Deployment.__new__.__defaults__ = (False, )
+
+
+def app_key(repo_url, branch):
+    """Registry key of a new service"""
+    md5 = hashlib.md5(
+        parse.urlparse(repo_url.lower()).path.encode('utf-8')
+    ).hexdigest()
+    repo_name = os.path.basename(repo_url.strip('/').lower())
+    return 'app/' + repo_name + (
+        '_' + branch if branch else ''
+    ) + '.' + md5[:5]  # don't need full md5
+
+
+def service_id(kv_key):
+    """Consul service id of an app: its registry key without the ``app/``
+    prefix
+    """
+    return kv_key[len('app/'):]
+
 
 class Cluster:
 
     _consul_url = None
     _consul = None
+    _event_consul = None
     _nodes = None
+    _nodes_time = None
+    _registry = None
+    _registry_cache = None
+    stats = None
+    datacenter = None
+    daemon = None
 
-    def __init__(self, consul_url='http://localhost:8500'):
+    def __init__(
+            self,
+            consul_url='http://localhost:8500',
+            cache_dir=None,
+            pool_size=DEFAULT_POOL_SIZE,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            stats=None,
+            wait_strategy=watch.DEFAULT_STRATEGY,
+            datacenter=None,
+            consistency=DEFAULT_CONSISTENCY,
+            daemon=None,
+            memory_ttl=None
+    ):
+        """
+        :param consul_url: consul http api url
+        :param cache_dir: directory where to cache the app registry, cache
+            is disabled if not set
+        :param pool_size: max number of http connections kept alive
+        :param connect_timeout: http connection timeout in second
+        :param read_timeout: http read timeout in second
+        :param stats: :py:class:`cluster.stats.Stats` collecting phases
+            timings and consul requests
+        :param wait_strategy: how to wait events are consumed, consul
+            blocking queries or polling (see :py:data:`watch.STRATEGIES`)
+        :param datacenter: datacenter to query, the consul agent one if not
+            set
+        :param consistency: consistency mode of reads, ``stale`` lets any
+            consul server answer (see
+            :py:data:`cluster.api.CONSISTENCY_MODES`). Reads waiting events
+            are consumed always use the default mode.
+        :param daemon: :py:class:`cluster.daemon.Client` answering nodes,
+            registry and checks lookups, consul is queried directly if not
+            set or if the daemon does not answer
+        :param memory_ttl: time in second nodes and the app registry are
+            kept in memory (see :py:meth:`refresh`), nodes are kept for the
+            cluster lifetime and the registry is not kept if not set
+        """
         self._consul_url = parse.urlparse(consul_url)
+        self._cache_dir = cache_dir
+        self.stats = stats
+        self.wait_strategy = wait_strategy
+        self.datacenter = datacenter
+        self.daemon = daemon
+        self.memory_ttl = memory_ttl
+        # kv keys of apps per (repo name, branch) already resolved
+        self._application_keys = {}
+        self._http_params = {
+            'pool_size': pool_size,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'consistency': consistency,
+        }
+        if cache_dir:
+            self._registry_cache = registry.RegistryCache(
+                cache_dir,
+                consul_url if not datacenter else '{}?dc={}'.format(
+                    consul_url, datacenter
+                )
+            )
 
     @property
     def consul(self):
         if not self._consul:
-            self._consul = consulate.Consul(
-                scheme=self._consul_url.scheme,
-                host=self._consul_url.hostname,
-                port=self._consul_url.port,
-                datacenter=None,
-                token=None,
-            )
+            self._consul = self._client(self._http_params)
         return self._consul
 
+    @property
+    def event_consul(self):
+        """Consul client firing and waiting events, its reads use the
+        default consistency mode whatever ``consistency`` so a stale server
+        does not delay nor hide events outcome
+        """
+        if self._http_params['consistency'] == DEFAULT_CONSISTENCY:
+            return self.consul
+        if not self._event_consul:
+            self._event_consul = self._client(
+                dict(self._http_params, consistency=DEFAULT_CONSISTENCY)
+            )
+        return self._event_consul
+
+    def _client(self, http_params):
+        # consulate (and requests) are slow to import, they are only
+        # imported once a command needs to talk with consul
+        from cluster import consul_api
+        return consul_api.Consul(
+            scheme=self._consul_url.scheme,
+            host=self._consul_url.hostname,
+            port=self._consul_url.port,
+            datacenter=self.datacenter,
+            token=None,
+            adapter=functools.partial(
+                consul_api.Request, stats=self.stats, **http_params
+            ),
+        )
+
+    def _daemon_call(self, method, **params):
+        """:return: the daemon answer, None if there is no daemon or it
+            does not answer
+        """
+        if self.daemon is None:
+            return None
+        try:
+            return self.daemon.call(method, **params)
+        except daemon.DaemonError as err:
+            logger.warning("Querying consul directly: %s", err)
+            return None
+
+    def _phase(self, name):
+        """Time a command phase if stats are collected"""
+        if self.stats is None:
+            return contextlib.ExitStack()
+        return self.stats.phase(name)
+
+    @property
+    def datacenters(self):
+        """Datacenters known by the consul agent"""
+        datacenters = self.consul.catalog.datacenters()
+        # consulate unwraps lists of a single element
+        if isinstance(datacenters, str):
+            return [datacenters]
+        return datacenters
+
+    def in_datacenter(self, datacenter, timeout=None):
+        """A cluster with the same settings querying the given datacenter
+
+        :param timeout: max time in second of consul requests
+        """
+        http_params = dict(self._http_params)
+        if timeout is not None:
+            for param in ('connect_timeout', 'read_timeout'):
+                http_params[param] = min(http_params[param], timeout)
+        return Cluster(
+            self._consul_url.geturl(),
+            cache_dir=self._cache_dir,
+            stats=self.stats,
+            wait_strategy=self.wait_strategy,
+            datacenter=datacenter,
+            memory_ttl=self.memory_ttl,
+            **http_params
+        )
+
+    def per_datacenter(
+            self, datacenters, function, timeout=DEFAULT_DATACENTER_TIMEOUT
+    ):
+        """Call ``function`` with a cluster of each datacenter at the same
+        time. A slow datacenter does not delay others more than ``timeout``.
+
+        :param function: callable taking a :py:class:`Cluster` argument
+        :param timeout: max time in second to wait each datacenter
+        :return: a tuple of dicts per datacenter ``(results, errors)``
+        """
+        results = {}
+        errors = {}
+        outcomes = {}
+        finished = threading.Condition()
+
+        def run(datacenter, dc_cluster):
+            try:
+                outcome = function(dc_cluster), None
+            except Exception as error:
+                outcome = None, error
+            with finished:
+                outcomes[datacenter] = outcome
+                finished.notify()
+
+        # requests timeouts are longer than the time datacenters are waited
+        # so late datacenters are always reported as timed out
+        for datacenter in datacenters:
+            # late datacenters are not waited, daemon threads do not hold
+            # the command exit either
+            threading.Thread(
+                target=run,
+                args=(datacenter, self.in_datacenter(
+                    datacenter, timeout=timeout + DATACENTER_TIMEOUT_MARGIN
+                )),
+                name='datacenter {}'.format(datacenter),
+                daemon=True
+            ).start()
+        with finished:
+            finished.wait_for(
+                lambda: len(outcomes) == len(datacenters), timeout=timeout
+            )
+            answered = dict(outcomes)
+        for datacenter in datacenters:
+            if datacenter not in answered:
+                logger.error("Datacenter %s timed out", datacenter)
+                errors[datacenter] = TimeoutError(
+                    "no answer in {}s".format(timeout)
+                )
+                continue
+            result, error = answered[datacenter]
+            if error:
+                logger.error("Datacenter %s fails: %s", datacenter, error)
+                errors[datacenter] = error
+            else:
+                results[datacenter] = result
+        return results, errors
+
+    def _expired(self, since):
+        return self.memory_ttl is not None and (
+            time.monotonic() - since > self.memory_ttl
+        )
+
+    def refresh(self):
+        """Drop nodes, the app registry and app keys kept in memory, they
+        are fetched again when needed
+        """
+        self._nodes = None
+        self._registry = None
+        self._application_keys = {}
+
     @property
     def nodes(self):
-        if not self._nodes:
-            self._nodes = [
-                node['Node'] for node in self.consul.catalog.nodes()
-            ]
+        if self._nodes is None or self._expired(self._nodes_time):
+            nodes = self._daemon_call('nodes')
+            if nodes is None:
+                nodes = [
+                    node['Node'] for node in self.consul.catalog.nodes()
+                ]
+            self._nodes = nodes
+            self._nodes_time = time.monotonic()
         return self._nodes
 
-    def checks(self, all=False):
+    def checks(self, all=False, node=None, service=None):
         """Display failed checks per nodes
 
         :param all: if you want to see more
+        :param node: only get checks of the given node
+        :param service: only get checks of the given service name
         :return: a dict of checks per node::
 
             {
@@ -65,44 +319,198 @@ class Cluster:
                 'node2': ...
             }
         """
-        if all:
-            warn_states = ["unknown", "passing", "warning", "critical"]
-        else:
-            warn_states = ["unknown", "warning", "critical"]
+        # checks in any states are fetched at once and filtered here rather
+        # than sending a request per state
+        states = self._daemon_checks(node, service)
+        if states is None:
+            states = self._consul_checks(node, service)
         checks = {}
-        for warn_state in warn_states:
-            for state in self.consul.health.state(warn_state):
-                if not state['Node'] in checks:
-                    checks[state['Node']] = dict()
-                if not state['ServiceID'] in checks[state['Node']]:
-                    checks[state['Node']][state['ServiceID']] = {
-                        'checks': [],
-                        'name': state['ServiceName']
-                    }
-                checks[state['Node']][state['ServiceID']]['checks'].append(
-                    (state['Name'], state['Status'], state['Output'])
-                )
+        for check in self._check_records(states, all=all, service=service):
+            if not check['node'] in checks:
+                checks[check['node']] = dict()
+            if not check['service_id'] in checks[check['node']]:
+                checks[check['node']][check['service_id']] = {
+                    'checks': [],
+                    'name': check['service_name']
+                }
+            checks[check['node']][check['service_id']]['checks'].append(
+                (check['check'], check['status'], check['output'])
+            )
         return checks
 
+    def iter_checks(self, all=False, node=None, service=None):
+        """Same as :py:meth:`checks` but checks are yielded as soon as they
+        are received from consul, one record per check::
+
+            {
+                'node': 'node1',
+                'service_id': 'service-id1',
+                'service_name': 'Service 1',
+                'check': check name,
+                'status': status,
+                'output': error message,
+            }
+        """
+        states = self._daemon_checks(node, service)
+        if states is None:
+            states = self._consul_checks(node, service, stream=True)
+        return self._check_records(states, all=all, service=service)
+
+    def _consul_checks(self, node, service, stream=False):
+        health = self.consul.health
+        if node:
+            return (health.iter_node if stream else health.node)(node)
+        if service:
+            return (health.iter_checks if stream else health.checks)(service)
+        return (health.iter_state if stream else health.state)('any')
+
+    def _daemon_checks(self, node=None, service=None):
+        """Checks in any states held by the daemon of the given node and
+        service name if set, None if there is no daemon
+        """
+        return self._daemon_call('health', node=node, service=service)
+
+    @staticmethod
+    def _check_records(states, all=False, service=None):
+        for state in states:
+            if not all and state['Status'] == 'passing':
+                continue
+            if service and state['ServiceName'] != service:
+                continue
+            yield {
+                'node': state['Node'],
+                'service_id': state['ServiceID'],
+                'service_name': state['ServiceName'],
+                'check': state['Name'],
+                'status': state['Status'],
+                'output': state['Output'],
+            }
+
+    def get_kv_registry(self, max_stale=None):
+        """Get all apps (``app/`` kv prefix)
+
+        When the on disk cache is enabled, cached apps are used if the
+        consul index of the ``app/`` prefix didn't change (that only
+        requires to list keys) or without any request if cache is younger
+        than ``max_stale``.
+
+        Apps held by the daemon are used first when it is running, apps
+        kept in memory first of all when ``memory_ttl`` is set.
+
+        :param max_stale: max age in second of the on disk cache to use it
+            without checking it's up to date
+        :return: a dict of json values per kv key
+        """
+        if self._registry and not self._expired(self._registry[0]):
+            return dict(self._registry[1])
+        values = self._fetch_kv_registry(max_stale)
+        if self.memory_ttl is not None:
+            self._registry = (time.monotonic(), dict(values))
+        return values
+
+    def _fetch_kv_registry(self, max_stale=None):
+        values = self._daemon_call('registry')
+        if values is not None:
+            return values
+        if not self._registry_cache:
+            return self.consul.kv.find('app/')
+        cached = self._registry_cache.load()
+        if cached:
+            cached_index, age, values = cached
+            if max_stale is not None and age <= max_stale:
+                return values
+            index, _ = self.consul.kv.keys_index('app/')
+            if index == cached_index:
+                self._registry_cache.touch()
+                return values
+        index, values = self.consul.kv.find_index('app/')
+        self._registry_cache.save(index, values)
+        return values
+
+    def iter_kv_registry(self, max_stale=None):
+        """Same as :py:meth:`get_kv_registry` but apps are streamed from
+        consul when neither the on disk cache, the daemon nor the memory
+        cache is used
+
+        :return: an iterator of ``(key, json value)``
+        """
+        if (
+                not self._registry_cache and self.daemon is None and
+                self.memory_ttl is None
+        ):
+            return self.consul.kv.iter_find('app/')
+        return iter(self.get_kv_registry(max_stale=max_stale).items())
+
     def get_kv_application(self, repo_name, branch):
-        apps = self.consul.kv.find(APP_KV_FIND_PATTERN.format(
+        """Find an app from its repo name and branch. Matching keys are
+        listed without their values to detect ambiguous names (by the
+        daemon if it is running), then the value of the single matching key
+        is read from consul. Keys found are reused by next calls.
+
+        :return: a tuple ``(key, app)``, ``(None, None)`` if there is no
+            such app
+        """
+        with self._phase('resolve'):
+            key = self._application_keys.get((repo_name, branch))
+            if key:
+                app = util.json2obj(self.consul.kv.get(key))
+                if app:
+                    return key, app
+                # the app was removed since
+                del self._application_keys[(repo_name, branch)]
+            prefix = APP_KV_FIND_PATTERN.format(
                 repo=repo_name,
                 branch=branch,
                 separator=APP_KEY_SEPARATOR
             )
+            keys = self._daemon_call('keys', prefix=prefix, separator='/')
+            if keys is None:
+                _, keys = self.consul.kv.keys_index(prefix, separator='/')
+            if not keys:
+                return None, None
+            self._check_ambiguity(keys, repo_name, branch)
+            key = keys[0]
+            app = util.json2obj(self.consul.kv.get(key))
+            if not app:
+                return None, None
+            self._application_keys[(repo_name, branch)] = key
+            return key, app
+
+    def _find_application(self, apps, repo_name, branch):
+        """Find an app in an already fetched registry
+
+        :param apps: a dict of json values per kv key
+        """
+        prefix = APP_KV_FIND_PATTERN.format(
+            repo=repo_name,
+            branch=branch,
+            separator=APP_KEY_SEPARATOR
+        )
+        return self._single_application(
+            {
+                key: value for key, value in apps.items()
+                if key.startswith(prefix)
+            },
+            repo_name,
+            branch
         )
 
+    def _single_application(self, apps, repo_name, branch):
         if not apps:
             return None, None
-        if len(apps) > 1:
+        self._check_ambiguity(apps.keys(), repo_name, branch)
+        key, data = apps.popitem()
+        return key, util.json2obj(data)
+
+    @staticmethod
+    def _check_ambiguity(keys, repo_name, branch):
+        if len(keys) > 1:
             raise RuntimeError(
                 "Repo / branch are ambiguous, multiple keys ({}) found for"
                 "given repo: {}, branch: {}".format(
-                    sorted(apps.keys()), repo_name, branch
+                    sorted(keys), repo_name, branch
                 )
             )
-        key, data = apps.popitem()
-        return key, util.json2obj(data)
 
     def deploy(
             self,
@@ -113,73 +521,42 @@ class Cluster:
             no_wait=False,
             timeout=DEFAULT_TIMEOUT,
             ask_user=True,
-            update=False
+            update=False,
+            auto_place=False,
+            explain=False
     ):
-        key, app = self.get_kv_application(repo_name, branch)
-        if master and slave and master == slave:
-            raise RuntimeError("Master and slave must be different")
-        new_master = master
-        new_slave = slave
-        if not app:
-            if not master:
+        """Deploy or re-deploy a service
+
+        :param auto_place: choose master and slave of a new service (see
+            :py:meth:`auto_place`)
+        :param explain: display the node scores used by ``auto_place``
+        """
+        if auto_place:
+            if master or slave:
                 raise RuntimeError(
-                    "Deploying a new service require a master"
-                )
-            repo_url, branch = repo_name.strip(), branch.strip()
-            if repo_url.endswith('.git'):
-                repo_url = repo_url[:-4]
-            md5 = hashlib.md5(
-                parse.urlparse(repo_url.lower()).path.encode('utf-8')
-            ).hexdigest()
-            repo_name = os.path.basename(repo_url.strip('/').lower())
-            key = 'app/' + repo_name + (
-                '_' + branch if branch else ''
-            ) + '.' + md5[:5]  # don't need full md5
-        else:
-            if app.slave:
-                # taht was a replicated service => that will carry on to be a
-                # replicate service because the auto detect switch guess the
-                # slave
-                if not new_master:
-                    new_master = app.slave
-                if not new_slave:
-                    new_slave = app.master
-                if new_master == new_slave:
-                    if master:
-                        new_slave = app.slave
-                    if slave:
-                        new_master = app.master
-            else:
-                # was a master only service
-                if not new_master:
-                    new_master = app.master
-            repo_url = app.repo_url
-            branch = app.branch
-
-        if new_master == new_slave:
-            raise RuntimeError("Master and slave must be different")
-        if new_master not in self.nodes:
-            raise RuntimeError(
-                "Can't deploy to unknown master (node host: {})".format(
-                    new_master
-                )
-            )
-        if new_slave is not None and new_slave not in self.nodes:
-            raise RuntimeError(
-                "Can't deploy using unknown slave (node host: {}) ".format(
-                    new_slave
+                    "Automatic placement can't be used with a given master "
+                    "or slave"
                 )
+            key, app = None, None
+            master, slave = self.auto_place(
+                repo_name, branch, explain=explain
             )
+        else:
+            key, app = self.get_kv_application(repo_name, branch)
+        deployment = self._plan_deployment(
+            key, app, repo_name, branch, master=master, slave=slave,
+            update=update
+        )
         if ask_user:
             print(
                 "You are going to move following app {} from "
                 "[master: {} - replicate: {}] to "
                 "[master: {} - replicate: {}]".format(
-                    key,
+                    deployment.kv_key,
                     app.master if app else None,
                     app.slave if app else None,
-                    new_master,
-                    new_slave
+                    deployment.master,
+                    deployment.slave
                 )
             )
             answer = util.get_input("Please confim by entering 'yes': ")
@@ -189,28 +566,290 @@ class Cluster:
                 return
 
         self._deploy(
-            key,
-            repo_url,
-            branch,
-            new_master,
-            slave=new_slave,
+            deployment.kv_key,
+            deployment.repo_url,
+            deployment.branch,
+            deployment.master,
+            slave=deployment.slave,
             no_wait=no_wait,
             timeout=timeout,
             update=update
         )
 
+    def auto_place(self, repo_name, branch, explain=False):
+        """Choose nodes of a new service from a single registry scan and a
+        single health checks fetch: the least loaded healthy master and a
+        distinct slave (see :py:func:`cluster.placement.auto_place`).
+
+        :param explain: display the score of each node
+        :return: a tuple ``(master, slave)``
+        """
+        with self._phase('resolve'):
+            apps = self.get_kv_registry()
+            key, app = self._find_application(apps, repo_name, branch)
+        if app:
+            raise RuntimeError(
+                "{} is already deployed, automatic placement is only for new "
+                "services".format(key)
+            )
+        index = registry.NodeIndex(
+            {key: util.json2obj(value) for key, value in apps.items()}
+        )
+        checks = self.checks()
+        with self._phase('validate'):
+            scores = placement.node_scores(index, self.nodes, checks)
+            master, slave = placement.auto_place(scores)
+        if explain:
+            print(
+                "Node scores (master apps, slave apps, failing service "
+                "checks, failing node checks):"
+            )
+            for node in sorted(scores):
+                print(
+                    " - {}: {masters}, {slaves}, {failing}, "
+                    "{node_failing}{}".format(
+                        node,
+                        " (unhealthy)" if scores[node]['node_failing']
+                        else "",
+                        **scores[node]
+                    )
+                )
+            print("Placement: [master: {} - replicate: {}]".format(
+                master, slave
+            ))
+        return master, slave
+
+    def deploy_plan(
+            self,
+            plan,
+            no_wait=False,
+            timeout=DEFAULT_TIMEOUT,
+            ask_user=True,
+            parallel=DEFAULT_PARALLEL,
+            max_per_node=None
+    ):
+        """Deploy many services at once. Apps are resolved from a single
+        registry scan and nodes validated before firing any event. Events
+        are fired and waited by a pool of ``parallel`` workers, the outcome
+        of each service is reported at the end.
+
+        :param plan: a list of dicts with ``repo``, ``branch`` and optional
+            ``master``, ``slave``, ``update`` keys, same meaning as
+            :py:meth:`deploy` params
+        :param max_per_node: see :py:meth:`move_masters_from`
+        """
+        with self._phase('resolve'):
+            apps = self.get_kv_registry()
+        deployments = []
+        for entry in plan:
+            repo_name, branch = entry['repo'], entry['branch']
+            key, app = self._find_application(apps, repo_name, branch)
+            deployments.append((app, self._plan_deployment(
+                key,
+                app,
+                repo_name,
+                branch,
+                master=entry.get('master'),
+                slave=entry.get('slave'),
+                update=entry.get('update', False)
+            )))
+        # two events on the same app would race, whatever the order
+        duplicates = sorted(
+            key for key, count in collections.Counter(
+                deployment.kv_key for _, deployment in deployments
+            ).items() if count > 1
+        )
+        if duplicates:
+            raise RuntimeError(
+                "Services {} are deployed more than once by the "
+                "plan".format(', '.join(duplicates))
+            )
+
+        if ask_user:
+            print("You are going to deploy following apps:")
+            for app, deployment in deployments:
+                print(
+                    " - {} from [master: {} - replicate: {}] to "
+                    "[master: {} - replicate: {}]".format(
+                        deployment.kv_key,
+                        app.master if app else None,
+                        app.slave if app else None,
+                        deployment.master,
+                        deployment.slave
+                    )
+                )
+            answer = util.get_input("Please confim by entering 'yes': ")
+            if answer.strip().lower() != 'yes':
+                print("Not confirmed, Aborting")
+                logger.warning("Not confirmed. Aborting")
+                return
+        self._report(self._deploy_many(
+            [deployment for _, deployment in deployments],
+            parallel=parallel,
+            max_per_node=max_per_node,
+            no_wait=no_wait,
+            timeout=timeout
+        ))
+
+    def _plan_deployment(
+            self,
+            key,
+            app,
+            repo_name,
+            branch,
+            master=None,
+            slave=None,
+            update=False
+    ):
+        """Choose and check master / slave nodes of a service
+
+        :param key: kv key of the app, None for a new service
+        :param app: current app registry value, None for a new service
+        :rtype: :py:class:`Deployment`
+        """
+        with self._phase('validate'):
+            if master and slave and master == slave:
+                raise RuntimeError("Master and slave must be different")
+            new_master = master
+            new_slave = slave
+            if not app:
+                if not master:
+                    raise RuntimeError(
+                        "Deploying a new service require a master"
+                    )
+                repo_url, branch = repo_name.strip(), branch.strip()
+                if repo_url.endswith('.git'):
+                    repo_url = repo_url[:-4]
+                key = app_key(repo_url, branch)
+            else:
+                if app.slave:
+                    # taht was a replicated service => that will carry on to
+                    # be a replicate service because the auto detect switch
+                    # guess the slave
+                    if not new_master:
+                        new_master = app.slave
+                    if not new_slave:
+                        new_slave = app.master
+                    if new_master == new_slave:
+                        if master:
+                            new_slave = app.slave
+                        if slave:
+                            new_master = app.master
+                else:
+                    # was a master only service
+                    if not new_master:
+                        new_master = app.master
+                repo_url = app.repo_url
+                branch = app.branch
+
+            if new_master == new_slave:
+                raise RuntimeError("Master and slave must be different")
+            if new_master not in self.nodes:
+                raise RuntimeError(
+                    "Can't deploy to unknown master (node host: {})".format(
+                        new_master
+                    )
+                )
+            if new_slave is not None and new_slave not in self.nodes:
+                raise RuntimeError(
+                    "Can't deploy using unknown slave (node host: {}) ".format(
+                        new_slave
+                    )
+                )
+            return Deployment(
+                key, repo_url, branch, new_master, new_slave, update
+            )
+
     def move_masters_from(
         self,
         node,
         master=None,
         no_wait=False,
         timeout=DEFAULT_TIMEOUT,
-        ask_user=True
+        ask_user=True,
+        parallel=1,
+        max_per_node=None,
+        wave_size=None,
+        health_timeout=DEFAULT_HEALTH_TIMEOUT,
+        health_interval=DEFAULT_HEALTH_INTERVAL
     ):
-        move_apps = []
-        for key, value in self.consul.kv.find('app/').items():
-            app = util.json2obj(value)
-            if app.master == node:
+        """Move all master services of the given node to their slave or to
+        the given default master.
+
+        :param parallel: number of services moved at the same time, when
+            greater than 1 failures (ie: timeout) do not stop other moves,
+            the outcome of each service is reported at the end
+        :param max_per_node: max number of services deployed at the same
+            time on a given target node (only used with ``parallel`` or
+            ``wave_size``)
+        :param wave_size: move services by waves of ``wave_size`` services
+            at the same time waiting target nodes are healthy between waves
+            (see :py:meth:`_deploy_waves`), ``parallel`` is ignored
+        :param health_timeout: max time in second to wait target nodes are
+            healthy after a wave
+        :param health_interval: time in second between health checks polls
+        """
+        if wave_size and no_wait:
+            raise RuntimeError(
+                "Services can't be moved by waves without waiting deployments"
+            )
+        deployments = self._plan_move_masters(node, master=master)
+
+        if ask_user:
+            print("You are going to move following apps:")
+            for deployment in deployments:
+                print(" - from {} to {}, project: {}".format(
+                    node,
+                    deployment.master,
+                    deployment.kv_key
+                ))
+            answer = util.get_input("Please confim by entering 'yes': ")
+            if answer.strip().lower() != 'yes':
+                print("Not confirmed, Aborting")
+                logger.warning("Not confirmed. Aborting")
+                return
+        if wave_size:
+            self._report(self._deploy_waves(
+                deployments,
+                wave_size,
+                max_per_node=max_per_node,
+                timeout=timeout,
+                health_timeout=health_timeout,
+                health_interval=health_interval
+            ))
+            return
+        if parallel > 1:
+            results = self._deploy_many(
+                deployments,
+                parallel=parallel,
+                max_per_node=max_per_node,
+                no_wait=no_wait,
+                timeout=timeout
+            )
+            self._report(results)
+            return
+        for deployment in deployments:
+            self._deploy(
+                deployment.kv_key,
+                deployment.repo_url,
+                deployment.branch,
+                deployment.master,
+                slave=deployment.slave,
+                no_wait=no_wait,
+                timeout=timeout
+            )
+
+    def _plan_move_masters(self, node, master=None):
+        """Choose the new master of each master service of the given node:
+        its slave or the given default master
+
+        :rtype: a list of :py:class:`Deployment`
+        """
+        deployments = []
+        apps = self.get_node_index()
+        with self._phase('validate'):
+            for key in apps.masters[node]:
+                app = apps.apps[key]
                 mstr = app.slave
                 if not mstr:
                     if not master:
@@ -236,51 +875,421 @@ class Cluster:
                         )
 
                     mstr = master
-                move_apps.append(
-                    (
-                        key,
-                        app,
-                        mstr,
-                        app.master if app.slave else None,
-                    )
-                )
-
-        if ask_user:
-            print("You are going to move following apps:")
-            for key, app, mstr, _ in move_apps:
-                print(" - from {} to {}, project: {}".format(
-                    app.master,
+                deployments.append(Deployment(
+                    key,
+                    app.repo_url,
+                    app.branch,
                     mstr,
-                    key
+                    app.master if app.slave else None,
                 ))
+        return deployments
+
+    def rebalance(
+        self,
+        weight=None,
+        no_wait=False,
+        timeout=DEFAULT_TIMEOUT,
+        ask_user=True,
+        parallel=DEFAULT_PARALLEL,
+        max_per_node=None,
+        dry_run=False
+    ):
+        """Even out the master load of cluster nodes moving a minimal set
+        of masters (see :py:func:`cluster.placement.plan_rebalance`).
+
+        :param weight: registry field holding apps weight, the number of
+            master apps per node is evened out if not set
+        :param parallel: see :py:meth:`move_masters_from`
+        :param max_per_node: see :py:meth:`move_masters_from`
+        :param dry_run: only display the plan
+        """
+        apps = self.get_node_index()
+        with self._phase('validate'):
+            loads = placement.node_loads(apps, self.nodes, weight=weight)
+            moves, new_loads = placement.plan_rebalance(
+                apps, self.nodes, weight=weight
+            )
+        print("Master load per node:")
+        for node in sorted(loads):
+            print(" - {}: {} -> {}".format(node, loads[node], new_loads[node]))
+        print("Imbalance (max - min load): {} -> {}".format(
+            placement.imbalance(loads), placement.imbalance(new_loads)
+        ))
+        if not moves:
+            print("Nodes are balanced, nothing to move")
+            return
+        print("Moves:")
+        for key, master, slave in moves:
+            print(
+                " - {} from [master: {} - replicate: {}] to "
+                "[master: {} - replicate: {}]".format(
+                    key,
+                    apps.apps[key].master,
+                    apps.apps[key].slave,
+                    master,
+                    slave
+                )
+            )
+        if dry_run:
+            return
+        if ask_user:
             answer = util.get_input("Please confim by entering 'yes': ")
             if answer.strip().lower() != 'yes':
                 print("Not confirmed, Aborting")
                 logger.warning("Not confirmed. Aborting")
                 return
-        for key, app, mstr, slave in move_apps:
-            self._deploy(
-                key,
-                app.repo_url,
-                app.branch,
-                mstr,
-                slave=slave,
-                no_wait=no_wait,
-                timeout=timeout
+        self._report(self._deploy_many(
+            [
+                Deployment(
+                    key,
+                    apps.apps[key].repo_url,
+                    apps.apps[key].branch,
+                    master,
+                    slave
+                )
+                for key, master, slave in moves
+            ],
+            parallel=parallel,
+            max_per_node=max_per_node,
+            no_wait=no_wait,
+            timeout=timeout
+        ))
+
+    def get_node_index(self, max_stale=None):
+        """Get master and slave apps per node
+
+        :param max_stale: see :py:meth:`get_kv_registry`
+        :rtype: :py:class:`cluster.registry.NodeIndex`
+        """
+        with self._phase('resolve'):
+            return registry.NodeIndex(
+                {
+                    key: util.json2obj(value)
+                    for key, value in self.get_kv_registry(
+                        max_stale=max_stale
+                    ).items()
+                }
             )
 
     def inspect_node(
             self,
-            node,
+            *nodes,
+            max_stale=None,
+            slaves=False
     ):
-        master_apps = []
-        for key, value in self.consul.kv.find('app/').items():
+        """Display master apps of given nodes
+
+        :param slaves: display slave (replicate) apps as well
+        """
+        self.print_node_apps(
+            self.get_node_index(max_stale=max_stale), nodes, slaves=slaves
+        )
+
+    def iter_node_apps(self, *nodes, max_stale=None, slaves=False):
+        """Same as :py:meth:`inspect_node` but apps are yielded in registry
+        order as soon as they are decoded, one record per app and node::
+
+            {
+                'node': 'node1',
+                'role': 'master' or 'slave',
+                'key': kv key,
+                'repo_url': repo url,
+                'branch': branch,
+                'master': master node,
+                'slave': slave node,
+            }
+        """
+        nodes = set(nodes)
+        roles = ('master', 'slave') if slaves else ('master', )
+        for key, value in self.iter_kv_registry(max_stale=max_stale):
             app = util.json2obj(value)
-            if app.master == node:
-                master_apps.append(key)
+            for role in roles:
+                node = getattr(app, role, None)
+                if node in nodes:
+                    yield {
+                        'node': node,
+                        'role': role,
+                        'key': key,
+                        'repo_url': getattr(app, 'repo_url', None),
+                        'branch': getattr(app, 'branch', None),
+                        'master': getattr(app, 'master', None),
+                        'slave': getattr(app, 'slave', None),
+                    }
+
+    @staticmethod
+    def print_node_apps(apps, nodes, slaves=False):
+        """Display master (and slave) apps of given nodes
+
+        :param apps: a :py:class:`cluster.registry.NodeIndex`
+        """
+        for node in nodes:
+            print("Master apps of node {node}:".format(node=node))
+            print("\n".join(apps.masters[node]))
+            if slaves:
+                print("Slave apps of node {node}:".format(node=node))
+                print("\n".join(apps.slaves[node]))
+
+    def _deploy_many(
+        self,
+        deployments,
+        parallel=1,
+        max_per_node=None,
+        no_wait=False,
+        timeout=DEFAULT_TIMEOUT
+    ):
+        """Deploy many services using a pool of ``parallel`` workers
+
+        :param deployments: list of :py:class:`Deployment`
+        :param max_per_node: max number of deployments running at the same
+            time with the same master
+        :return: a list of ``(deployment, exception)`` tuples in the order
+            deployments ends, ``exception`` is None on success
+        """
+        pending = list(deployments)
+        running = {}
+        load = collections.Counter()
+        results = []
+        with futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+            while pending or running:
+                for deployment in list(pending):
+                    if len(running) >= parallel:
+                        break
+                    if (
+                        max_per_node and
+                        load[deployment.master] >= max_per_node
+                    ):
+                        continue
+                    pending.remove(deployment)
+                    load[deployment.master] += 1
+                    running[executor.submit(
+                        self._deploy,
+                        deployment.kv_key,
+                        deployment.repo_url,
+                        deployment.branch,
+                        deployment.master,
+                        slave=deployment.slave,
+                        no_wait=no_wait,
+                        timeout=timeout,
+                        update=deployment.update
+                    )] = deployment
+                if not running:
+                    raise RuntimeError(
+                        "No deployment can start with at most {} per "
+                        "node".format(max_per_node)
+                    )
+                done, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    deployment = running.pop(future)
+                    load[deployment.master] -= 1
+                    error = future.exception()
+                    if error:
+                        logger.error(
+                            "Deploying %s fails: %s",
+                            deployment.kv_key,
+                            error
+                        )
+                    results.append((deployment, error))
+        return results
+
+    def _deploy_waves(
+        self,
+        deployments,
+        wave_size,
+        max_per_node=None,
+        timeout=DEFAULT_TIMEOUT,
+        health_timeout=DEFAULT_HEALTH_TIMEOUT,
+        health_interval=DEFAULT_HEALTH_INTERVAL
+    ):
+        """Deploy services by waves of at most ``wave_size`` services at the
+        same time. After each wave, wait until checks of the wave services
+        are registered on their new master and passing (see
+        :py:func:`service_id`). When other checks of a target node start
+        failing meanwhile, next waves are halved (down to a single
+        service), they grow back once a wave leaves its nodes healthy.
+        Next waves are not deployed if a service of the wave is not
+        deployed or is still not healthy after ``health_timeout``.
+
+        :return: see :py:meth:`_deploy_many`, services not healthy and
+            services not deployed get an exception
+        """
+        pending = list(deployments)
+        size = wave_size
+        results = []
+        number = 0
+        while pending:
+            number += 1
+            wave, pending = pending[:size], pending[size:]
+            nodes = sorted({deployment.master for deployment in wave})
+            known = self._failing_checks(nodes)
+            print("Wave {}: moving {} service(s) to {}, {} left".format(
+                number, len(wave), ", ".join(nodes), len(pending)
+            ))
+            wave_results = self._deploy_many(
+                wave,
+                parallel=len(wave),
+                max_per_node=max_per_node,
+                timeout=timeout
+            )
+            if not any(error for _, error in wave_results):
+                unhealthy, degraded = self._wait_healthy(
+                    wave, known, health_timeout, health_interval
+                )
+                errors = {
+                    service: RuntimeError(
+                        "service not healthy after {}s: {}".format(
+                            health_timeout, reason
+                        )
+                    )
+                    for service, reason in unhealthy.items()
+                }
+                wave_results = [
+                    (deployment, errors.get(service_id(deployment.kv_key)))
+                    for deployment, _ in wave_results
+                ]
+                if degraded:
+                    size = max(size // 2, 1)
+                    logger.warning(
+                        "Nodes started failing checks: %s, moving %s "
+                        "service(s) per wave", sorted(degraded), size
+                    )
+                    print(
+                        "Checks started failing: {}, slowing down to {} "
+                        "service(s) per wave".format(
+                            ", ".join(
+                                "{} ({})".format(check, node)
+                                for node, check in sorted(degraded)
+                            ),
+                            size
+                        )
+                    )
+                else:
+                    size = min(size * 2, wave_size)
+            results.extend(wave_results)
+            if any(error for _, error in wave_results):
+                logger.error("Wave %s failed, stop moving services", number)
+                error = RuntimeError(
+                    "not deployed, wave {} failed".format(number)
+                )
+                results.extend((deployment, error) for deployment in pending)
+                break
+        return results
+
+    def _node_checks(self, node):
+        """Checks in any states of the given node"""
+        states = self._daemon_checks(node)
+        if states is None:
+            states = self.consul.health.node(node)
+        return states
+
+    def _failing_checks(self, nodes):
+        """:return: a set of ``(node, check id)`` of checks of given nodes
+            not passing
+        """
+        return {
+            (node, state['CheckID'])
+            for node in nodes
+            for state in self._node_checks(node)
+            if state['Status'] != 'passing'
+        }
+
+    def _wait_healthy(self, wave, known, timeout, interval):
+        """Wait failing checks of the wave services on their master pass,
+        target nodes checks are polled one node at a time. Services without
+        registered check (or whose consul service id is not
+        :py:func:`service_id`) are only reported: their deployment is
+        already confirmed by the registry.
+
+        :param known: see :py:meth:`_failing_checks`, checks failing before
+            the wave
+        :return: a tuple ``(unhealthy, degraded)``: a dict of the reason
+            per service id still failing checks on timeout (empty when all
+            services are healthy) and the set of ``(node, check id)`` of
+            other checks of target nodes which started failing
+        """
+        services = {
+            service_id(deployment.kv_key): deployment.master
+            for deployment in wave
+        }
+        nodes = sorted(set(services.values()))
+        start_date = datetime.now()
+        with self._phase('wait-healthy'):
+            with watch.Poll(watch.fixed_intervals(interval)) as poll:
+                while True:
+                    states = {node: self._node_checks(node) for node in nodes}
+                    checks = self._service_checks(services, states)
+                    unhealthy = {}
+                    for service, service_checks in checks.items():
+                        failing = sorted(
+                            state['Name'] for state in service_checks
+                            if state['Status'] != 'passing'
+                        )
+                        if failing:
+                            unhealthy[service] = "failing checks: {}".format(
+                                ", ".join(failing)
+                            )
+                    remaining = timeout - (
+                        datetime.now() - start_date
+                    ).total_seconds()
+                    if unhealthy and poll.wait(timeout=remaining):
+                        continue
+                    if unhealthy:
+                        logger.error(
+                            "Services still not healthy after %ss: %s",
+                            timeout, unhealthy
+                        )
+                    unchecked = sorted(set(services) - set(checks))
+                    if unchecked:
+                        logger.warning(
+                            "Services without registered check, their "
+                            "health is not waited: %s", unchecked
+                        )
+                    degraded = {
+                        (node, state['CheckID'])
+                        for node, node_states in states.items()
+                        for state in node_states
+                        if state['ServiceID'] not in services and
+                        state['Status'] != 'passing'
+                    } - known
+                    return unhealthy, degraded
 
-        print("Master apps of node {node}:".format(node=node))
-        print("\n".join(sorted(master_apps)))
+    @staticmethod
+    def _service_checks(services, states):
+        """:param services: dict of master node per service id
+        :param states: dict of checks per node
+        :return: dict of checks per service id registered on its master,
+            services without check are missing
+        """
+        checks = collections.defaultdict(list)
+        for node, node_states in states.items():
+            for state in node_states:
+                if services.get(state['ServiceID']) == node:
+                    checks[state['ServiceID']].append(state)
+        return checks
+
+    def _report(self, results):
+        print("Services outcome:")
+        for deployment, error in results:
+            if not error:
+                outcome = "done"
+            elif isinstance(error, TimeoutError):
+                outcome = "timeout"
+            else:
+                outcome = "failed ({})".format(error)
+            print(" - {} [master: {} - replicate: {}]: {}".format(
+                deployment.kv_key,
+                deployment.master,
+                deployment.slave,
+                outcome
+            ))
+        failures = [result for result in results if result[1]]
+        if failures:
+            raise RuntimeError(
+                "{} on {} service(s) were not deployed".format(
+                    len(failures), len(results)
+                )
+            )
 
     # communicate with consul
     def _deploy(
@@ -297,41 +1306,46 @@ class Cluster:
     ):
         """Deploy a service waiting the end end of deployment before carry on
         """
-        def deploy_finished(kv_app_before, kv_app_after, *args, **kwargs):
-            if kv_app_before and kv_app_after:
-                if kv_app_after.deploy_date > kv_app_before.deploy_date:
-                    return True
-                else:
-                    return False
-            else:
-                if not kv_app_before:
-                    if kv_app_after:
-                        return True
-                    else:
-                        return False
-                else:
-                    return False
-
         if not event_consumed:
-            event_consumed = deploy_finished
+            event_consumed = Cluster.deploy_finished
 
         self._fire_event(
             kv_key,
             'deploy',
-            json.dumps(
-                {
-                    'repo': repo_url,
-                    'branch': branch,
-                    'master': master,
-                    'slave': slave,
-                    'update': update
-                }
-            ),
+            self._deploy_payload(repo_url, branch, master, slave, update),
             no_wait,
             event_consumed,
             timeout
         )
 
+    @staticmethod
+    def deploy_finished(kv_app_before, kv_app_after, *args, **kwargs):
+        if kv_app_before and kv_app_after:
+            if kv_app_after.deploy_date > kv_app_before.deploy_date:
+                return True
+            else:
+                return False
+        else:
+            if not kv_app_before:
+                if kv_app_after:
+                    return True
+                else:
+                    return False
+            else:
+                return False
+
+    @staticmethod
+    def _deploy_payload(repo_url, branch, master, slave=None, update=False):
+        return json.dumps(
+            {
+                'repo': repo_url,
+                'branch': branch,
+                'master': master,
+                'slave': slave,
+                'update': update
+            }
+        )
+
     # move as classmethod to easly reuse it in unittest
     @classmethod
     def migrate_finished(
@@ -355,7 +1369,48 @@ class Cluster:
             ask_user=True,
             no_update=False
     ):
+        source_key, target_key, payload = self._plan_migration(
+            source_repo,
+            source_branch,
+            target_branch,
+            target_repo=target_repo,
+            no_update=no_update
+        )
+        self.was_maintenance = False
+
+        if ask_user:
+            print(
+                "You are on the way to replace common docker volumes on "
+                " service {} by data from {}".format(
+                    target_key, source_key
+                )
+            )
+            answer = util.get_input("Please confim by entering 'yes': ")
+            if answer.strip().lower() != 'yes':
+                print("Not confirmed, Aborting")
+                logger.warning("Not confirmed. Aborting")
+                return
+        self._fire_event(
+            target_key,
+            'migrate',
+            payload,
+            no_wait,
+            Cluster.migrate_finished,
+            timeout
+        )
+
+    def _plan_migration(
+            self,
+            source_repo,
+            source_branch,
+            target_branch,
+            target_repo=None,
+            no_update=False
+    ):
+        """Resolve and check source and target services of a migration
 
+        :return: a tuple ``(source key, target key, event payload)``
+        """
         if not target_repo:
             target_repo = source_repo
 
@@ -384,37 +1439,16 @@ class Cluster:
                     target_branch
                 )
             )
-        self.was_maintenance = False
-
-        if ask_user:
-            print(
-                "You are on the way to replace common docker volumes on "
-                " service {} by data from {}".format(
-                    target_key, source_key
-                )
-            )
-            answer = util.get_input("Please confim by entering 'yes': ")
-            if answer.strip().lower() != 'yes':
-                print("Not confirmed, Aborting")
-                logger.warning("Not confirmed. Aborting")
-                return
-        self._fire_event(
-            target_key,
-            'migrate',
-            json.dumps(
-                {
-                    'repo': source_app.repo_url,
-                    'branch': source_app.branch,
-                    'target': {
-                        'repo': target_app.repo_url,
-                        'branch': target_app.branch
-                    },
-                    'update': not no_update
-                }
-            ),
-            no_wait,
-            Cluster.migrate_finished,
-            timeout
+        return source_key, target_key, json.dumps(
+            {
+                'repo': source_app.repo_url,
+                'branch': source_app.branch,
+                'target': {
+                    'repo': target_app.repo_url,
+                    'branch': target_app.branch
+                },
+                'update': not no_update
+            }
         )
 
     def _fire_event(
@@ -426,31 +1460,84 @@ class Cluster:
         event_consumed,
         timeout
     ):
-        app_before = util.json2obj(self.consul.kv.get(kv_key))
-        logger.info(
-            "Emit %s event for kv key: %s with following payload: %r",
-            event_name, kv_key, payload
-        )
-        event_id = self.consul.event.fire(
-            event_name, payload
-        )
+        app_before, event_id = self._fire(kv_key, event_name, payload)
+        if no_wait:
+            return event_id
+        maintenance_key = kv_key.replace("app/", "maintenance/")
+        # migrations first wait the app goes in maintenance
+        phase = 'wait-maintenance-on' if event_name == 'migrate' else \
+            'wait-until-kv-changed'
         start_date = datetime.now()
-        while not no_wait and not event_consumed(
-                app_before,
-                util.json2obj(self.consul.kv.get(kv_key)),
-                maintenance=self.consul.kv.get_record(
-                    kv_key.replace("app/", "maintenance/")
-                ),
-                self=self
-        ):
-            time.sleep(1)
-            if (datetime.now() - start_date).seconds > timeout:
-                raise TimeoutError(
-                    "Event (id: {}) was not processed in the expected time"
-                    " ({}s),".format(event_id, timeout)
-                )
+        with watch.watch(
+                self.event_consul.kv,
+                [kv_key, maintenance_key],
+                strategy=self.wait_strategy
+        ) as kv:
+            while True:
+                with self._phase(phase):
+                    remaining = timeout - (
+                        datetime.now() - start_date
+                    ).total_seconds()
+                    if remaining <= 0 or not kv.wait(timeout=remaining):
+                        raise TimeoutError(
+                            "Event (id: {}) was not processed in the "
+                            "expected time ({}s),".format(event_id, timeout)
+                        )
+                    if isinstance(kv, watch.Watch):
+                        # records the blocking queries just received, change
+                        # after change so a short maintenance is not missed
+                        states = kv.states
+                    else:
+                        # both keys are read back in a single transaction to
+                        # get a consistent state of the app and its
+                        # maintenance
+                        _, records = self.event_consul.txn.get_records(
+                            [kv_key, maintenance_key]
+                        )
+                        states = [records]
+                consumed = False
+                for records in states:
+                    if records[maintenance_key]:
+                        phase = 'wait-maintenance-off'
+                    consumed = self._event_consumed(
+                        event_consumed, app_before, kv_key, records, self
+                    )
+                    if consumed:
+                        break
+                if consumed:
+                    break
         logger.info(
             "Event %s takes %ss to consume",
             event_name, (datetime.now() - start_date).seconds
         )
         return event_id
+
+    def _fire(self, kv_key, event_name, payload):
+        """Fire an event about the app of the given kv key
+
+        :return: a tuple ``(app before the event, event id)``
+        """
+        with self._phase('fire'):
+            app_before = util.json2obj(self.event_consul.kv.get(kv_key))
+            logger.info(
+                "Emit %s event for kv key: %s with following payload: %r",
+                event_name, kv_key, payload
+            )
+            return app_before, self.event_consul.event.fire(
+                event_name, payload
+            )
+
+    @staticmethod
+    def _event_consumed(event_consumed, app_before, kv_key, records, owner):
+        """Call ``event_consumed`` with the app and maintenance records
+
+        :param records: a dict of kv records per key
+        :param owner: object given as ``self`` to ``event_consumed``
+        """
+        app_record = records[kv_key]
+        return event_consumed(
+            app_before,
+            util.json2obj(app_record['Value'] if app_record else None),
+            maintenance=records[kv_key.replace("app/", "maintenance/")],
+            self=owner
+        )
@@ -0,0 +1,280 @@
+"""Command arguments completion: which nodes, repo names or branches an
+argument of a command takes.
+
+Shell completion reads a local index of nodes, repos and branches instead
+of querying consul, the index is refreshed in background by the completion
+script (``cluster completion refresh``)::
+
+    source <(cluster completion bash)
+"""
+import hashlib
+import os
+
+from cluster import registry
+
+# per command, kinds of positionals by position (a kind ending with ``*``
+# repeats) and kinds of options values
+ARGUMENTS = {
+    'checks': ([], {'--node': 'node'}),
+    'deploy': (['repo', 'branch'], {'--master': 'node', '--slave': 'node'}),
+    'migrate': (['repo', 'branch', 'branch'], {'--target-repo': 'repo'}),
+    'move-masters-from': (['node'], {'-m': 'node', '--master': 'node'}),
+    'inspect': (['node*'], {}),
+}
+
+
+def _option_action(command_parser, word):
+    # argparse does not expose options of a parser publicly
+    return command_parser._option_string_actions.get(word)
+
+
+def _takes_value(command_parser, word):
+    action = _option_action(command_parser, word)
+    return action is not None and action.nargs != 0
+
+
+def _split(command_parser, words):
+    """:return: a tuple ``(positionals, options)`` of command arguments,
+        ``options`` is a dict of option values
+    """
+    positionals = []
+    options = {}
+    position = 0
+    while position < len(words):
+        word = words[position]
+        if word.startswith('-') and '=' in word:
+            name, _, value = word.partition('=')
+            options[name] = value
+        elif _takes_value(command_parser, word):
+            position += 1
+            if position < len(words):
+                options[word] = words[position]
+        elif not word.startswith('-'):
+            positionals.append(word)
+        position += 1
+    return positionals, options
+
+
+def candidates(command_parser, command, words, text, nodes, repos):
+    """Values completing the argument ``text`` of a command
+
+    :param command_parser: argparse parser of the command, to tell options
+        taking a value from flags
+    :param words: command arguments before the completed one
+    :param nodes: callable returning node names
+    :param repos: callable returning a dict of branches per repo name
+    :return: a sorted list of values starting with ``text``
+    """
+    positionals, options = ARGUMENTS.get(command, ([], {}))
+    kind = None
+    if words and words[-1] in options:
+        kind = options[words[-1]]
+    elif words and _takes_value(command_parser, words[-1]):
+        return []
+    elif text.startswith('-'):
+        return sorted(
+            option for option in command_parser._option_string_actions
+            if option.startswith(text)
+        )
+    else:
+        given, _ = _split(command_parser, words)
+        if len(given) < len(positionals):
+            kind = positionals[len(given)]
+        elif positionals and positionals[-1].endswith('*'):
+            kind = positionals[-1]
+    if not kind:
+        return []
+    kind = kind.rstrip('*')
+    if kind == 'node':
+        values = nodes()
+    elif kind == 'repo':
+        values = repos().keys()
+    else:
+        given, given_options = _split(command_parser, words)
+        repo = given_options.get('--target-repo') or next(iter(given), None)
+        values = repos().get(repo, [])
+    return sorted(value for value in values if value.startswith(text))
+
+
+def index_path(cache_dir, consul_url, datacenter=None):
+    """Completion index of the given consul url and datacenter, the shell
+    completion script computes the same path
+    """
+    if datacenter:
+        consul_url = '{}?dc={}'.format(consul_url, datacenter)
+    return os.path.join(
+        cache_dir,
+        '{}-completion.txt'.format(
+            hashlib.md5(consul_url.encode('utf-8')).hexdigest()
+        )
+    )
+
+
+def _is_word(value):
+    # words are separated by spaces in the index
+    return bool(value) and value.split() == [value]
+
+
+def write_index(path, nodes, values):
+    """Write the completion index: a sorted file of ``N <node>``,
+    ``R <repo>`` and ``B <repo> <branch>`` lines
+
+    :param values: registry values, a dict of json values per kv key
+    """
+    lines = ['N ' + node for node in nodes if _is_word(node)]
+    for repo, branches in registry.repo_branches(values).items():
+        if not _is_word(repo):
+            continue
+        lines.append('R ' + repo)
+        lines.extend(
+            'B {} {}'.format(repo, branch) for branch in branches
+            if _is_word(branch)
+        )
+    lines.sort()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as index_file:
+        index_file.write(''.join(line + '\n' for line in lines))
+    os.replace(tmp_path, path)
+
+
+def script(parser, commands, shell='bash'):
+    """Completion script of the command line
+
+    :param parser: main argparse parser
+    :param commands: a dict of argparse parsers per command
+    :param shell: ``bash`` or ``zsh``
+    """
+    value_options = [
+        ':' + option for option in sorted(parser._option_string_actions)
+        if _takes_value(parser, option)
+    ]
+    options = [
+        ':' + option for option in sorted(parser._option_string_actions)
+    ]
+    for name, command_parser in sorted(commands.items()):
+        for option in sorted(command_parser._option_string_actions):
+            options.append('{}:{}'.format(name, option))
+            if _takes_value(command_parser, option):
+                value_options.append('{}:{}'.format(name, option))
+    kinds = []
+    for name, (positionals, option_kinds) in sorted(ARGUMENTS.items()):
+        for position, kind in enumerate(positionals):
+            kinds.append('{}:{}={}'.format(
+                name,
+                '*' if kind.endswith('*') else position,
+                kind.rstrip('*')
+            ))
+        kinds.extend(
+            '{}:{}={}'.format(name, option, kind)
+            for option, kind in sorted(option_kinds.items())
+        )
+    return '\n'.join([
+        '# cluster command line completion, generated by '
+        '``cluster completion {}``'.format(shell),
+    ] + ([ZSH_HEADER] if shell == 'zsh' else []) + [
+        "_cluster_commands=' {} '".format(' '.join(sorted(commands))),
+        "_cluster_options=' {} '".format(' '.join(options)),
+        "_cluster_value_options=' {} '".format(' '.join(value_options)),
+        "_cluster_kinds=' {} '".format(' '.join(kinds)),
+        SCRIPT,
+    ])
+
+
+ZSH_HEADER = """autoload -U +X compinit && compinit
+autoload -U +X bashcompinit && bashcompinit"""
+
+# completion candidates are read from the index with a single awk run, the
+# index is refreshed in background once a minute at most
+SCRIPT = r"""
+_cluster_md5() {
+    if command -v md5sum >/dev/null 2>&1; then
+        printf '%s' "$1" | md5sum | cut -d ' ' -f 1
+    else
+        md5 -q -s "$1"
+    fi
+}
+
+_cluster_kind() {
+    # kind of the argument "command:option" or "command:position"
+    local rest=${_cluster_kinds#*" $1="}
+    [[ $rest == "$_cluster_kinds" ]] && return 1
+    _cluster_kind_result=${rest%% *}
+}
+
+_cluster_complete() {
+    [[ -n ${ZSH_VERSION-} ]] &&
+        setopt local_options ksh_arrays sh_word_split
+    local cur=${COMP_WORDS[COMP_CWORD]} command= target= value_of= kind=
+    local url=http://localhost:8500 dc= word i key index type
+    local cache=${XDG_CACHE_HOME:-$HOME/.cache}/cluster-cli
+    local -a args
+    args=()
+    COMPREPLY=()
+    for ((i = 1; i < COMP_CWORD; i++)); do
+        word=${COMP_WORDS[i]}
+        if [[ -z $command ]]; then
+            case $word in
+                --consul|-c) url=${COMP_WORDS[i+1]} ;;
+                --consul=*) url=${word#*=} ;;
+                --datacenter) dc=${COMP_WORDS[i+1]} ;;
+                --datacenter=*) dc=${word#*=} ;;
+                --cache-dir) cache=${COMP_WORDS[i+1]} ;;
+                --cache-dir=*) cache=${word#*=} ;;
+            esac
+            if [[ $_cluster_value_options == *" :$word "* ]]; then
+                ((i + 1 == COMP_CWORD)) && value_of=$word
+                ((i++))
+            elif [[ $word != -* ]]; then
+                command=$word
+            fi
+        elif [[ $_cluster_value_options == *" $command:$word "* ]]; then
+            [[ $word == --target-repo ]] && target=${COMP_WORDS[i+1]}
+            ((i + 1 == COMP_CWORD)) && value_of=$word
+            ((i++))
+        elif [[ $word != -* ]]; then
+            args+=("$word")
+        fi
+    done
+    if [[ -n $value_of ]]; then
+        _cluster_kind "$command:$value_of" || return 0
+    elif [[ -z $command || $cur == -* ]]; then
+        if [[ -z $command && $cur != -* ]]; then
+            for word in $_cluster_commands; do
+                [[ $word == "$cur"* ]] && COMPREPLY+=("$word")
+            done
+        else
+            for word in $_cluster_options; do
+                [[ $word == "$command:$cur"* ]] &&
+                    COMPREPLY+=("${word#*:}")
+            done
+        fi
+        return 0
+    else
+        _cluster_kind "$command:${#args[@]}" || _cluster_kind "$command:*" ||
+            return 0
+    fi
+    kind=$_cluster_kind_result
+    key=$url
+    [[ -n $dc ]] && key="$url?dc=$dc"
+    index=$cache/$(_cluster_md5 "$key")-completion.txt
+    if [[ -z $(find "$index" -mmin -1 2>/dev/null) ]]; then
+        touch "$index" 2>/dev/null
+        ("${COMP_WORDS[0]}" --consul "$url" ${dc:+--datacenter "$dc"} \
+            --cache-dir "$cache" completion refresh >/dev/null 2>&1 &)
+    fi
+    [[ -r $index ]] || return 0
+    case $kind in
+        node) type=N ;;
+        repo) type=R ;;
+        branch) type=B ;;
+    esac
+    # branches are the third word of lines of their repo
+    COMPREPLY=($(awk -v type=$type -v cur="$cur" \
+        -v repo="${target:-${args[0]-}}" \
+        '$1 == type && (type != "B" || $2 == repo) &&
+         index($NF, cur) == 1 { print $NF }' "$index"))
+    return 0
+}
+
+complete -F _cluster_complete cluster"""
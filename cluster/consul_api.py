@@ -0,0 +1,464 @@
+"""Consulate extensions for consul features used by the cluster client that
+consulate does not expose (blocking queries, transactions...)
+"""
+import base64
+import consulate
+import functools
+import json
+import logging
+import requests
+import socket
+import threading
+
+from consulate import adapters
+from consulate import api
+from requests.adapters import HTTPAdapter
+from urllib3 import connectionpool
+
+from cluster.api import (
+    DEFAULT_CONSISTENCY,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    STREAM_CHUNK_SIZE,
+    blocking_params,
+    decode_value,
+    index_header,
+    iter_array,
+    response_rows,
+    wait_seconds,
+)
+from urllib.parse import parse_qs, urlencode, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class Response(api.Response):
+    """consulate response demarshalling ``json.loads`` with an ``encoding``
+    argument, removed in python 3.9, so bodies are kept as raw strings.
+    """
+
+    def _demarshal(self, body):
+        if body is None or self.status_code != 200:
+            return body
+        try:
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            value = json.loads(body)
+        except (UnicodeDecodeError, ValueError):
+            return body
+        if isinstance(value, list):
+            for row in value:
+                decode_value(row)
+            # consulate unwraps lists of a single element
+            if len(value) == 1:
+                return value[0]
+        return value
+
+
+class _InFlightPool:
+    """Connection pool mixin remembering the connection each thread is
+    waiting a response on, see :py:meth:`InterruptibleHTTPAdapter.interrupt`
+    """
+
+    def __init__(self, *args, in_flight=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._in_flight = in_flight
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        self._in_flight[threading.get_ident()] = conn
+        return conn
+
+    def urlopen(self, *args, **kwargs):
+        # blocking queries wait until response headers are received
+        try:
+            return super().urlopen(*args, **kwargs)
+        finally:
+            self._in_flight.pop(threading.get_ident(), None)
+
+
+class _HTTPConnectionPool(_InFlightPool, connectionpool.HTTPConnectionPool):
+    pass
+
+
+class _HTTPSConnectionPool(
+        _InFlightPool, connectionpool.HTTPSConnectionPool
+):
+    pass
+
+
+class InterruptibleHTTPAdapter(HTTPAdapter):
+    """requests http adapter able to interrupt the request sent by a given
+    thread, so a long blocking query does not hold its thread and its
+    connection once its result is not needed anymore
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # connection in use per thread id
+        self.in_flight = {}
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': functools.partial(
+                _HTTPConnectionPool, in_flight=self.in_flight
+            ),
+            'https': functools.partial(
+                _HTTPSConnectionPool, in_flight=self.in_flight
+            ),
+        }
+
+    def interrupt(self, thread_id):
+        """Shut down the connection used by the given thread, its request
+        fails at once with a connection error
+
+        :return: True if a connection was shut down
+        """
+        sock = getattr(self.in_flight.get(thread_id), 'sock', None)
+        if sock is None:
+            return False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # already closed
+            return False
+        return True
+
+
+class Request(adapters.Request):
+    """Request adapter using a pool of keep-alive connections shared by
+    every threads (event watchers, parallel deployments...)
+
+    :param int pool_size: max number of connections kept alive per host
+    :param connect_timeout: time in second to establish a connection
+    :param read_timeout: time in second to wait response data, blocking
+        queries ``wait`` duration is added to that timeout
+    :param stats: :py:class:`cluster.stats.Stats` where to account requests
+    :param consistency: consistency mode of reads (``default``, ``stale``
+        or ``consistent``, see
+        https://www.consul.io/api/features/consistency.html)
+    """
+
+    def __init__(
+            self,
+            pool_size=DEFAULT_POOL_SIZE,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            stats=None,
+            consistency=DEFAULT_CONSISTENCY
+    ):
+        super().__init__(timeout=(connect_timeout, read_timeout))
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.consistency = consistency
+        self.http_adapter = InterruptibleHTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount('http://', self.http_adapter)
+        self.session.mount('https://', self.http_adapter)
+        self.stats = stats
+        if stats is not None:
+            self.session.hooks['response'].append(self._account)
+
+    def interrupt(self, thread_id):
+        """Interrupt the request sent by the given thread (see
+        :py:meth:`InterruptibleHTTPAdapter.interrupt`)
+        """
+        return self.http_adapter.interrupt(thread_id)
+
+    def get(self, uri):
+        uri = self._read_uri(uri)
+        logger.debug("GET %s", uri)
+        return self._process_response(
+            self.session.get(uri, timeout=self._timeout(uri))
+        )
+
+    def stream(self, uri):
+        """Send a GET request returning a json array decoded as items are
+        received, so a large response is never held in memory
+
+        :return: an iterator of array items, empty if the resource is
+            not found
+        """
+        uri = self._read_uri(uri)
+        logger.debug("GET %s (streamed)", uri)
+        request = self.session.prepare_request(
+            requests.Request('GET', uri)
+        )
+        # the response hook reads the whole body, streamed requests are
+        # accounted once read
+        request.hooks['response'] = []
+        response = self.session.send(
+            request, stream=True, timeout=self._timeout(uri)
+        )
+        if response.status_code >= 500:
+            self._process_response(response)
+        if response.status_code != 200:
+            response.close()
+            return iter([])
+        return iter_array(self._iter_chunks(response))
+
+    def _iter_chunks(self, response):
+        received = 0
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                received += len(chunk)
+                yield chunk
+        finally:
+            response.close()
+            if self.stats is not None:
+                self.stats.record(
+                    response.request.method,
+                    response.url,
+                    received,
+                    response.elapsed.total_seconds()
+                )
+
+    @staticmethod
+    def _process_response(response):
+        # consulate takes server errors (ie: unreachable datacenter) as
+        # empty results
+        if response.status_code >= 500:
+            raise consulate.ConsulateException(
+                "Consul error ({}): {}".format(
+                    response.status_code,
+                    response.content.decode('utf-8', 'replace')
+                )
+            )
+        return Response(
+            response.status_code, response.content, response.headers
+        )
+
+    def _account(self, response, *args, **kwargs):
+        self.stats.record(
+            response.request.method,
+            response.url,
+            len(response.content),
+            response.elapsed.total_seconds()
+        )
+
+    def _read_uri(self, uri):
+        if self.consistency == DEFAULT_CONSISTENCY:
+            return uri
+        return '{}{}{}'.format(
+            uri, '&' if urlparse(uri).query else '?', self.consistency
+        )
+
+    def _timeout(self, uri):
+        wait = parse_qs(urlparse(uri).query).get('wait')
+        if not wait or self.read_timeout is None:
+            return self.timeout
+        # consul adds up to wait / 16 to spread wake up of blocking queries
+        return (
+            self.connect_timeout,
+            self.read_timeout + wait_seconds(wait[0]) * 17 / 16
+        )
+
+
+class KV(api.KV):
+
+    def get_record_index(self, item, index=None, wait=None):
+        """Get the full record of the given key and the ``X-Consul-Index``
+        of the response.
+
+        If ``index`` is given a blocking query is sent: consul answers as
+        soon as the key is modified or when ``wait`` is elapsed.
+
+        :param str item: The item key
+        :param int index: The last known consul index of that key
+        :param str wait: Max blocking duration (ie: ``'10s'``)
+        :return: a tuple ``(index, record)``, ``record`` is ``None`` if the
+            key does not exists
+        """
+        response = self._adapter.get(self._build_uri(
+            [item.lstrip('/')], blocking_params(index, wait)
+        ))
+        if response.status_code == 200:
+            return index_header(response), response.body
+        return index_header(response), None
+
+    def interrupt(self, thread_id):
+        """Interrupt the blocking query sent by the given thread"""
+        return self._adapter.interrupt(thread_id)
+
+    def find_index(self, prefix, index=None, wait=None):
+        """Find all keys with the given prefix
+
+        If ``index`` is given a blocking query is sent: consul answers as
+        soon as a key of the prefix is modified or when ``wait`` is elapsed.
+
+        :param str prefix: The prefix to search with
+        :param int index: The last known consul index of that prefix
+        :param str wait: Max blocking duration (ie: ``'10s'``)
+        :return: a tuple ``(index, values)`` where ``values`` is a dict of
+            values per key
+        """
+        response = self._adapter.get(self._build_uri(
+            [prefix.lstrip('/')],
+            dict({'recurse': None}, **blocking_params(index, wait))
+        ))
+        return index_header(response), {
+            row['Key']: row['Value'] for row in response_rows(response)
+        }
+
+    def iter_find(self, prefix):
+        """Find all keys with the given prefix, records are decoded as soon
+        as they are received
+
+        :param str prefix: The prefix to search with
+        :return: an iterator of ``(key, value)``
+        """
+        for row in self._adapter.stream(
+                self._build_uri([prefix.lstrip('/')], {'recurse': None})
+        ):
+            decode_value(row)
+            yield row['Key'], row['Value']
+
+    def keys_index(self, prefix, separator=None, index=None, wait=None):
+        """List keys with the given prefix without their values
+
+        If ``index`` is given a blocking query is sent: consul answers as
+        soon as a key of the prefix is modified or when ``wait`` is elapsed.
+
+        :param str prefix: The prefix to search with
+        :param str separator: only list keys up to the given separator
+        :param int index: The last known consul index of that prefix
+        :param str wait: Max blocking duration (ie: ``'10s'``)
+        :return: a tuple ``(index, keys)``
+        """
+        query_params = dict({'keys': None}, **blocking_params(index, wait))
+        if separator:
+            query_params['separator'] = separator
+        response = self._adapter.get(
+            self._build_uri([prefix.lstrip('/')], query_params)
+        )
+        return index_header(response), response_rows(response)
+
+
+class Health(api.Health):
+    """Health checks endpoint streaming checks, that response grows with
+    the number of services
+    """
+
+    def state_index(self, state, index=None, wait=None):
+        """Checks in the given state (``any`` for all states) and the
+        ``X-Consul-Index`` of the response, a blocking query is sent if
+        ``index`` is given
+
+        :return: a tuple ``(index, checks)``
+        """
+        response = self._adapter.get(self._build_uri(
+            ['state', state], blocking_params(index, wait)
+        ))
+        return index_header(response), response_rows(response)
+
+    def iter_state(self, state):
+        """:return: an iterator of checks in the given state (``any`` for
+            all states) decoded as soon as they are received
+        """
+        return self._adapter.stream(self._build_uri(['state', state]))
+
+    def iter_node(self, node):
+        """:return: an iterator of checks of the given node"""
+        return self._adapter.stream(self._build_uri(['node', node]))
+
+    def iter_checks(self, service):
+        """:return: an iterator of checks of the given service name"""
+        return self._adapter.stream(self._build_uri(['checks', service]))
+
+
+class Catalog(api.Catalog):
+
+    def nodes_index(self, index=None, wait=None):
+        """Catalog nodes and the ``X-Consul-Index`` of the response, a
+        blocking query is sent if ``index`` is given
+
+        :return: a tuple ``(index, nodes)``
+        """
+        response = self._adapter.get(self._build_uri(
+            ['nodes'], blocking_params(index, wait)
+        ))
+        return index_header(response), response_rows(response)
+
+
+class Txn(api.base.Endpoint):
+    """Consul transaction endpoint
+    (https://www.consul.io/api/txn.html)
+    """
+
+    def get_records(self, keys):
+        """Read many kv records at once in a read-only transaction, so all
+        records are read from the same consul index.
+
+        :param list keys: kv keys to read
+        :return: a tuple ``(index, records)`` where ``records`` is a dict
+            of records per key, ``None`` for missing keys
+        """
+        # ``get`` verb makes the whole transaction fails on missing keys
+        # while ``get-tree`` returns nothing
+        response = self._adapter.put(
+            self._txn_uri(),
+            [{'KV': {'Verb': 'get-tree', 'Key': key}} for key in keys]
+        )
+        if response.status_code != 200:
+            raise consulate.ConsulateException(
+                "Transaction failed ({}): {}".format(
+                    response.status_code, response.body
+                )
+            )
+        records = {key: None for key in keys}
+        for result in response.body.get('Results') or []:
+            record = result['KV']
+            # get-tree returns also keys starting with the given key
+            if record['Key'] not in records:
+                continue
+            if record.get('Value') is not None:
+                record['Value'] = base64.b64decode(
+                    record['Value']
+                ).decode('utf-8')
+            records[record['Key']] = record
+        return int(response.headers.get('X-Consul-Index', 0)), records
+
+    def _txn_uri(self):
+        query_params = dict()
+        if self._dc:
+            query_params['dc'] = self._dc
+        if self._token:
+            query_params['token'] = self._token
+        if query_params:
+            return '{}?{}'.format(self._base_uri, urlencode(query_params))
+        return self._base_uri
+
+
+class Consul(consulate.Consul):
+
+    def __init__(
+            self,
+            host=consulate.DEFAULT_HOST,
+            port=consulate.DEFAULT_PORT,
+            datacenter=None,
+            token=None,
+            scheme=consulate.DEFAULT_SCHEME,
+            adapter=None
+    ):
+        super().__init__(
+            host=host,
+            port=port,
+            datacenter=datacenter,
+            token=token,
+            scheme=scheme,
+            adapter=adapter
+        )
+        base_uri = self._base_uri(scheme, host, port)
+        self._catalog = Catalog(base_uri, self._adapter, datacenter, token)
+        self._health = Health(base_uri, self._adapter, datacenter, token)
+        self._kv = KV(base_uri, self._adapter, datacenter, token)
+        self._txn = Txn(base_uri, self._adapter, datacenter, token)
+
+    @property
+    def txn(self):
+        """Access the Consul
+        `Transaction <https://www.consul.io/api/txn.html>`_ API
+
+        :rtype: :py:class:`cluster.consul_api.Txn`
+        """
+        return self._txn
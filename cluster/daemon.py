@@ -0,0 +1,267 @@
+"""Daemon holding the node catalog, the app registry and health checks of a
+consul in memory, kept up to date with consul blocking queries. It answers
+lookups of the command line over a local unix socket::
+
+    cluster serve
+
+Commands use the daemon listening on the socket of their consul url and
+datacenter when it is running and query consul directly otherwise.
+
+The protocol is a json request per connection ``{"method": ..,
+"params": {..}}`` answered by ``{"result": ..}`` or ``{"error": ..}``, each
+on a single line.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+
+from cluster import registry
+from cluster import watch
+
+DEFAULT_CLIENT_TIMEOUT = 10
+RETRY_INTERVAL = 5
+logger = logging.getLogger(__name__)
+
+
+class DaemonError(RuntimeError):
+    """The daemon is not running or can't answer"""
+
+
+def default_socket_path(consul_url, datacenter=None):
+    """Socket of the daemon serving the given consul url and datacenter,
+    in ``$XDG_RUNTIME_DIR`` or the cache directory
+    """
+    if datacenter:
+        consul_url = '{}?dc={}'.format(consul_url, datacenter)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    return os.path.join(
+        os.path.join(runtime_dir, 'cluster-cli') if runtime_dir
+        else registry.default_cache_dir(),
+        '{}.sock'.format(hashlib.md5(consul_url.encode('utf-8')).hexdigest())
+    )
+
+
+class State:
+    """Consul data kept up to date by a thread per resource, each sending
+    blocking queries from the last index it got
+
+    :param consul: :py:class:`cluster.consul_api.Consul` client
+    :param wait: max duration of blocking queries
+    """
+
+    METHODS = ['ping', 'nodes', 'registry', 'keys', 'health']
+
+    def __init__(self, consul, wait=watch.DEFAULT_WAIT):
+        self.consul = consul
+        self.wait = wait
+        self._fetchers = {
+            'nodes': self._fetch_nodes,
+            'registry': self._fetch_registry,
+            'health': self._fetch_health,
+        }
+        self._values = {}
+        self._indexes = {}
+        # resources whose last query failed, they are not served
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _fetch_nodes(self, index):
+        index, nodes = self.consul.catalog.nodes_index(index, self.wait)
+        return index, [node['Node'] for node in nodes]
+
+    def _fetch_registry(self, index):
+        return self.consul.kv.find_index('app/', index, self.wait)
+
+    def _fetch_health(self, index):
+        return self.consul.health.state_index('any', index, self.wait)
+
+    def load(self):
+        """Fetch every resource once, consul errors are raised"""
+        for name, fetch in self._fetchers.items():
+            self._indexes[name], self._values[name] = fetch(None)
+
+    def watch(self):
+        """Start threads keeping resources up to date"""
+        for name in self._fetchers:
+            threading.Thread(
+                target=self._watch, args=(name, ), daemon=True
+            ).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self, name):
+        fetch = self._fetchers[name]
+        while not self._stopped.is_set():
+            try:
+                index, value = fetch(self._indexes[name])
+            except Exception as err:
+                logger.warning("Can't update %s: %s", name, err)
+                with self._lock:
+                    self._errors[name] = err
+                    self._indexes[name] = None
+                self._stopped.wait(RETRY_INTERVAL)
+                continue
+            with self._lock:
+                # consul index going backward must reset blocking queries
+                if index < (self._indexes[name] or 0):
+                    index = None
+                self._indexes[name] = index
+                self._values[name] = value
+                self._errors.pop(name, None)
+
+    def get(self, name):
+        with self._lock:
+            if name in self._errors:
+                raise DaemonError("{} is not up to date: {}".format(
+                    name, self._errors[name]
+                ))
+            return self._values[name]
+
+    def answer(self, method, **params):
+        if method not in self.METHODS:
+            raise DaemonError("Unknown method: {}".format(method))
+        return getattr(self, method)(**params)
+
+    def ping(self):
+        with self._lock:
+            return {'pid': os.getpid(), 'indexes': dict(self._indexes)}
+
+    def nodes(self):
+        return self.get('nodes')
+
+    def registry(self):
+        return self.get('registry')
+
+    def keys(self, prefix, separator=None):
+        """Registry keys starting with ``prefix``, up to the given separator
+        as consul ``?keys&separator=`` does
+        """
+        keys = set()
+        for key in self.get('registry'):
+            if not key.startswith(prefix):
+                continue
+            if separator and separator in key[len(prefix):]:
+                key = key[:key.index(separator, len(prefix)) + len(separator)]
+            keys.add(key)
+        return sorted(keys)
+
+    def health(self, node=None, service=None):
+        """Checks in any states, only the ones of the given node and service
+        name if set, so clients do not receive the whole health state
+        """
+        return [
+            state for state in self.get('health')
+            if (not node or state['Node'] == node) and
+            (not service or state['ServiceName'] == service)
+        ]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = {'result': self.server.state.answer(
+                request['method'], **(request.get('params') or {})
+            )}
+        except Exception as err:
+            logger.warning("Request failed: %s", err)
+            response = {'error': str(err) or err.__class__.__name__}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon:
+    """Serve consul data of a cluster on a unix socket only readable by its
+    user
+
+    :param cluster: :py:class:`cluster.cluster.Cluster` to serve
+    :param path: unix socket path
+    :param wait: max duration of blocking queries
+    """
+
+    def __init__(self, cluster, path, wait=watch.DEFAULT_WAIT):
+        self.path = path
+        self.state = State(cluster.consul, wait=wait)
+        self._server = None
+
+    def start(self):
+        """Load consul data then listen on the socket"""
+        try:
+            Client(self.path).call('ping')
+        except DaemonError:
+            pass
+        else:
+            raise RuntimeError(
+                "A daemon is already listening on {}".format(self.path)
+            )
+        self.state.load()
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            # left by a daemon that was killed
+            os.unlink(self.path)
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.state = self.state
+        self.state.watch()
+
+    def serve_forever(self, poll_interval=0.5):
+        self._server.serve_forever(poll_interval=poll_interval)
+
+    def shutdown(self):
+        """Stop :py:meth:`serve_forever` running in another thread"""
+        self._server.shutdown()
+
+    def close(self):
+        self.state.stop()
+        self._server.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class Client:
+    """Daemon client, a connection is opened per call
+
+    :param path: unix socket path
+    :param timeout: max time in second to wait an answer
+    """
+
+    def __init__(self, path, timeout=DEFAULT_CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def call(self, method, **params):
+        """:return: the daemon answer
+        :raise DaemonError: if the daemon is not running or fails
+        """
+        request = json.dumps({'method': method, 'params': params})
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                sock.sendall(request.encode('utf-8') + b'\n')
+                with sock.makefile('rb') as response_file:
+                    response = json.loads(
+                        response_file.readline().decode('utf-8')
+                    )
+        except (OSError, ValueError) as err:
+            raise DaemonError(
+                "No daemon answer on {}: {}".format(self.path, err)
+            )
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response['result']
@@ -0,0 +1,465 @@
+"""In-process consul http api stand-in to run the client against real http
+requests without a cluster (integration tests, benchmarks).
+
+It implements the api subset used by the client: kv (including
+``?recurse``, ``?keys``, ``?separator`` and blocking queries), read-only
+transactions, catalog nodes / datacenters, health checks and event fire.
+Blocking queries of catalog nodes and health checks answer on any change
+of the fake consul index.
+Fired ``deploy`` and ``migrate`` events are consumed as the cluster would:
+the app ``deploy_date`` is updated, its service passing check registered on
+its master node and the ``maintenance/`` key is set then removed::
+
+    with FakeConsul(nodes=['node-1', 'node-2']) as consul:
+        consul.put_app('ssh://git.example.org/ns/repo', 'prod', 'node-1')
+        Cluster(consul.url).deploy('repo', 'prod', ask_user=False)
+"""
+import base64
+import collections
+import json
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib import parse
+
+from cluster import stats
+from cluster.cluster import app_key
+from cluster.cluster import service_id
+
+DEPLOY_DATE_FORMAT = '%Y-%m-%dT%H%M%S.%f'
+MAX_WAIT = 600
+
+
+def _duration(wait):
+    units = [('ms', 0.001), ('s', 1), ('m', 60), ('h', 3600)]
+    for unit, factor in units:
+        if wait.endswith(unit):
+            return min(float(wait[:-len(unit)]) * factor, MAX_WAIT)
+    return min(float(wait), MAX_WAIT)
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients giving up slow requests are not errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive connections as consul does
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        consul = self.server.consul
+        # requests are accounted on arrival, so blocking queries are not
+        # accounted to what is running when they end
+        consul.record(method, self.path)
+        url = parse.urlsplit(self.path)
+        query = parse.parse_qs(url.query, keep_blank_values=True)
+        query = {key: values[-1] for key, values in query.items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        path = url.path[len('/v1/'):] if url.path.startswith('/v1/') else ''
+        if consul.latency:
+            time.sleep(consul.latency)
+        status, index, payload = consul.handle(method, path, query, body)
+        if isinstance(payload, bytes):
+            data = payload
+        else:
+            data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if index is not None:
+            self.send_header('X-Consul-Index', str(index))
+        self.end_headers()
+        # accounted before the client gets the response
+        consul.record_bytes(len(data))
+        self.wfile.write(data)
+
+
+class FakeConsul:
+    """Fake consul agent served on a random local port
+
+    :param nodes: catalog node names
+    :param datacenter: datacenter name, requests for other datacenters are
+        forwarded to fake consuls added with :py:meth:`add_datacenter`
+    :param latency: time in second added to every request
+    :param agent_delay: time in second the cluster takes to consume events,
+        events are never consumed if None
+    :param maintenance_duration: time in second the maintenance key is kept
+        while consuming a migrate event
+    """
+
+    def __init__(
+            self,
+            nodes=('node-1', 'node-2', 'node-3', 'node-4'),
+            datacenter='dc1',
+            latency=0,
+            agent_delay=0.05,
+            maintenance_duration=0.1
+    ):
+        self.nodes = list(nodes)
+        self.datacenter = datacenter
+        self.latency = latency
+        self.agent_delay = agent_delay
+        self.maintenance_duration = maintenance_duration
+        self.checks = []
+        self.events = []
+        self.remotes = {}
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        self._kv = {}
+        self._tombstones = {}
+        self._index = 1
+        self._changed = threading.Condition()
+        self._stopped = False
+        self._server = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.consul = self
+        threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True
+        ).start()
+        return self.url
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            # release blocking queries
+            self._changed.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record(self, method, path):
+        with self._lock:
+            self.requests[stats.endpoint(method, path)] += 1
+
+    def record_bytes(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def add_datacenter(self, remote):
+        """Forward requests of ``remote`` datacenter to the given fake
+        consul, which does not need to be started
+        """
+        self.remotes[remote.datacenter] = remote
+
+    # data helpers
+    def put(self, key, value):
+        if not isinstance(value, bytes):
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            value = value.encode('utf-8')
+        with self._changed:
+            self._index += 1
+            entry = self._kv.get(key)
+            self._kv[key] = {
+                'Key': key,
+                'Value': value,
+                'Flags': 0,
+                'LockIndex': 0,
+                'CreateIndex': entry['CreateIndex'] if entry else self._index,
+                'ModifyIndex': self._index,
+            }
+            self._tombstones.pop(key, None)
+            self._changed.notify_all()
+
+    def delete(self, key, recurse=False):
+        with self._changed:
+            keys = [
+                k for k in self._kv
+                if k == key or (recurse and k.startswith(key))
+            ]
+            if not keys:
+                return
+            self._index += 1
+            for k in keys:
+                del self._kv[k]
+                self._tombstones[k] = self._index
+            self._changed.notify_all()
+
+    def get(self, key):
+        entry = self._kv.get(key)
+        return json.loads(entry['Value'].decode('utf-8')) if entry else None
+
+    def put_app(self, repo_url, branch, master, slave=None, **extra):
+        """Register an app as the cluster would do after a deploy
+
+        :return: the app kv key
+        """
+        key = app_key(repo_url, branch)
+        value = {
+            'repo_url': repo_url,
+            'branch': branch,
+            'master': master,
+            'slave': slave,
+            'deploy_date': datetime.now().strftime(DEPLOY_DATE_FORMAT),
+            'deploy_id': str(uuid.uuid4()),
+            'previous_deploy_id': None,
+        }
+        value.update(extra)
+        self.put(key, value)
+        return key
+
+    def add_check(
+            self, node, name, status='passing', service_id='',
+            service_name='', output=''
+    ):
+        with self._changed:
+            self._index += 1
+            self.checks.append({
+                'Node': node,
+                'CheckID': '{}:{}'.format(service_id or 'node', name),
+                'Name': name,
+                'Status': status,
+                'Output': output,
+                'ServiceID': service_id,
+                'ServiceName': service_name,
+            })
+            self._changed.notify_all()
+
+    def _register_service(self, node, service):
+        """Move the service check to the given node"""
+        with self._changed:
+            self.checks = [
+                check for check in self.checks
+                if check['ServiceID'] != service
+            ]
+        self.add_check(
+            node, 'Service check', service_id=service, service_name=service
+        )
+
+    # http api
+    def handle(self, method, path, query, body):
+        datacenter = query.get('dc')
+        if datacenter and datacenter != self.datacenter:
+            remote = self.remotes.get(datacenter)
+            if remote is None:
+                return 500, None, b'No path to datacenter'
+            if remote.latency:
+                time.sleep(remote.latency)
+            return remote.handle(method, path, {
+                key: value for key, value in query.items() if key != 'dc'
+            }, body)
+        parts = path.split('/', 1)
+        route = parts[0]
+        rest = parts[1] if len(parts) > 1 else ''
+        if route == 'kv':
+            return self._handle_kv(method, rest, query, body)
+        if route == 'txn' and method == 'PUT':
+            return self._handle_txn(json.loads(body.decode('utf-8')))
+        if route == 'catalog' and rest == 'nodes':
+            self._block(query)
+            return 200, self._index, [
+                {'Node': node, 'Address': '127.0.0.1',
+                 'Datacenter': self.datacenter}
+                for node in self.nodes
+            ]
+        if route == 'catalog' and rest == 'datacenters':
+            return 200, None, sorted([self.datacenter] + list(self.remotes))
+        if route == 'health':
+            self._block(query)
+            return self._handle_health(rest)
+        if route == 'event' and rest.startswith('fire/') and method == 'PUT':
+            return self._handle_event(rest[len('fire/'):], body)
+        return 404, None, b'Not found'
+
+    def _handle_kv(self, method, key, query, body):
+        if method == 'PUT':
+            self.put(key, body)
+            return 200, self._index, True
+        if method == 'DELETE':
+            self.delete(key, recurse='recurse' in query)
+            return 200, self._index, True
+        index = int(query.get('index') or 0)
+        wait = _duration(query.get('wait') or '5m')
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                recurse = 'recurse' in query or 'keys' in query
+                entries = [
+                    entry for k, entry in sorted(self._kv.items())
+                    if (k.startswith(key) if recurse else k == key)
+                ]
+                current = self._kv_index(key, recurse, entries)
+                remaining = deadline - time.monotonic()
+                if (
+                    not index or current > index or remaining <= 0 or
+                    self._stopped
+                ):
+                    break
+                self._changed.wait(remaining)
+        if not entries:
+            return 404, current, b''
+        if 'keys' in query:
+            separator = query.get('separator')
+            keys = []
+            for entry in entries:
+                k = entry['Key']
+                if separator and separator in k[len(key):]:
+                    k = k[:k.index(separator, len(key)) + len(separator)]
+                if k not in keys:
+                    keys.append(k)
+            return 200, current, keys
+        if 'raw' in query:
+            return 200, current, entries[0]['Value']
+        return 200, current, [self._encode(entry) for entry in entries]
+
+    def _block(self, query):
+        """Wait the fake consul index is greater than the ``index`` query
+        param or ``wait`` is elapsed
+        """
+        index = int(query.get('index') or 0)
+        deadline = time.monotonic() + _duration(query.get('wait') or '5m')
+        with self._changed:
+            while index and self._index <= index and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+
+    def _kv_index(self, key, recurse, entries):
+        indexes = [entry['ModifyIndex'] for entry in entries] + [
+            index for k, index in self._tombstones.items()
+            if (k.startswith(key) if recurse else k == key)
+        ]
+        return max(indexes) if indexes else self._index
+
+    @staticmethod
+    def _encode(entry):
+        entry = dict(entry)
+        entry['Value'] = base64.b64encode(entry['Value']).decode('ascii')
+        return entry
+
+    def _handle_txn(self, operations):
+        results = []
+        with self._changed:
+            for position, operation in enumerate(operations):
+                verb = operation['KV']['Verb']
+                key = operation['KV']['Key']
+                if verb == 'get-tree':
+                    results.extend(
+                        {'KV': self._encode(entry)}
+                        for k, entry in sorted(self._kv.items())
+                        if k.startswith(key)
+                    )
+                elif verb == 'get' and key in self._kv:
+                    results.append({'KV': self._encode(self._kv[key])})
+                else:
+                    return 409, None, {'Results': None, 'Errors': [{
+                        'OpIndex': position,
+                        'What': 'unsupported verb or missing key',
+                    }]}
+            index = self._index
+        return 200, index, {'Results': results, 'Errors': None}
+
+    def _handle_health(self, path):
+        kind, _, value = path.partition('/')
+        if kind == 'state':
+            checks = [
+                check for check in self.checks
+                if value == 'any' or check['Status'] == value
+            ]
+        elif kind == 'node':
+            checks = [
+                check for check in self.checks if check['Node'] == value
+            ]
+        elif kind == 'checks':
+            checks = [
+                check for check in self.checks
+                if check['ServiceName'] == value
+            ]
+        else:
+            return 404, None, b'Not found'
+        return 200, self._index, checks
+
+    def _handle_event(self, name, payload):
+        event = {
+            'ID': str(uuid.uuid4()),
+            'Name': name,
+            'Payload': base64.b64encode(payload).decode('ascii'),
+            'NodeFilter': '',
+            'ServiceFilter': '',
+            'TagFilter': '',
+            'Version': 1,
+            'LTime': len(self.events) + 1,
+        }
+        self.events.append((name, payload))
+        if self.agent_delay is None:
+            return 200, None, event
+        timer = threading.Timer(
+            self.agent_delay, self._consume, args=(name, payload)
+        )
+        timer.daemon = True
+        timer.start()
+        return 200, None, event
+
+    def _consume(self, name, payload):
+        payload = json.loads(payload.decode('utf-8'))
+        if name == 'deploy':
+            key = app_key(payload['repo'], payload['branch'])
+            previous = self.get(key) or {}
+            self.put(key, {
+                'repo_url': payload['repo'],
+                'branch': payload['branch'],
+                'master': payload['master'],
+                'slave': payload['slave'],
+                'deploy_date': datetime.now().strftime(DEPLOY_DATE_FORMAT),
+                'deploy_id': str(uuid.uuid4()),
+                'previous_deploy_id': previous.get('deploy_id'),
+            })
+            self._register_service(payload['master'], service_id(key))
+        elif name == 'migrate':
+            key = app_key(
+                payload['target']['repo'], payload['target']['branch']
+            ).replace('app/', 'maintenance/', 1)
+            self.put(key, '')
+            timer = threading.Timer(
+                self.maintenance_duration, self.delete, args=(key, )
+            )
+            timer.daemon = True
+            timer.start()
@@ -0,0 +1,131 @@
+"""Apps placement over cluster nodes: master load per node and rebalancing
+plans computed from a :py:class:`cluster.registry.NodeIndex`
+"""
+
+
+def app_weight(app, weight=None):
+    """Load an app puts on its master node
+
+    :param weight: registry field holding the app weight, every app weights
+        1 if not set or if the app has no valid weight
+    """
+    if not weight:
+        return 1
+    value = getattr(app, weight, None)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 1
+    return value if value >= 0 else 1
+
+
+def node_loads(index, nodes, weight=None):
+    """:return: a dict of master load per node"""
+    return {
+        node: sum(
+            app_weight(index.apps[key], weight) for key in index.masters[node]
+        )
+        for node in nodes
+    }
+
+
+def imbalance(loads):
+    """Difference between the most and the least loaded nodes"""
+    if not loads:
+        return 0
+    return max(loads.values()) - min(loads.values())
+
+
+def plan_rebalance(index, nodes, weight=None):
+    """Plan moves of masters from the most to the least loaded node until
+    no move reduces their load difference. Each app is moved once at most;
+    replicated apps are preferably switched with their slave when it is on
+    the least loaded node, otherwise slaves are kept so master and slave
+    nodes stay different.
+
+    :return: a tuple ``(moves, loads)``, ``moves`` is a list of
+        ``(key, master, slave)`` and ``loads`` the master load per node
+        once moves are done
+    """
+    loads = node_loads(index, nodes, weight)
+    masters = {node: set(index.masters[node]) for node in nodes}
+    moves = []
+    moved = set()
+    while len(loads) > 1:
+        high = max(sorted(loads), key=lambda node: loads[node])
+        low = min(sorted(loads), key=lambda node: loads[node])
+        gap = loads[high] - loads[low]
+        candidates = []
+        for key in masters[high] - moved:
+            app = index.apps[key]
+            app_load = app_weight(app, weight)
+            if 0 < app_load < gap:
+                # the closest to half the gap the better, then switches
+                candidates.append(
+                    (abs(gap - 2 * app_load), app.slave != low, key)
+                )
+        if not candidates:
+            break
+        _, _, key = min(candidates)
+        app = index.apps[key]
+        slave = high if app.slave == low else app.slave
+        moves.append((key, low, slave))
+        moved.add(key)
+        masters[high].remove(key)
+        masters[low].add(key)
+        app_load = app_weight(app, weight)
+        loads[high] -= app_load
+        loads[low] += app_load
+    return moves, loads
+
+
+def node_scores(index, nodes, checks):
+    """Score nodes to place a new service
+
+    :param checks: failing checks per node as returned by
+        :py:meth:`cluster.cluster.Cluster.checks`
+    :return: a dict of ``{'masters': .., 'slaves': .., 'failing': ..,
+        'node_failing': ..}`` per node, the number of master apps, slave
+        apps, failing checks of services and failing node checks (ie:
+        ``serfHealth``, not bound to a service)
+    """
+    scores = {}
+    for node in nodes:
+        services = checks.get(node, {})
+        scores[node] = {
+            'masters': len(index.masters[node]),
+            'slaves': len(index.slaves[node]),
+            'failing': sum(
+                len(service['checks'])
+                for service_id, service in services.items() if service_id
+            ),
+            'node_failing': len(services.get('', {}).get('checks', [])),
+        }
+    return scores
+
+
+def auto_place(scores):
+    """Choose nodes of a new service among nodes without failing node
+    checks: the master is the node hosting the fewest masters, the slave
+    another node hosting the fewest slaves. Ties are broken by the number
+    of failing service checks, then by the other count and by name:
+    services of other apps failing do not exclude a node.
+
+    :param scores: as returned by :py:func:`node_scores`
+    :return: a tuple ``(master, slave)``, slave is None if there is a
+        single healthy node
+    """
+    healthy = sorted(
+        node for node in scores if not scores[node]['node_failing']
+    )
+    if not healthy:
+        raise RuntimeError("No healthy node to place the service")
+    master = min(healthy, key=lambda node: (
+        scores[node]['masters'], scores[node]['failing'],
+        scores[node]['slaves'], node
+    ))
+    slaves = [node for node in healthy if node != master]
+    if not slaves:
+        return master, None
+    return master, min(slaves, key=lambda node: (
+        scores[node]['slaves'], scores[node]['failing'],
+        scores[node]['masters'], node
+    ))
@@ -0,0 +1,104 @@
+"""App registry (``app/`` kv prefix) local cache and indexes"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir():
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'cluster-cli'
+    )
+
+
+class RegistryCache:
+    """Kv values of a prefix stored on disk with the consul index they were
+    read at, so they can be revalidated comparing indexes.
+
+    The file modification time is the last time values were known to be
+    up to date.
+    """
+
+    def __init__(self, cache_dir, consul_url, prefix='app/'):
+        self.path = os.path.join(
+            cache_dir,
+            '{}-{}.json'.format(
+                hashlib.md5(consul_url.encode('utf-8')).hexdigest(),
+                prefix.strip('/')
+            )
+        )
+
+    def load(self):
+        """:return: a tuple ``(index, age, values)`` or None if there is no
+            usable cache
+        """
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+            age = time.time() - os.path.getmtime(self.path)
+        except (OSError, ValueError) as err:
+            logger.debug("Registry cache %s not usable: %s", self.path, err)
+            return None
+        return data['index'], age, data['values']
+
+    def save(self, index, values):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as cache_file:
+                json.dump({'index': index, 'values': values}, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logger.warning(
+                "Can't write registry cache %s: %s", self.path, err
+            )
+
+    def touch(self):
+        try:
+            os.utime(self.path)
+        except OSError as err:
+            logger.warning(
+                "Can't touch registry cache %s: %s", self.path, err
+            )
+
+
+def repo_branches(values):
+    """Branches per repo name, as commands take them, of registry values
+
+    :param values: a dict of json values per kv key, values which are not
+        apps are ignored
+    """
+    branches = collections.defaultdict(set)
+    for value in values.values():
+        try:
+            app = json.loads(value)
+            repo_url = app['repo_url']
+        except (TypeError, ValueError, KeyError):
+            continue
+        branches[os.path.basename(repo_url.strip('/').lower())].add(
+            app.get('branch') or ''
+        )
+    return {repo: sorted(names) for repo, names in branches.items()}
+
+
+class NodeIndex:
+    """Apps per node built in a single pass over apps
+
+    :param apps: a dict of decoded apps per kv key
+    """
+
+    def __init__(self, apps):
+        self.apps = apps
+        self.masters = collections.defaultdict(list)
+        self.slaves = collections.defaultdict(list)
+        for key in sorted(apps):
+            app = apps[key]
+            self.masters[getattr(app, 'master', None)].append(key)
+            slave = getattr(app, 'slave', None)
+            if slave:
+                self.slaves[slave].append(key)
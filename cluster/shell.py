@@ -0,0 +1,127 @@
+"""Interactive shell running commands against a single long-lived cluster,
+so connections, nodes and the app registry are reused from a command to the
+next one::
+
+    $ cluster shell
+    cluster> inspect node-1
+    cluster> move-masters-from node-1
+    cluster> refresh
+"""
+import cmd
+import shlex
+import sys
+
+from cluster import completion
+from cluster import registry
+
+# commands changing the app registry, apps kept in memory are dropped once
+# they ran
+REGISTRY_COMMANDS = {'deploy', 'migrate', 'move-masters-from', 'rebalance'}
+
+
+class Shell(cmd.Cmd):
+    """
+    :param cluster: :py:class:`cluster.cluster.Cluster` shared by commands
+    :param run: callable running a command given as a list of arguments
+    :param parsers: a dict of argparse parsers per command run by ``run``
+    """
+
+    prompt = 'cluster> '
+    intro = 'Type help or ? to list commands, exit or ^D to leave.'
+    # command names contain dashes
+    identchars = cmd.Cmd.identchars + '-'
+
+    def __init__(self, cluster, run, parsers, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.cluster = cluster
+        self.run = run
+        self.parsers = parsers
+
+    def preloop(self):
+        try:
+            import readline
+        except ImportError:
+            return
+        # node names and options contain dashes
+        readline.set_completer_delims(' \t\n')
+
+    def emptyline(self):
+        # the default repeats the last command
+        pass
+
+    def default(self, line):
+        try:
+            argv = shlex.split(line)
+        except ValueError as err:
+            print("Error: {}".format(err), file=sys.stderr)
+            return
+        if argv[0] not in self.parsers:
+            print("Unknown command: {}".format(argv[0]), file=sys.stderr)
+            return
+        try:
+            self.run(argv)
+        except SystemExit:
+            # usage errors and --help are already displayed
+            pass
+        except KeyboardInterrupt:
+            print("Interrupted", file=sys.stderr)
+        except Exception as err:
+            print("Error: {}".format(err), file=sys.stderr)
+        finally:
+            if argv[0] in REGISTRY_COMMANDS:
+                self.cluster.refresh()
+
+    def do_refresh(self, arg):
+        """Fetch nodes and apps again on next command"""
+        self.cluster.refresh()
+
+    def do_exit(self, arg):
+        """Leave the shell"""
+        return True
+
+    def do_EOF(self, arg):
+        print()
+        return True
+
+    def do_help(self, arg):
+        """List commands or display the help of a command"""
+        if arg in self.parsers:
+            self.parsers[arg].print_help()
+            return
+        super().do_help(arg)
+        if not arg:
+            print("Cluster commands (<command> -h for details):")
+            for name in sorted(self.parsers):
+                print("  {}".format(name))
+
+    def get_names(self):
+        # ^D is not a command to list
+        return [name for name in super().get_names() if name != 'do_EOF']
+
+    def completenames(self, text, *ignored):
+        names = [
+            name[len('do_'):] for name in self.get_names()
+            if name.startswith('do_')
+        ] + list(self.parsers)
+        return sorted(name for name in names if name.startswith(text))
+
+    def completedefault(self, text, line, begidx, endidx):
+        words = line[:begidx].split()
+        if not words or words[0] not in self.parsers:
+            return []
+        try:
+            return completion.candidates(
+                self.parsers[words[0]],
+                words[0],
+                words[1:],
+                text,
+                lambda: self.cluster.nodes,
+                lambda: registry.repo_branches(
+                    self.cluster.get_kv_registry()
+                )
+            )
+        except Exception:
+            # completion must not break the prompt (ie: consul unreachable)
+            return []
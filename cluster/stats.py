@@ -0,0 +1,140 @@
+"""Command phases timings and consul requests accounting (``--stats``)"""
+import collections
+import contextlib
+import math
+import threading
+import time
+
+from urllib import parse
+
+# phases in the order they happen while deploying / migrating a service
+PHASES = [
+    'resolve',
+    'validate',
+    'fire',
+    'wait-until-kv-changed',
+    'wait-maintenance-on',
+    'wait-maintenance-off',
+    'wait-healthy',
+]
+PERCENTILES = [50, 90, 99]
+
+
+def endpoint(method, url):
+    """Consul api endpoint name of a request (ie: ``GET health/state``),
+    kv blocking queries are accounted apart
+    """
+    url = parse.urlsplit(url)
+    parts = url.path.split('/')[2:]  # drop '' and 'v1'
+    # parts is empty for the root url (ie: ``/`` or ``/v1``)
+    if parts[:1] in (['kv'], ['txn']):
+        name = parts[0]
+    else:
+        name = '/'.join(parts[:2]) or '/'
+    if 'index' in parse.parse_qs(url.query):
+        name += ' (blocking)'
+    return '{} {}'.format(method, name)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``"""
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Stats:
+    """Thread safe accumulator of phases durations and consul requests.
+
+    Phases run by parallel workers are summed up, so phases total time can
+    be greater than the command wall time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._phases = collections.defaultdict(lambda: [0, 0.])
+        self._latencies = collections.defaultdict(list)
+        self._bytes = collections.Counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.monotonic() - start)
+
+    def add_phase(self, name, duration):
+        with self._lock:
+            self._phases[name][0] += 1
+            self._phases[name][1] += duration
+
+    def record(self, method, url, size, latency):
+        """Account a consul response
+
+        :param size: response body size in bytes
+        :param latency: time in second to get the response
+        """
+        name = endpoint(method, url)
+        with self._lock:
+            self._latencies[name].append(latency)
+            self._bytes[name] += size
+
+    def report(self):
+        """:return: a json serializable dict of collected stats"""
+        with self._lock:
+            phases = collections.OrderedDict(
+                (name, {
+                    'count': self._phases[name][0],
+                    'time': round(self._phases[name][1], 6),
+                })
+                for name in PHASES + sorted(set(self._phases) - set(PHASES))
+                if name in self._phases
+            )
+            requests = collections.OrderedDict()
+            for name in sorted(self._latencies):
+                latencies = sorted(self._latencies[name])
+                requests[name] = {
+                    'count': len(latencies),
+                    'bytes': self._bytes[name],
+                }
+                for percent in PERCENTILES:
+                    requests[name]['p{}'.format(percent)] = round(
+                        percentile(latencies, percent), 6
+                    )
+                requests[name]['max'] = round(latencies[-1], 6)
+        return {
+            'wall_time': round(time.monotonic() - self._start, 6),
+            'phases': phases,
+            'requests': requests,
+            'total': {
+                'count': sum(r['count'] for r in requests.values()),
+                'bytes': sum(r['bytes'] for r in requests.values()),
+            },
+        }
+
+    def format(self):
+        """:return: a human readable report"""
+        report = self.report()
+        lines = ["Wall time: {:.3f}s".format(report['wall_time']), "Phases:"]
+        for name, phase in report['phases'].items():
+            lines.append(" - {}: {:.3f}s ({} times)".format(
+                name, phase['time'], phase['count']
+            ))
+        lines.append("Consul requests:")
+        for name, request in report['requests'].items():
+            lines.append(
+                " - {}: {} requests, {} bytes, latency {}".format(
+                    name, request['count'], request['bytes'], ' '.join(
+                        '{}={:.3f}s'.format(key, request[key])
+                        for key in ['p{}'.format(p) for p in PERCENTILES] +
+                        ['max']
+                    )
+                )
+            )
+        lines.append("Total: {} requests, {} bytes received".format(
+            report['total']['count'], report['total']['bytes']
+        ))
+        return "\n".join(lines)
@@ -1,4 +1,8 @@
 import json
+import os
+import tempfile
+import threading
+
 from unittest import mock, TestCase
 
 from cluster.cluster import Cluster
@@ -19,8 +23,30 @@ class ClusterTestCase(TestCase):
                 {'Node': 'node-2', },
                 {'Node': 'node-3', },
                 {'Node': 'node-4', },
-            ]
+            ],
+            # indexed queries use data given to the kv.find mock
+            'kv.find_index.side_effect': lambda prefix: (
+                1, self.mocked_consul.kv.find(prefix)
+            ),
+            'kv.keys_index.side_effect': lambda prefix, separator=None: (
+                1, list(self.mocked_consul.kv.find(prefix))
+            ),
+            # streamed queries use data given to non streamed mocks
+            'kv.iter_find.side_effect': lambda prefix: iter(
+                self.mocked_consul.kv.find(prefix).items()
+            ),
+            'health.iter_state.side_effect': lambda state: iter(
+                self.mocked_consul.health.state(state)
+            ),
+        })
+        # do not use user's registry cache nor daemon while running command
+        # line
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.env_patch = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': self.cache_dir.name,
+            'XDG_RUNTIME_DIR': self.cache_dir.name,
         })
+        self.env_patch.start()
         self.cluster_patch.start()
         self.cluster = Cluster('http://fake.host')
 
@@ -46,20 +72,22 @@ class ClusterTestCase(TestCase):
         value.update(extra)
         return value
 
+    def get_mock_apps(self, data):
+        qualif_data = data.copy()
+        qualif_data['branch'] = 'qualif'
+        prod_data = data.copy()
+        prod_data['branch'] = 'prod'
+        return {
+            "app/repo-name_branch-name.739a5": json.dumps(data),
+            "app/migrate-repo_qualif.12345": json.dumps(qualif_data),
+            "app/migrate-repo_prod.12345": json.dumps(prod_data),
+        }
+
     def init_mock_kv_find(self, data):
 
         def kv_find(search_key):
-            qualif_data = data.copy()
-            qualif_data['branch'] = 'qualif'
-            prod_data = data.copy()
-            prod_data['branch'] = 'prod'
-            cases = {
-                "app/repo-name_branch-name.739a5": json.dumps(data),
-                "app/migrate-repo_qualif.12345": json.dumps(qualif_data),
-                "app/migrate-repo_prod.12345": json.dumps(prod_data),
-            }
             result = dict()
-            for key, value in cases.items():
+            for key, value in self.get_mock_apps(data).items():
                 if key.startswith(search_key):
                     result[key] = value
             return result
@@ -69,12 +97,51 @@ class ClusterTestCase(TestCase):
         })
 
     def init_mock_kv_get(self, data):
+        # apps are read with their own value, other keys get ``data``
+        self.mocked_consul.configure_mock(**{
+            'kv.get.side_effect': lambda key: self.get_mock_apps(data).get(
+                key, json.dumps(data)
+            )
+        })
+
+    def init_mock_kv_watch(self, records):
+        """Mock kv watch so each blocking query notify a change, states are
+        built calling ``records(keys)`` which returns records per key: the
+        nth blocking query of a key gets its record of the nth state, polls
+        read the next state.
+        """
+        states = []
+        polls = []
+        lock = threading.Lock()
+
+        def state(number, keys):
+            # keys are followed by concurrent threads
+            with lock:
+                while len(states) <= number:
+                    states.append(records(keys))
+                return states[number]
+
+        def watched_keys(key):
+            app_key = key.replace('maintenance/', 'app/', 1)
+            return [app_key, app_key.replace('app/', 'maintenance/', 1)]
+
+        def kv_get_record_index(key, index=None, wait=None):
+            index = (index or 0) + 1
+            return index, state(index - 1, watched_keys(key))[key]
+
+        def txn_get_records(keys):
+            polls.append(keys)
+            return 1, state(len(polls) - 1, keys)
+
         self.mocked_consul.configure_mock(**{
-            'kv.get.return_value': json.dumps(data)
+            'kv.get_record_index.side_effect': kv_get_record_index,
+            'txn.get_records.side_effect': txn_get_records,
         })
 
     def tearDown(self):
         self.cluster_patch.stop()
+        self.env_patch.stop()
+        self.cache_dir.cleanup()
 
 
 class Counter:
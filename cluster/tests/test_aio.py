@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import unittest
+
+from unittest import mock
+
+from cluster import cluster
+from cluster.aio import AsyncCluster
+from cluster.fake_consul import FakeConsul
+from cluster.tests.cluster_test_case import ClusterTestCase
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+def run_async(*coroutines):
+    async def run():
+        return await asyncio.gather(*coroutines)
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    return results if len(coroutines) > 1 else results[0]
+
+
+class TestAsyncCluster(ClusterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.aio = AsyncCluster(self.cluster, max_workers=4)
+
+    def tearDown(self):
+        self.aio.close()
+        super().tearDown()
+
+    def test_nodes(self):
+        self.assertEqual(
+            run_async(self.aio.nodes()),
+            ['node-1', 'node-2', 'node-3', 'node-4']
+        )
+
+    def test_checks(self):
+        with mock.patch(
+                'cluster.cluster.Cluster.checks', return_value={'n': {}}
+        ) as mo:
+            self.assertEqual(run_async(self.aio.checks(all=True)), {'n': {}})
+            mo.assert_called_once_with(all=True)
+
+    def test_gather_limit(self):
+        running = []
+        max_running = []
+
+        async def command(value):
+            running.append(value)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(value)
+            if value == 3:
+                raise RuntimeError("failed")
+            return value
+
+        results = run_async(self.aio.gather(
+            *[command(value) for value in range(6)], limit=2
+        ))
+        self.assertEqual(results[:3], [0, 1, 2])
+        self.assertIsInstance(results[3], RuntimeError)
+        self.assertEqual(max(max_running), 2)
+
+
+class TestAsyncClusterFakeConsul(unittest.TestCase):
+    """Drive many commands against the fake consul"""
+
+    def setUp(self):
+        self.fake = FakeConsul(
+            nodes=['node-1', 'node-2', 'node-3'],
+            agent_delay=0.05,
+            maintenance_duration=0.3
+        )
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.branches = ['b{}'.format(i) for i in range(10)]
+        for branch in self.branches:
+            self.fake.put_app(REPO_URL, branch, 'node-1', 'node-2')
+        self.aio = AsyncCluster(cluster.Cluster(self.fake.url))
+        self.addCleanup(self.aio.close)
+
+    def watch_threads(self):
+        return sorted(
+            thread.name for thread in threading.enumerate()
+            if 'watch' in thread.name
+        )
+
+    def test_deploy(self):
+        threads = set()
+
+        async def deploy_all():
+            deployments = asyncio.gather(*[
+                self.aio.deploy('repo-name', branch, timeout=5)
+                for branch in self.branches
+            ])
+            while not deployments.done():
+                threads.update(self.watch_threads())
+                await asyncio.sleep(0.01)
+            return await deployments
+
+        run_async(deploy_all())
+        for branch in self.branches:
+            app = self.fake.get(cluster.app_key(REPO_URL, branch))
+            self.assertEqual(app['master'], 'node-2')
+        # every deployment is waited by a single thread
+        self.assertEqual(threads, {'shared watch'})
+        self.aio.close()
+        self.assertEqual(self.watch_threads(), [])
+
+    def test_deploy_timeout(self):
+        self.fake.agent_delay = 2
+        with self.assertRaises(TimeoutError):
+            run_async(self.aio.deploy('repo-name', 'b1', timeout=0.3))
+
+    def test_deploy_no_wait(self):
+        run_async(self.aio.deploy('repo-name', 'b1', no_wait=True))
+        self.assertEqual(self.fake.events[0][0], 'deploy')
+        self.assertIsNone(self.aio._watch)
+
+    def test_migrate(self):
+        run_async(
+            self.aio.migrate('repo-name', 'b1', 'b2', timeout=5),
+            self.aio.migrate('repo-name', 'b1', 'b3', timeout=5),
+        )
+        self.assertEqual(
+            [name for name, _ in self.fake.events], ['migrate', 'migrate']
+        )
+
+    def test_move_masters_from(self):
+        results = run_async(self.aio.move_masters_from(
+            'node-1', timeout=5, parallel=4, max_per_node=2
+        ))
+        self.assertEqual(len(results), 10)
+        self.assertEqual([error for _, error in results if error], [])
+        self.assertEqual(
+            {deployment.master for deployment, _ in results}, {'node-2'}
+        )
+        for branch in self.branches:
+            app = self.fake.get(cluster.app_key(REPO_URL, branch))
+            self.assertEqual(app['master'], 'node-2')
@@ -0,0 +1,289 @@
+import consulate
+import unittest
+
+from unittest import mock
+
+from cluster import api
+from cluster import consul_api
+
+
+class TestKVGetRecordIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = mock.MagicMock()
+        self.kv = consul_api.KV('http://fake.host:8500/v1', self.adapter)
+
+    def test_blocking_query(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body={'Key': 'app/key', 'Value': 'value'},
+            headers={'X-Consul-Index': '12'}
+        )
+        self.assertEqual(
+            self.kv.get_record_index('app/key', index=10, wait='5s'),
+            (12, {'Key': 'app/key', 'Value': 'value'})
+        )
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/kv/app/key?index=10&wait=5s'
+        )
+
+    def test_missing_key(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=404,
+            body='',
+            headers={'X-Consul-Index': '3'}
+        )
+        self.assertEqual(self.kv.get_record_index('app/key'), (3, None))
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/kv/app/key'
+        )
+
+
+class TestKVIndexedFind(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = mock.MagicMock()
+        self.kv = consul_api.KV('http://fake.host:8500/v1', self.adapter)
+
+    def test_find_index(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body=[
+                {'Key': 'app/key1', 'Value': 'value1'},
+                {'Key': 'app/key2', 'Value': 'value2'},
+            ],
+            headers={'X-Consul-Index': '7'}
+        )
+        self.assertEqual(
+            self.kv.find_index('app/'),
+            (7, {'app/key1': 'value1', 'app/key2': 'value2'})
+        )
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/kv/app/?recurse=None'
+        )
+
+    def test_find_index_blocking_query(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body={'Key': 'app/key1', 'Value': 'value1'},
+            headers={'X-Consul-Index': '8'}
+        )
+        self.assertEqual(
+            self.kv.find_index('app/', index=7, wait='5s'),
+            (8, {'app/key1': 'value1'})
+        )
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/kv/app/?recurse=None&index=7&wait=5s'
+        )
+
+    def test_find_index_single_key(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body={'Key': 'app/key1', 'Value': 'value1'},
+            headers={'X-Consul-Index': '7'}
+        )
+        self.assertEqual(
+            self.kv.find_index('app/'), (7, {'app/key1': 'value1'})
+        )
+
+    def test_keys_index(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body='app/key1',
+            headers={'X-Consul-Index': '7'}
+        )
+        self.assertEqual(self.kv.keys_index('app/'), (7, ['app/key1']))
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/kv/app/?keys=None'
+        )
+
+    def test_keys_index_empty(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=404, body='', headers={'X-Consul-Index': '7'}
+        )
+        self.assertEqual(self.kv.keys_index('app/'), (7, []))
+
+
+class TestIndexedCatalogAndHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = mock.MagicMock()
+
+    def test_nodes_index(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body={'Node': 'node-1'},
+            headers={'X-Consul-Index': '5'}
+        )
+        catalog = consul_api.Catalog('http://fake.host:8500/v1', self.adapter)
+        self.assertEqual(
+            catalog.nodes_index(index=4, wait='1m'),
+            (5, [{'Node': 'node-1'}])
+        )
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/catalog/nodes?index=4&wait=1m'
+        )
+
+    def test_state_index(self):
+        self.adapter.get.return_value = mock.Mock(
+            status_code=200,
+            body=[{'Name': 'serf'}, {'Name': 'disk'}],
+            headers={'X-Consul-Index': '9'}
+        )
+        health = consul_api.Health('http://fake.host:8500/v1', self.adapter)
+        self.assertEqual(
+            health.state_index('any'),
+            (9, [{'Name': 'serf'}, {'Name': 'disk'}])
+        )
+        self.adapter.get.assert_called_once_with(
+            'http://fake.host:8500/v1/health/state/any'
+        )
+
+
+class TestTxnGetRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = mock.MagicMock()
+        self.txn = consul_api.Txn('http://fake.host:8500/v1', self.adapter)
+
+    def test_get_records(self):
+        self.adapter.put.return_value = mock.Mock(
+            status_code=200,
+            body={
+                'Results': [
+                    {'KV': {'Key': 'app/key', 'Value': 'dmFsdWU='}},
+                    {'KV': {'Key': 'app/key2', 'Value': 'b3RoZXI='}},
+                ],
+                'Errors': None,
+            },
+            headers={'X-Consul-Index': '42'}
+        )
+        self.assertEqual(
+            self.txn.get_records(['app/key', 'maintenance/key']),
+            (42, {
+                'app/key': {'Key': 'app/key', 'Value': 'value'},
+                'maintenance/key': None,
+            })
+        )
+        self.adapter.put.assert_called_once_with(
+            'http://fake.host:8500/v1/txn',
+            [
+                {'KV': {'Verb': 'get-tree', 'Key': 'app/key'}},
+                {'KV': {'Verb': 'get-tree', 'Key': 'maintenance/key'}},
+            ]
+        )
+
+    def test_get_records_failure(self):
+        self.adapter.put.return_value = mock.Mock(
+            status_code=409,
+            body='{"Errors": []}',
+            headers={}
+        )
+        self.assertRaises(
+            consulate.ConsulateException,
+            self.txn.get_records,
+            ['app/key']
+        )
+
+
+class TestRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = consul_api.Request(
+            pool_size=4, connect_timeout=2, read_timeout=10
+        )
+        self.session_get = mock.patch.object(
+            self.adapter.session,
+            'get',
+            return_value=mock.Mock(status_code=200, content=b'', headers={})
+        ).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_pool(self):
+        http_adapter = self.adapter.session.get_adapter('http://fake.host')
+        self.assertEqual(http_adapter._pool_maxsize, 4)
+        self.assertIs(
+            http_adapter, self.adapter.session.get_adapter('https://fake')
+        )
+
+    def test_timeout(self):
+        self.adapter.get('http://fake.host/v1/kv/app/key')
+        self.session_get.assert_called_once_with(
+            'http://fake.host/v1/kv/app/key', timeout=(2, 10)
+        )
+
+    def test_blocking_query_timeout(self):
+        self.adapter.get('http://fake.host/v1/kv/app/key?index=3&wait=32s')
+        self.session_get.assert_called_once_with(
+            'http://fake.host/v1/kv/app/key?index=3&wait=32s',
+            timeout=(2, 44)
+        )
+
+    def test_consistency(self):
+        for mode, uri in (
+                ('stale', 'http://fake.host/v1/catalog/nodes?stale'),
+                ('consistent', 'http://fake.host/v1/catalog/nodes?consistent'),
+                ('default', 'http://fake.host/v1/catalog/nodes'),
+        ):
+            self.adapter.consistency = mode
+            self.session_get.reset_mock()
+            self.adapter.get('http://fake.host/v1/catalog/nodes')
+            self.session_get.assert_called_once_with(uri, timeout=(2, 10))
+        self.adapter.consistency = 'stale'
+        self.session_get.reset_mock()
+        self.adapter.get('http://fake.host/v1/kv/app/?recurse=')
+        self.session_get.assert_called_once_with(
+            'http://fake.host/v1/kv/app/?recurse=&stale', timeout=(2, 10)
+        )
+
+    def test_server_error(self):
+        self.session_get.return_value = mock.Mock(
+            status_code=500, content=b'No path to datacenter', headers={}
+        )
+        with self.assertRaisesRegex(
+                consulate.ConsulateException, 'No path to datacenter'
+        ):
+            self.adapter.get('http://fake.host/v1/catalog/nodes?dc=dc9')
+
+    def test_decode_body(self):
+        self.session_get.return_value = mock.Mock(
+            status_code=200, headers={},
+            content=b'[{"Key": "app/key", "Value": "dmFsdWU="}]'
+        )
+        self.assertEqual(
+            self.adapter.get('http://fake.host/v1/kv/app/key').body,
+            {'Key': 'app/key', 'Value': 'value'}
+        )
+
+    def test_iter_array(self):
+        body = (
+            b'[{"Node": "n\xc3\xa9-1", "Status": "passing"},\n'
+            b' {"Node": "node-2", "Output": "a ] \\" }"}]'
+        )
+        expected = [
+            {'Node': 'n\xe9-1', 'Status': 'passing'},
+            {'Node': 'node-2', 'Output': 'a ] " }'},
+        ]
+        # items and utf-8 characters split over chunks
+        for size in (1, 3, 7, len(body)):
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            self.assertEqual(list(api.iter_array(chunks)), expected)
+        self.assertEqual(list(api.iter_array([b'[', b' ]'])), [])
+        self.assertEqual(list(api.iter_array([b'null'])), [])
+        self.assertEqual(list(api.iter_array([])), [])
+
+    def test_iter_array_invalid(self):
+        self.assertRaises(
+            ValueError, list, api.iter_array([b'{"Node": "node-1"}'])
+        )
+        self.assertRaises(
+            ValueError, list, api.iter_array([b'[{"Node": "node-1"}'])
+        )
+
+    def test_wait_seconds(self):
+        self.assertEqual(api.wait_seconds('10s'), 10)
+        self.assertEqual(api.wait_seconds('2m'), 120)
+        self.assertEqual(api.wait_seconds('500ms'), 0.5)
+        self.assertRaises(ValueError, api.wait_seconds, 'soon')
@@ -0,0 +1,69 @@
+import json
+import tempfile
+import unittest
+
+from cluster import bench
+from cluster.fake_consul import FakeConsul
+
+
+class TestBench(unittest.TestCase):
+
+    def test_populate(self):
+        fake = FakeConsul(nodes=['node-1', 'node-2'])
+        bench.populate(fake, 4, 40)
+        self.assertEqual(len(fake._kv), 4)
+        self.assertEqual(len(fake.checks), 40)
+        self.assertEqual(
+            len([c for c in fake.checks if c['Status'] == 'critical']), 2
+        )
+
+    def test_main(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            bench.main([
+                '--sizes', '10', '30', '--nodes', '3', '--checks', '20',
+                '--agent-delay', '0.05', '-o', output.name,
+            ])
+            report = json.load(output)
+        self.assertEqual(report['nodes'], 3)
+        self.assertEqual(
+            [(result['size'], result['command'])
+             for result in report['results']],
+            [(size, name) for size in (10, 30)
+             for name, _, _ in bench.commands(size, [])]
+        )
+        for result in report['results']:
+            self.assertGreater(result['requests'], 0)
+            self.assertGreater(result['bytes'], 0)
+            self.assertGreater(result['peak_memory'], 0)
+        deploy = report['results'][-1]
+        self.assertEqual(deploy['command'], 'deploy')
+        self.assertEqual(deploy['endpoints']['PUT event/fire'], 1)
+
+    def test_only_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            bench.main([
+                '--sizes', '10', '--nodes', '2', '--checks', '0',
+                '--command', 'checks', '-o', output.name,
+            ])
+            report = json.load(output)
+        self.assertEqual(
+            [result['command'] for result in report['results']], ['checks']
+        )
+
+    def test_wait_strategies(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            bench.main([
+                '--sizes', '10', '--nodes', '2', '--checks', '0',
+                '--command', 'deploy', '--command', 'checks',
+                '--agent-delay', '0.05', '--wait-strategy', 'blocking',
+                '--wait-strategy', 'backoff', '-o', output.name,
+            ])
+            report = json.load(output)
+        self.assertEqual(
+            [(result['command'], result['wait_strategy'])
+             for result in report['results']],
+            [('checks', None), ('deploy', 'blocking'), ('deploy', 'backoff')]
+        )
+        self.assertNotIn(
+            'GET kv (blocking)', report['results'][-1]['endpoints']
+        )
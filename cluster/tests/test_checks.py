@@ -1,3 +1,5 @@
+import json
+
 from testfixtures import OutputCapture
 from unittest import mock
 
@@ -13,47 +15,59 @@ class TestChecks(ClusterTestCase):
         )
 
     def fill_data(self):
+        health_states = [
+            {
+                'Node': 'node-1',
+                'ServiceID': 'service-1',
+                'ServiceName': 'Service 1',
+                'Status': 'passing',
+                'Output': "check output",
+                'Name': "Check Service 1",
+            }, {
+                'Node': 'node-2',
+                'ServiceID': 'service-2',
+                'ServiceName': 'Service 2',
+                'Status': 'passing',
+                'Output': "check output",
+                'Name': "Check Service 2",
+            }, {
+                'Node': 'node-2',
+                'ServiceID': 'service-2',
+                'ServiceName': 'Service 2',
+                'Status': 'passing',
+                'Output': "check output 2",
+                'Name': "Check Service 2.2",
+            }, {
+                'Node': 'node-2',
+                'ServiceID': 'service-3',
+                'ServiceName': 'Service 3',
+                'Status': 'critical',
+                'Output': "check output error",
+                'Name': "Check Service 3",
+            }
+        ]
+
         def consul_health_state(state):
-            if state == 'passing':
-                return [
-                    {
-                        'Node': 'node-1',
-                        'ServiceID': 'service-1',
-                        'ServiceName': 'Service 1',
-                        'Status': state,
-                        'Output': "check output",
-                        'Name': "Check Service 1",
-                    }, {
-                        'Node': 'node-2',
-                        'ServiceID': 'service-2',
-                        'ServiceName': 'Service 2',
-                        'Status': state,
-                        'Output': "check output",
-                        'Name': "Check Service 2",
-                    }, {
-                        'Node': 'node-2',
-                        'ServiceID': 'service-2',
-                        'ServiceName': 'Service 2',
-                        'Status': state,
-                        'Output': "check output 2",
-                        'Name': "Check Service 2.2",
-                    }
-                ]
-            elif state == 'critical':
-                return [
-                    {
-                        'Node': 'node-2',
-                        'ServiceID': 'service-3',
-                        'ServiceName': 'Service 3',
-                        'Status': state,
-                        'Output': "check output error",
-                        'Name': "Check Service 3",
-                    }
-                ]
-            else:
-                return []
+            return [
+                check for check in health_states
+                if state == 'any' or check['Status'] == state
+            ]
+
+        def consul_health_node(node):
+            return [
+                check for check in health_states if check['Node'] == node
+            ]
+
+        def consul_health_checks(service):
+            return [
+                check for check in health_states
+                if check['ServiceName'] == service
+            ]
+
         self.mocked_consul.configure_mock(**{
             'health.state.side_effect': consul_health_state,
+            'health.node.side_effect': consul_health_node,
+            'health.checks.side_effect': consul_health_checks,
         })
 
     def test_checks_all(self):
@@ -116,6 +130,76 @@ class TestChecks(ClusterTestCase):
             }
         )
 
+    def test_checks_single_request(self):
+        self.fill_data()
+        self.cluster.checks(all=True)
+        self.mocked_consul.health.state.assert_called_once_with('any')
+
+    def test_checks_node(self):
+        self.fill_data()
+        self.assertEqual(
+            self.cluster.checks(all=True, node='node-1'),
+            {
+                'node-1': {
+                    'service-1': {
+                        'name': "Service 1",
+                        'checks': [
+                            ('Check Service 1', 'passing', 'check output', ),
+                        ],
+                    },
+                },
+            }
+        )
+        self.mocked_consul.health.node.assert_called_once_with('node-1')
+        self.mocked_consul.health.state.assert_not_called()
+
+    def test_checks_node_and_service(self):
+        self.fill_data()
+        self.assertEqual(
+            self.cluster.checks(
+                all=True, node='node-2', service='Service 3'
+            ),
+            {
+                'node-2': {
+                    'service-3': {
+                        'name': "Service 3",
+                        'checks': [
+                            (
+                                'Check Service 3',
+                                'critical',
+                                'check output error',
+                            ),
+                        ],
+                    },
+                },
+            }
+        )
+
+    def test_checks_service(self):
+        self.fill_data()
+        self.assertEqual(
+            self.cluster.checks(service='Service 2'),
+            {}
+        )
+        self.mocked_consul.health.checks.assert_called_once_with(
+            'Service 2'
+        )
+
+    def test_check_command_line_filters(self):
+        with mock.patch(
+                'sys.argv',
+                [
+                    'cluster', 'checks', '--node', 'node-1', '--service', 'S1'
+                ]
+        ):
+            with mock.patch(
+                    'cluster.cluster.Cluster.checks', return_value={}
+            ) as mo:
+                main()
+                mo.assert_called_once_with(
+                    all=False, node='node-1', service='S1'
+                )
+
     def test_check_command_lines(self):
         self.fill_data()
         with OutputCapture() as output:
@@ -128,3 +212,47 @@ class TestChecks(ClusterTestCase):
                         "    - Check (critical): Check Service 3",
                     ])
                 )
+
+    def test_check_command_line_ndjson(self):
+        self.fill_data()
+        with OutputCapture() as output:
+            with mock.patch(
+                    'sys.argv', ['cluster', 'checks', '--output', 'ndjson']
+            ):
+                main()
+        output.compare(
+            '{"node": "node-2", "service_id": "service-3", '
+            '"service_name": "Service 3", "check": "Check Service 3", '
+            '"status": "critical", "output": "check output error"}'
+        )
+
+    def test_check_command_line_json(self):
+        self.fill_data()
+        with OutputCapture() as output:
+            with mock.patch(
+                    'sys.argv', ['cluster', 'checks', '-a', '-o', 'json']
+            ):
+                main()
+        checks = json.loads(output.captured)
+        self.assertEqual(len(checks), 4)
+        self.assertEqual(checks[0]['check'], "Check Service 1")
+        self.mocked_consul.health.iter_state.assert_called_once_with('any')
+
+    def test_check_command_line_json_empty(self):
+        with OutputCapture() as output:
+            with mock.patch('sys.argv', ['cluster', 'checks', '-o', 'json']):
+                main()
+        output.compare("[]")
+
+    def test_check_command_line_consistency(self):
+        with mock.patch(
+                'sys.argv', ['cluster', '--consistency', 'stale', 'checks']
+        ):
+            with mock.patch(
+                    'cluster.cluster.Cluster.checks', autospec=True,
+                    return_value={}
+            ) as mo:
+                main()
+        self.assertEqual(
+            mo.call_args[0][0]._http_params['consistency'], 'stale'
+        )
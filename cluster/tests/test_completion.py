@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import completion
+from cluster.client import main
+from cluster.fake_consul import FakeConsul
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+MAX_COMPLETION_TIME = 0.05  # seconds on a 10k apps registry, measured ~12ms
+
+
+def run_cluster(*args):
+    with mock.patch('sys.argv', ['cluster'] + list(args)):
+        with OutputCapture() as output:
+            main()
+    return output
+
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeConsul(nodes=['node-1', 'node-2', 'other'])
+        self.fake.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.fake.put_app(REPO_URL, 'preprod', 'node-2')
+        self.fake.put_app(REPO_URL + '-other', 'prod', 'other')
+        self.fake.put('app/invalid', 'not json')
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+    def test_refresh(self):
+        run_cluster(
+            '--consul', self.fake.url, '--cache-dir', self.cache_dir,
+            'completion', 'refresh'
+        )
+        with open(completion.index_path(
+                self.cache_dir, self.fake.url
+        )) as index_file:
+            self.assertEqual(index_file.read(), "\n".join([
+                "B repo-name preprod",
+                "B repo-name prod",
+                "B repo-name-other prod",
+                "N node-1",
+                "N node-2",
+                "N other",
+                "R repo-name",
+                "R repo-name-other",
+                "",
+            ]))
+
+    def test_refresh_revalidates_registry(self):
+        for _ in range(2):
+            run_cluster(
+                '--consul', self.fake.url, '--cache-dir', self.cache_dir,
+                'completion', 'refresh'
+            )
+        # the registry is downloaded once, then its X-Consul-Index checked
+        self.assertEqual(self.fake.requests['GET kv'], 2)
+
+    def test_index_path(self):
+        self.assertNotEqual(
+            completion.index_path('/tmp', self.fake.url),
+            completion.index_path('/tmp', self.fake.url, 'dc2'),
+        )
+
+    def test_write_index_skips_spaces(self):
+        path = os.path.join(self.cache_dir, 'index.txt')
+        completion.write_index(path, ['node 1', 'node-2'], {
+            'app/a': json.dumps({'repo_url': 'ssh://h/a', 'branch': 'b c'}),
+        })
+        with open(path) as index_file:
+            self.assertEqual(index_file.read(), "N node-2\nR a\n")
+
+
+@unittest.skipIf(shutil.which('bash') is None, "bash is not installed")
+class TestBashCompletion(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.cache_dir = os.path.join(self.tmp_dir, 'cluster-cli')
+        self.script = os.path.join(self.tmp_dir, 'completion.bash')
+        with open(self.script, 'w') as script_file:
+            script_file.write(run_cluster('completion', 'bash').captured)
+        # stands for the command line run to refresh the index
+        self.command = os.path.join(self.tmp_dir, 'cluster')
+        with open(self.command, 'w') as command_file:
+            command_file.write(
+                '#!/bin/sh\necho "$@" > {}/refreshed\n'.format(self.tmp_dir)
+            )
+        os.chmod(self.command, 0o755)
+        completion.write_index(
+            completion.index_path(self.cache_dir, 'http://localhost:8500'),
+            ['node-1', 'node-2', 'other'],
+            {
+                'app/{}'.format(i): json.dumps({
+                    'repo_url': 'ssh://h/ns/repo-{}'.format(i // 3),
+                    'branch': ['prod', 'preprod', 'dev'][i % 3],
+                })
+                for i in range(10000)
+            }
+        )
+
+    def complete(self, *words, repeat=1):
+        """:return: a tuple (candidates, time per completion)"""
+        output = subprocess.check_output(
+            [
+                'bash', '-c',
+                'source "$0"\n'
+                'COMP_WORDS=("$@")\n'
+                'COMP_CWORD=$((${#COMP_WORDS[@]} - 1))\n'
+                'start=$(date +%s%N)\n'
+                'for ((n = 0; n < ' + str(repeat) + '; n++)); do\n'
+                '    _cluster_complete\n'
+                'done\n'
+                'echo $(($(date +%s%N) - start))\n'
+                'printf "%s\\n" "${COMPREPLY[@]}"',
+                self.script, self.command
+            ] + list(words),
+            env=dict(os.environ, XDG_CACHE_HOME=self.tmp_dir)
+        ).decode('utf-8').splitlines()
+        # printf prints an empty line without candidates
+        return [line for line in output[1:] if line], \
+            int(output[0]) / repeat / 1e9
+
+    def test_commands(self):
+        self.assertEqual(
+            self.complete('m')[0], ['migrate', 'move-masters-from']
+        )
+        self.assertEqual(self.complete('--consul', 'url', 'ins')[0],
+                         ['inspect'])
+
+    def test_options(self):
+        self.assertEqual(
+            self.complete('inspect', '--s')[0], ['--slaves']
+        )
+        self.assertEqual(self.complete('--no-c')[0], ['--no-cache'])
+
+    def test_nodes(self):
+        self.assertEqual(self.complete('inspect', 'no')[0],
+                         ['node-1', 'node-2'])
+        self.assertEqual(
+            self.complete('inspect', '-s', 'node-1', 'o')[0], ['other']
+        )
+        self.assertEqual(
+            self.complete('deploy', 'repo-1', 'prod', '--master', '')[0],
+            ['node-1', 'node-2', 'other']
+        )
+        self.assertEqual(
+            self.complete('move-masters-from', 'node-1', '-m', 'o')[0],
+            ['other']
+        )
+        self.assertEqual(self.complete('move-masters-from', 'node-1', '')[0],
+                         [])
+
+    def test_repos_and_branches(self):
+        self.assertEqual(
+            self.complete('deploy', 'repo-333')[0],
+            ['repo-333', 'repo-3330', 'repo-3331', 'repo-3332', 'repo-3333']
+        )
+        self.assertEqual(
+            self.complete('-y', 'deploy', '-t', '10', 'repo-333', 'p')[0],
+            ['preprod', 'prod']
+        )
+        self.assertEqual(
+            self.complete(
+                'migrate', 'repo-1', 'prod', '--target-repo', 'repo-2', ''
+            )[0],
+            ['dev', 'preprod', 'prod']
+        )
+        self.assertEqual(self.complete('deploy', '-t', '')[0], [])
+
+    def test_other_consul(self):
+        self.assertEqual(
+            self.complete('--consul', 'http://other:8500', 'inspect', '')[0],
+            []
+        )
+        for _ in range(100):
+            if os.path.exists(os.path.join(self.tmp_dir, 'refreshed')):
+                break
+            time.sleep(0.02)
+        with open(os.path.join(self.tmp_dir, 'refreshed')) as args_file:
+            self.assertEqual(
+                args_file.read().split(),
+                ['--consul', 'http://other:8500', '--cache-dir',
+                 self.cache_dir, 'completion', 'refresh']
+            )
+
+    def test_fresh_index_not_refreshed(self):
+        self.complete('inspect', '')
+        time.sleep(0.1)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tmp_dir, 'refreshed'))
+        )
+
+    def test_time(self):
+        candidates, duration = self.complete('deploy', 'repo-1', repeat=10)
+        self.assertEqual(len(candidates), 1111)
+        self.assertLess(duration, MAX_COMPLETION_TIME)
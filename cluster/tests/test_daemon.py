@@ -0,0 +1,180 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import cluster
+from cluster import daemon
+from cluster.client import main
+from cluster.fake_consul import FakeConsul
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+class TestDaemon(unittest.TestCase):
+    """Run the daemon against the fake consul"""
+
+    def setUp(self):
+        self.fake = FakeConsul(nodes=['node-1', 'node-2'])
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.key = self.fake.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.fake.add_check(
+            'node-2', 'http', 'critical', service_id='web-1',
+            service_name='web', output='timeout'
+        )
+        runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(runtime_dir.cleanup)
+        self.path = os.path.join(runtime_dir.name, 'cluster.sock')
+        self.daemon = daemon.Daemon(
+            cluster.Cluster(self.fake.url), self.path, wait='1s'
+        )
+        self.daemon.start()
+        self.addCleanup(self.daemon.close)
+        threading.Thread(
+            target=self.daemon.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True
+        ).start()
+        self.addCleanup(self.daemon.shutdown)
+        self.cluster = cluster.Cluster(
+            self.fake.url, daemon=daemon.Client(self.path)
+        )
+        self.fake.reset_stats()
+
+    def requests(self):
+        """Requests sent to consul, but blocking queries of the daemon"""
+        return {
+            name: count for name, count in self.fake.requests.items()
+            if not name.endswith('(blocking)')
+        }
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+
+    def test_socket_mode(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_lookups(self):
+        self.assertEqual(self.cluster.nodes, ['node-1', 'node-2'])
+        self.assertEqual(
+            self.cluster.checks(),
+            {'node-2': {'web-1': {
+                'checks': [('http', 'critical', 'timeout')],
+                'name': 'web',
+            }}}
+        )
+        self.assertEqual(
+            list(self.cluster.iter_checks(all=True, node='node-1')), []
+        )
+        self.assertEqual(
+            self.cluster.get_node_index().masters['node-1'], [self.key]
+        )
+        self.assertEqual(self.requests(), {})
+
+    def test_health_filtered(self):
+        client = daemon.Client(self.path)
+        self.assertEqual(client.call('health', node='node-1'), [])
+        self.assertEqual(
+            [
+                state['Name'] for state in
+                client.call('health', node='node-2', service='web')
+            ],
+            ['http']
+        )
+        self.assertEqual(client.call('health', service='db'), [])
+
+    def test_empty_nodes(self):
+        # an empty catalog is an answer kept in memory, consul is not
+        # queried
+        with mock.patch.object(
+                self.cluster.daemon, 'call', return_value=[]
+        ) as call:
+            self.assertEqual(self.cluster.nodes, [])
+            self.assertEqual(self.cluster.nodes, [])
+        call.assert_called_once_with('nodes')
+        self.assertEqual(self.requests(), {})
+
+    def test_get_kv_application(self):
+        key, app = self.cluster.get_kv_application('repo-name', 'prod')
+        self.assertEqual(key, self.key)
+        self.assertEqual(app.master, 'node-1')
+        # keys are listed by the daemon, the value is read from consul
+        self.assertEqual(self.requests(), {'GET kv': 1})
+        self.assertEqual(
+            self.cluster.get_kv_application('repo-name', 'dev'), (None, None)
+        )
+
+    def test_updates(self):
+        key = self.fake.put_app(REPO_URL, 'dev', 'node-2')
+        self.fake.add_check('node-1', 'serf', 'critical')
+        self.wait_for(lambda: key in self.cluster.get_kv_registry())
+        self.wait_for(lambda: 'node-1' in self.cluster.checks())
+
+    def test_fallback(self):
+        self.daemon.shutdown()
+        self.daemon.close()
+        self.assertIn('node-2', self.cluster.checks())
+        self.assertEqual(self.requests(), {'GET health/state': 1})
+
+    def test_unknown_method(self):
+        with self.assertRaisesRegex(daemon.DaemonError, 'Unknown method'):
+            daemon.Client(self.path).call('deploy')
+
+    def test_already_running(self):
+        with self.assertRaisesRegex(RuntimeError, 'already listening'):
+            daemon.Daemon(cluster.Cluster(self.fake.url), self.path).start()
+
+    def test_command_line(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '--consul', self.fake.url, '--no-cache',
+                 '--socket', self.path, 'checks']
+        ):
+            with OutputCapture() as output:
+                main()
+        output.compare("\n".join([
+            "Node node-2:",
+            " - Service web:",
+            "    - Check (critical): http",
+        ]))
+        self.assertEqual(self.requests(), {})
+
+    def test_command_line_no_daemon(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '--consul', self.fake.url, '--no-cache',
+                 '--socket', self.path, '--no-daemon', 'inspect', 'node-1']
+        ):
+            with OutputCapture() as output:
+                main()
+        output.compare("\n".join([
+            "Master apps of node node-1:",
+            self.key,
+        ]))
+        self.assertEqual(self.requests(), {'GET kv': 1})
+
+
+class TestSocketPath(unittest.TestCase):
+
+    def test_default_socket_path(self):
+        with mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': '/run/user/1'}):
+            path = daemon.default_socket_path('http://localhost:8500')
+            self.assertEqual(
+                os.path.dirname(path), '/run/user/1/cluster-cli'
+            )
+            self.assertNotEqual(
+                path,
+                daemon.default_socket_path('http://localhost:8500', 'dc2')
+            )
+
+    def test_no_daemon(self):
+        with self.assertRaisesRegex(daemon.DaemonError, 'No daemon answer'):
+            daemon.Client('/nonexistent/cluster.sock').call('ping')
@@ -0,0 +1,182 @@
+import json
+import subprocess
+import sys
+import time
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import cluster
+from cluster.client import main
+from cluster.fake_consul import FakeConsul
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+class TestDatacenters(unittest.TestCase):
+
+    def setUp(self):
+        self.dc1 = FakeConsul(nodes=['node-1', 'node-2'], datacenter='dc1')
+        self.dc2 = FakeConsul(nodes=['node-a', 'node-b'], datacenter='dc2')
+        self.dc3 = FakeConsul(nodes=['node-x'], datacenter='dc3', latency=2)
+        self.dc1.add_datacenter(self.dc2)
+        self.dc1.add_datacenter(self.dc3)
+        self.dc1.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.dc2.put_app(REPO_URL, 'prod', 'node-a')
+        self.dc2.add_check('node-b', 'serf', 'critical')
+        self.dc1.start()
+        self.addCleanup(self.dc1.stop)
+        self.cluster = cluster.Cluster(self.dc1.url)
+
+    def test_datacenters(self):
+        self.assertEqual(self.cluster.datacenters, ['dc1', 'dc2', 'dc3'])
+
+    def test_in_datacenter(self):
+        dc2 = self.cluster.in_datacenter('dc2', timeout=1)
+        self.assertEqual(dc2.nodes, ['node-a', 'node-b'])
+        self.assertEqual(dc2._http_params['read_timeout'], 1)
+        self.assertEqual(
+            dc2.get_node_index().masters['node-a'],
+            [cluster.app_key(REPO_URL, 'prod')]
+        )
+
+    def test_registry_cache_per_datacenter(self):
+        self.assertNotEqual(
+            cluster.Cluster(
+                self.dc1.url, cache_dir='/tmp'
+            )._registry_cache.path,
+            cluster.Cluster(
+                self.dc1.url, cache_dir='/tmp', datacenter='dc2'
+            )._registry_cache.path
+        )
+
+    def test_per_datacenter(self):
+        start = time.monotonic()
+        results, errors = self.cluster.per_datacenter(
+            ['dc1', 'dc2', 'dc3', 'dc9'],
+            lambda dc_cluster: dc_cluster.nodes,
+            timeout=0.5
+        )
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(
+            results, {'dc1': ['node-1', 'node-2'], 'dc2': ['node-a', 'node-b']}
+        )
+        self.assertEqual(sorted(errors), ['dc3', 'dc9'])
+        self.assertIsInstance(errors['dc3'], TimeoutError)
+        self.assertIn('No path to datacenter', str(errors['dc9']))
+
+    def test_late_datacenter_does_not_hold_exit(self):
+        timeout = 1
+        self.dc3.latency = 10
+        start = time.monotonic()
+        subprocess.run(
+            [
+                sys.executable, '-c',
+                'from cluster.client import main; main()',
+                '--consul', self.dc1.url, '--no-cache', '--datacenter', 'all',
+                '--datacenter-timeout', str(timeout), 'checks'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=10
+        )
+        # late requests end after the timeout and its margin, the command
+        # does not wait them
+        self.assertLess(
+            time.monotonic() - start,
+            timeout + cluster.DATACENTER_TIMEOUT_MARGIN
+        )
+
+    def run_command(self, *args):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '--consul', self.dc1.url, '--no-cache'] +
+                list(args)
+        ):
+            with OutputCapture() as output:
+                main()
+        return output
+
+    def test_checks_command_line(self):
+        output = self.run_command('--datacenter', 'dc1,dc2', 'checks')
+        output.compare("\n".join([
+            "Datacenter dc1:",
+            "Datacenter dc2:",
+            "Node node-b:",
+            " - Service :",
+            "    - Check (critical): serf",
+        ]))
+
+    def test_checks_ndjson(self):
+        output = self.run_command(
+            '--datacenter', 'dc1,dc2', 'checks', '-o', 'ndjson'
+        )
+        output.compare(
+            '{"node": "node-b", "service_id": "", "service_name": "", '
+            '"check": "serf", "status": "critical", "output": "", '
+            '"datacenter": "dc2"}'
+        )
+
+    def test_inspect_json_unreachable_datacenter(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '--consul', self.dc1.url, '--no-cache',
+                 '--datacenter', 'all', '--datacenter-timeout', '0.5',
+                 'inspect', '--all', '-o', 'json']
+        ):
+            with OutputCapture(separate=True) as output:
+                with self.assertRaisesRegex(
+                        RuntimeError, '1 on 3 datacenter'
+                ):
+                    main()
+        self.assertEqual(
+            [
+                (app['datacenter'], app['node'])
+                for app in json.loads(output.stdout.getvalue())
+            ],
+            [('dc1', 'node-1'), ('dc2', 'node-a')]
+        )
+        self.assertIn(
+            "Datacenter dc3: unreachable", output.stderr.getvalue()
+        )
+
+    def test_inspect_all_datacenters(self):
+        with self.assertRaisesRegex(RuntimeError, '1 on 3 datacenter'):
+            self.run_command(
+                '--datacenter', 'all', '--datacenter-timeout', '0.5',
+                'inspect', '--all'
+            )
+
+    def test_inspect_command_line(self):
+        output = self.run_command(
+            '--datacenter', 'dc2,dc1', 'inspect', 'node-1', 'node-a'
+        )
+        key = cluster.app_key(REPO_URL, 'prod')
+        output.compare("\n".join([
+            "Datacenter dc1:",
+            "Master apps of node node-1:",
+            key,
+            "Master apps of node node-a:",
+            "",
+            "Datacenter dc2:",
+            "Master apps of node node-1:",
+            "",
+            "Master apps of node node-a:",
+            key,
+        ]))
+
+    def test_single_datacenter(self):
+        output = self.run_command('--datacenter', 'dc2', 'inspect', '--all')
+        output.compare("\n".join([
+            "Master apps of node node-a:",
+            cluster.app_key(REPO_URL, 'prod'),
+            "Master apps of node node-b:",
+        ]))
+
+    def test_deploy_many_datacenters(self):
+        with OutputCapture():
+            with self.assertRaises(SystemExit):
+                self.run_command(
+                    '--datacenter', 'all', 'deploy', 'repo-name', 'prod'
+                )
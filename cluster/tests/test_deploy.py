@@ -25,9 +25,43 @@ class TestDeploy(ClusterTestCase):
                     no_wait=False,
                     timeout=cluster.DEFAULT_TIMEOUT,
                     ask_user=True,
-                    update=False
+                    update=False,
+                    auto_place=False,
+                    explain=False
                 )
 
+    def test_command_line_wait_strategy(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '--wait-strategy', 'backoff', 'deploy', 'repo',
+                 'branch']
+        ):
+            with mock.patch(
+                    'cluster.cluster.Cluster.deploy', autospec=True
+            ) as mo:
+                main()
+                self.assertEqual(mo.call_args[0][0].wait_strategy, 'backoff')
+
+    def test_command_line_auto_place(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', 'deploy', '--auto-place', '--explain', 'repo',
+                 'branch']
+        ):
+            with mock.patch('cluster.cluster.Cluster.deploy') as mo:
+                main()
+                self.assertTrue(mo.call_args[1]['auto_place'])
+                self.assertTrue(mo.call_args[1]['explain'])
+        for argv in (
+                ['--auto-place', '--master', 'node-1', 'repo', 'branch'],
+                ['--explain', 'repo', 'branch'],
+        ):
+            with mock.patch('sys.argv', ['cluster', 'deploy'] + argv):
+                with mock.patch('cluster.cluster.Cluster.deploy') as mo:
+                    with OutputCapture():
+                        self.assertRaises(SystemExit, main)
+                    mo.assert_not_called()
+
     def test_command_line_new_service(self):
         with mock.patch(
                 'sys.argv',
@@ -56,7 +90,9 @@ class TestDeploy(ClusterTestCase):
                     no_wait=True,
                     timeout=10,
                     ask_user=False,
-                    update=False
+                    update=False,
+                    auto_place=False,
+                    explain=False
                 )
 
     def test_command_line_update_short(self):
@@ -88,7 +124,9 @@ class TestDeploy(ClusterTestCase):
                     no_wait=True,
                     timeout=10,
                     ask_user=False,
-                    update=True
+                    update=True,
+                    auto_place=False,
+                    explain=False
                 )
 
     def test_command_line_update_long(self):
@@ -120,7 +158,9 @@ class TestDeploy(ClusterTestCase):
                     no_wait=True,
                     timeout=10,
                     ask_user=False,
-                    update=True
+                    update=True,
+                    auto_place=False,
+                    explain=False
                 )
 
     @mock.patch('cluster.util.get_input', return_value='Yes')
@@ -435,12 +475,13 @@ class TestDeploy(ClusterTestCase):
             }
         })
 
-        def kv_get(key):
-            return None
-
+        # the app is read once resolved then before the event is fired
         self.mocked_consul.configure_mock(**{
-            'kv.get.side_effect': kv_get
+            'kv.get.side_effect': [json.dumps(self.get_mock_data()), None],
         })
+        self.init_mock_kv_watch(
+            lambda keys: {key: None for key in keys}
+        )
         self.assertRaises(
             TimeoutError,
             self.cluster.deploy,
@@ -460,14 +501,20 @@ class TestDeploy(ClusterTestCase):
             }
         })
 
-        def kv_get(key):
+        def records(keys):
+            app_key, maintenance_key = keys
             if Counter.get('test_wait') > 2:
-                return json.dumps(self.get_mock_data())
-            return None
+                return {
+                    app_key: {'Value': json.dumps(self.get_mock_data())},
+                    maintenance_key: None,
+                }
+            return {app_key: None, maintenance_key: None}
 
+        # the app is read once resolved then before the event is fired
         self.mocked_consul.configure_mock(**{
-            'kv.get.side_effect': kv_get
+            'kv.get.side_effect': [json.dumps(self.get_mock_data()), None],
         })
+        self.init_mock_kv_watch(records)
         self.cluster.deploy(
             'repo-name', 'branch-name', no_wait=False
         )
@@ -482,16 +529,24 @@ class TestDeploy(ClusterTestCase):
             }
         })
 
-        def kv_get(key):
+        def records(keys):
+            app_key, maintenance_key = keys
             if Counter.get('test_wait_existing_app') > 2:
-                return json.dumps(self.get_mock_data(
-                    extra={'deploy_date': "2018-08-05T224230.000000"})
-                )
-            return json.dumps(self.get_mock_data())
+                return {
+                    app_key: {'Value': json.dumps(self.get_mock_data(
+                        extra={'deploy_date': "2018-08-05T224230.000000"}
+                    ))},
+                    maintenance_key: None,
+                }
+            return {
+                app_key: {'Value': json.dumps(self.get_mock_data())},
+                maintenance_key: None,
+            }
 
         self.mocked_consul.configure_mock(**{
-            'kv.get.side_effect': kv_get
+            'kv.get.return_value': json.dumps(self.get_mock_data()),
         })
+        self.init_mock_kv_watch(records)
         self.cluster.deploy(
             'repo-name', 'branch-name', no_wait=False, timeout=6
         )
@@ -580,3 +635,38 @@ class TestDeploy(ClusterTestCase):
             'repo-name',
             'branch-name'
         )
+
+    def test_get_kv_application_lists_keys(self):
+        self.init_mocks()
+        key, app = self.cluster.get_kv_application('repo-name', 'branch-name')
+        self.assertEqual(key, 'app/repo-name_branch-name.739a5')
+        self.assertEqual(app.branch, 'branch-name')
+        self.mocked_consul.kv.keys_index.assert_called_once_with(
+            'app/repo-name_branch-name.', separator='/'
+        )
+        self.mocked_consul.kv.get.assert_called_once_with(key)
+        self.assertEqual(
+            self.cluster.get_kv_application('other', 'branch-name'),
+            (None, None)
+        )
+
+    def test_get_kv_application_reuses_keys(self):
+        self.init_mocks()
+        key, _ = self.cluster.get_kv_application('migrate-repo', 'prod')
+        self.mocked_consul.kv.keys_index.reset_mock()
+        self.assertEqual(
+            self.cluster.get_kv_application('migrate-repo', 'prod')[0], key
+        )
+        self.mocked_consul.kv.keys_index.assert_not_called()
+        # the app is removed
+        self.mocked_consul.kv.get.side_effect = None
+        self.mocked_consul.kv.get.return_value = None
+        self.mocked_consul.kv.find.side_effect = None
+        self.mocked_consul.kv.find.return_value = {}
+        self.assertEqual(
+            self.cluster.get_kv_application('migrate-repo', 'prod'),
+            (None, None)
+        )
+        self.mocked_consul.kv.keys_index.assert_called_once_with(
+            'app/migrate-repo_prod.', separator='/'
+        )
@@ -0,0 +1,234 @@
+import json
+import os
+import tempfile
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import cluster
+from cluster import util
+from cluster.client import main
+from cluster.tests.cluster_test_case import ClusterTestCase
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class TestDeployPlan(ClusterTestCase):
+
+    _plan = [
+        {'repo': 'repo-name', 'branch': 'branch-name'},
+        {'repo': 'migrate-repo', 'branch': 'qualif', 'master': 'node-3'},
+        {
+            'repo': 'ssh://git@git.example.org/namespace/project.git',
+            'branch': 'branch-name',
+            'master': 'node-4',
+            'update': True,
+        },
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.init_mocks()
+        self.cluster = cluster.Cluster(
+            'http://fake.host', cache_dir=self.cache_dir.name
+        )
+
+    def write_plan(self, content, suffix='.json'):
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.cache_dir.name)
+        with os.fdopen(fd, 'w') as plan_file:
+            plan_file.write(content)
+        return path
+
+    def test_command_line(self):
+        path = self.write_plan(json.dumps(self._plan))
+        with mock.patch(
+                'sys.argv',
+                [
+                    'cluster', '-y', 'deploy', '--from-file', path,
+                    '-p', '3', '--max-per-node', '1', '-t', '10',
+                ]
+        ):
+            with mock.patch('cluster.cluster.Cluster.deploy_plan') as mo:
+                main()
+                mo.assert_called_once_with(
+                    self._plan,
+                    no_wait=False,
+                    timeout=10,
+                    ask_user=False,
+                    parallel=3,
+                    max_per_node=1
+                )
+
+    def test_command_line_default_parallel(self):
+        path = self.write_plan(json.dumps(self._plan))
+        with mock.patch(
+                'sys.argv', ['cluster', '-y', 'deploy', '--from-file', path]
+        ):
+            with mock.patch('cluster.cluster.Cluster.deploy_plan') as mo:
+                main()
+                self.assertEqual(
+                    mo.call_args[1]['parallel'], cluster.DEFAULT_PARALLEL
+                )
+
+    def test_command_line_from_file_with_explain(self):
+        path = self.write_plan(json.dumps(self._plan))
+        with mock.patch(
+                'sys.argv',
+                ['cluster', 'deploy', '--from-file', path, '--explain']
+        ):
+            with mock.patch('cluster.cluster.Cluster.deploy_plan') as mo:
+                with OutputCapture():
+                    self.assertRaises(SystemExit, main)
+                mo.assert_not_called()
+
+    def test_command_line_from_file_with_repo(self):
+        path = self.write_plan(json.dumps(self._plan))
+        with OutputCapture():
+            with mock.patch(
+                    'sys.argv',
+                    ['cluster', 'deploy', '--from-file', path, 'repo-name']
+            ):
+                self.assertRaises(SystemExit, main)
+
+    def test_command_line_requires_branch(self):
+        with OutputCapture():
+            with mock.patch('sys.argv', ['cluster', 'deploy', 'repo-name']):
+                self.assertRaises(SystemExit, main)
+
+    def test_deploy_plan(self):
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            with OutputCapture() as output:
+                self.cluster.deploy_plan(
+                    self._plan, ask_user=False, parallel=2
+                )
+            mo.assert_has_calls(
+                [
+                    mock.call(
+                        'app/repo-name_branch-name.739a5',
+                        "ssh://git@git.example.org:2222/services/repo-name",
+                        'branch-name',
+                        'node-2',
+                        slave='node-1',
+                        no_wait=False,
+                        timeout=cluster.DEFAULT_TIMEOUT,
+                        update=False
+                    ),
+                    mock.call(
+                        'app/migrate-repo_qualif.12345',
+                        "ssh://git@git.example.org:2222/services/repo-name",
+                        'qualif',
+                        'node-3',
+                        slave='node-1',
+                        no_wait=False,
+                        timeout=cluster.DEFAULT_TIMEOUT,
+                        update=False
+                    ),
+                    mock.call(
+                        'app/project_branch-name.a02f7',
+                        "ssh://git@git.example.org/namespace/project",
+                        'branch-name',
+                        'node-4',
+                        slave=None,
+                        no_wait=False,
+                        timeout=cluster.DEFAULT_TIMEOUT,
+                        update=True
+                    ),
+                ],
+                any_order=True
+            )
+        # a single registry scan and catalog fetch
+        self.mocked_consul.kv.find_index.assert_called_once_with('app/')
+        self.mocked_consul.catalog.nodes.assert_called_once_with()
+        self.assertIn(
+            " - app/project_branch-name.a02f7 "
+            "[master: node-4 - replicate: None]: done",
+            output.captured
+        )
+
+    def test_deploy_plan_unknown_node(self):
+        plan = self._plan + [
+            {'repo': 'migrate-repo', 'branch': 'prod', 'slave': 'node-10'}
+        ]
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            self.assertRaises(
+                RuntimeError,
+                self.cluster.deploy_plan,
+                plan,
+                ask_user=False
+            )
+            mo.assert_not_called()
+
+    @mock.patch('cluster.util.get_input', return_value='yes')
+    def test_deploy_plan_duplicates(self, get_input):
+        plan = self._plan + [
+            {'repo': 'migrate-repo', 'branch': 'qualif', 'master': 'node-2'}
+        ]
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            with self.assertRaisesRegex(
+                    RuntimeError, r'app/migrate-repo_qualif\.12345'
+            ):
+                self.cluster.deploy_plan(plan)
+            mo.assert_not_called()
+        get_input.assert_not_called()
+
+    @mock.patch('cluster.util.get_input', return_value='no')
+    def test_deploy_plan_answer_no(self, _):
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            with OutputCapture() as output:
+                self.cluster.deploy_plan(self._plan)
+            mo.assert_not_called()
+        self.assertIn(
+            " - app/migrate-repo_qualif.12345 from [master: node-1 - "
+            "replicate: node-2] to [master: node-3 - replicate: node-1]",
+            output.captured
+        )
+        self.assertIn("Not confirmed, Aborting", output.captured)
+
+    def test_load_json_plan(self):
+        path = self.write_plan(json.dumps(self._plan))
+        self.assertEqual(util.load_plan(path), self._plan)
+
+    @unittest.skipUnless(yaml, "PyYAML is not installed")
+    def test_load_yaml_plan(self):
+        path = self.write_plan(
+            "- repo: repo-name\n"
+            "  branch: branch-name\n"
+            "  master: node-1\n"
+            "  update: true\n",
+            suffix='.yaml'
+        )
+        self.assertEqual(
+            util.load_plan(path),
+            [{
+                'repo': 'repo-name',
+                'branch': 'branch-name',
+                'master': 'node-1',
+                'update': True,
+            }]
+        )
+
+    def test_load_invalid_plan(self):
+        for plan in [
+                {'repo': 'repo-name', 'branch': 'branch-name'},
+                [{'repo': 'repo-name'}],
+                [{'repo': 'repo-name', 'branch': 'b', 'node': 'node-1'}],
+                [{'repo': 'repo-name', 'branch': 10}],
+                [{'repo': 'repo-name', 'branch': 'b', 'master': ['node-1']}],
+                [{'repo': 'repo-name', 'branch': 'b', 'update': 'yes'}],
+        ]:
+            path = self.write_plan(json.dumps(plan))
+            self.assertRaises(RuntimeError, util.load_plan, path)
+
+    @unittest.skipUnless(yaml, "PyYAML is not installed")
+    def test_load_yaml_plan_types(self):
+        path = self.write_plan(
+            "- repo: repo-name\n"
+            "  branch: 10\n",
+            suffix='.yaml'
+        )
+        with self.assertRaisesRegex(RuntimeError, 'Invalid branch'):
+            util.load_plan(path)
@@ -0,0 +1,360 @@
+import threading
+import unittest
+
+from testfixtures import OutputCapture
+
+from cluster import cluster
+from cluster.fake_consul import FakeConsul
+from cluster.stats import Stats
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+class TestFakeConsul(unittest.TestCase):
+    """Run the client against the fake consul with real http requests"""
+
+    def setUp(self):
+        self.fake = FakeConsul(
+            nodes=['node-1', 'node-2', 'node-3'],
+            agent_delay=0.05,
+            maintenance_duration=0.3
+        )
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.key = self.fake.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.fake.put_app(REPO_URL, 'qualif', 'node-3')
+        self.cluster = cluster.Cluster(self.fake.url)
+
+    def test_nodes(self):
+        self.assertEqual(self.cluster.nodes, ['node-1', 'node-2', 'node-3'])
+
+    def test_checks(self):
+        self.fake.add_check('node-1', 'serf', 'passing')
+        self.fake.add_check(
+            'node-2', 'http', 'critical', service_id='web-1',
+            service_name='web', output='timeout'
+        )
+        self.assertEqual(
+            self.cluster.checks(),
+            {'node-2': {'web-1': {
+                'checks': [('http', 'critical', 'timeout')],
+                'name': 'web',
+            }}}
+        )
+        self.assertEqual(
+            list(self.cluster.checks(all=True, node='node-1')), ['node-1']
+        )
+
+    def test_iter_checks(self):
+        self.fake.add_check('node-1', 'serf', 'passing')
+        self.fake.add_check(
+            'node-2', 'http', 'critical', service_id='web-1',
+            service_name='web', output='timeout'
+        )
+        self.assertEqual(list(self.cluster.iter_checks()), [{
+            'node': 'node-2',
+            'service_id': 'web-1',
+            'service_name': 'web',
+            'check': 'http',
+            'status': 'critical',
+            'output': 'timeout',
+        }])
+        self.assertEqual(
+            [check['node'] for check in self.cluster.iter_checks(all=True)],
+            ['node-1', 'node-2']
+        )
+        self.assertEqual(
+            len(list(self.cluster.iter_checks(all=True, node='node-1'))), 1
+        )
+        self.assertEqual(
+            len(list(self.cluster.iter_checks(service='web'))), 1
+        )
+
+    def test_iter_node_apps(self):
+        stats = Stats()
+        self.cluster = cluster.Cluster(self.fake.url, stats=stats)
+        self.assertEqual(
+            list(self.cluster.iter_node_apps('node-2', 'node-3', slaves=True)),
+            # registry keys order
+            [
+                {
+                    'node': 'node-2',
+                    'role': 'slave',
+                    'key': self.key,
+                    'repo_url': REPO_URL,
+                    'branch': 'prod',
+                    'master': 'node-1',
+                    'slave': 'node-2',
+                },
+                {
+                    'node': 'node-3',
+                    'role': 'master',
+                    'key': cluster.app_key(REPO_URL, 'qualif'),
+                    'repo_url': REPO_URL,
+                    'branch': 'qualif',
+                    'master': 'node-3',
+                    'slave': None,
+                },
+            ]
+        )
+        # streamed requests are accounted once read
+        requests = stats.report()['requests']
+        self.assertEqual(requests['GET kv']['count'], 1)
+        self.assertEqual(
+            requests['GET kv']['bytes'], self.fake.bytes_sent
+        )
+
+    def test_get_kv_application(self):
+        key, app = self.cluster.get_kv_application('repo-name', 'prod')
+        self.assertEqual(key, self.key)
+        self.assertEqual(app.master, 'node-1')
+        self.assertEqual(app.slave, 'node-2')
+
+    def test_get_kv_application_requests(self):
+        self.fake.put_app(REPO_URL + '-other', 'prod', 'node-1')
+        self.cluster.get_kv_application('repo-name', 'prod')
+        # keys are listed then the single matching value is read
+        self.assertEqual(self.fake.requests['GET kv'], 2)
+        self.cluster.get_kv_application('repo-name', 'prod')
+        self.assertEqual(self.fake.requests['GET kv'], 3)
+
+    def test_registry_index(self):
+        index, keys = self.cluster.consul.kv.keys_index('app/')
+        self.assertEqual(len(keys), 2)
+        find_index, values = self.cluster.consul.kv.find_index('app/')
+        self.assertEqual(find_index, index)
+        self.assertEqual(sorted(values), sorted(keys))
+        self.fake.put_app(REPO_URL, 'dev', 'node-1')
+        self.assertGreater(
+            self.cluster.consul.kv.keys_index('app/')[0], index
+        )
+
+    def test_keys_separator(self):
+        self.fake.put('maintenance/a/b', '')
+        self.assertEqual(
+            self.cluster.consul.kv.find('', separator='/'),
+            ['app/', 'maintenance/']
+        )
+
+    def test_blocking_query(self):
+        kv = self.cluster.consul.kv
+        index, record = kv.get_record_index(self.key)
+        self.assertEqual(record['Key'], self.key)
+        threading.Timer(
+            0.1, self.fake.put_app, args=(REPO_URL, 'prod', 'node-3')
+        ).start()
+        new_index, record = kv.get_record_index(
+            self.key, index=index, wait='5s'
+        )
+        self.assertGreater(new_index, index)
+        self.assertIn('node-3', record['Value'])
+
+    def test_blocking_query_wait(self):
+        kv = self.cluster.consul.kv
+        index, _ = kv.get_record_index(self.key)
+        self.assertEqual(
+            kv.get_record_index(self.key, index=index, wait='100ms'),
+            (index, kv.get_record_index(self.key)[1])
+        )
+
+    def test_health_blocking_query(self):
+        health = self.cluster.consul.health
+        index, checks = health.state_index('any')
+        self.assertEqual(checks, [])
+        threading.Timer(
+            0.1, self.fake.add_check, args=('node-1', 'serf', 'critical')
+        ).start()
+        new_index, checks = health.state_index(
+            'any', index=index, wait='5s'
+        )
+        self.assertGreater(new_index, index)
+        self.assertEqual([check['Name'] for check in checks], ['serf'])
+        self.assertEqual(
+            self.cluster.consul.catalog.nodes_index(
+                index=new_index, wait='100ms'
+            )[0],
+            new_index
+        )
+
+    def test_txn(self):
+        _, records = self.cluster.consul.txn.get_records(
+            [self.key, 'maintenance/missing']
+        )
+        self.assertIn('"master": "node-1"', records[self.key]['Value'])
+        self.assertIsNone(records['maintenance/missing'])
+
+    def test_deploy(self):
+        before = self.fake.get(self.key)
+        self.cluster.deploy('repo-name', 'prod', ask_user=False, timeout=5)
+        after = self.fake.get(self.key)
+        self.assertEqual(after['master'], 'node-2')
+        self.assertEqual(after['slave'], 'node-1')
+        self.assertGreater(after['deploy_date'], before['deploy_date'])
+        self.assertEqual(after['previous_deploy_id'], before['deploy_id'])
+        self.assertEqual(self.fake.requests['PUT event/fire'], 1)
+        # records received by blocking queries are not read again
+        self.assertNotIn('PUT txn', self.fake.requests)
+
+    def test_deploy_stale(self):
+        stale = cluster.Cluster(self.fake.url, consistency='stale')
+        self.assertIsNot(stale.event_consul, stale.consul)
+        self.assertIs(self.cluster.event_consul, self.cluster.consul)
+        self.assertEqual(stale.in_datacenter('dc1')._http_params[
+            'consistency'
+        ], 'stale')
+        before = self.fake.get(self.key)
+        stale.deploy('repo-name', 'prod', ask_user=False, timeout=5)
+        self.assertEqual(
+            self.fake.get(self.key)['previous_deploy_id'],
+            before['deploy_id']
+        )
+        self.assertEqual(stale.consul._adapter.consistency, 'stale')
+        self.assertEqual(stale.event_consul._adapter.consistency, 'default')
+
+    def test_deploy_polling(self):
+        for strategy in ('fixed', 'backoff'):
+            before = self.fake.get(self.key)
+            cluster.Cluster(self.fake.url, wait_strategy=strategy).deploy(
+                'repo-name', 'prod', ask_user=False, timeout=5
+            )
+            self.assertGreater(
+                self.fake.get(self.key)['deploy_date'],
+                before['deploy_date']
+            )
+        self.assertNotIn('GET kv (blocking)', self.fake.requests)
+        self.assertGreater(self.fake.requests['PUT txn'], 0)
+
+    def test_deploy_polling_timeout(self):
+        self.fake.agent_delay = 2
+        with self.assertRaises(TimeoutError):
+            cluster.Cluster(self.fake.url, wait_strategy='backoff').deploy(
+                'repo-name', 'prod', ask_user=False, timeout=0.5
+            )
+
+    def test_deploy_new_service(self):
+        self.cluster.deploy(
+            'ssh://git@git.example.org/ns/new.git', 'prod', master='node-3',
+            ask_user=False, timeout=5
+        )
+        self.assertEqual(
+            self.fake.get(
+                cluster.app_key('ssh://git@git.example.org/ns/new', 'prod')
+            )['master'],
+            'node-3'
+        )
+
+    def test_deploy_timeout(self):
+        self.fake.agent_delay = 2
+        with self.assertRaises(TimeoutError):
+            self.cluster.deploy(
+                'repo-name', 'prod', ask_user=False, timeout=0.3
+            )
+
+    def test_migrate(self):
+        self.cluster.migrate(
+            'repo-name', 'prod', 'qualif', ask_user=False, timeout=5
+        )
+        self.assertTrue(self.cluster.was_maintenance)
+        self.assertEqual(self.fake.events[0][0], 'migrate')
+        self.assertNotIn('PUT txn', self.fake.requests)
+
+    def test_move_masters_from(self):
+        with OutputCapture() as output:
+            self.cluster.move_masters_from(
+                'node-1', no_wait=False, timeout=5, ask_user=False,
+                parallel=2
+            )
+        self.assertIn('done', output.captured)
+        self.assertEqual(self.fake.get(self.key)['master'], 'node-2')
+
+    def test_deploy_many_releases_threads(self):
+        deployments = [
+            cluster.Deployment(
+                self.fake.put_app(REPO_URL, branch, 'node-1', 'node-2'),
+                REPO_URL, branch, 'node-2', 'node-1'
+            )
+            for branch in ('b1', 'b2', 'b3', 'b4', 'b5', 'b6')
+        ]
+        # blocking queries of existing keys are not woken up by other keys
+        # changes (unlike missing keys ones)
+        for deployment in deployments:
+            self.fake.put(
+                deployment.kv_key.replace('app/', 'maintenance/'), ''
+            )
+        before = set(threading.enumerate())
+        results = self.cluster._deploy_many(
+            deployments, parallel=4, timeout=5
+        )
+        self.assertEqual([error for _, error in results if error], [])
+        # watchers end with their deployment, their blocking queries
+        # neither hold threads nor connections
+        self.assertEqual(
+            [
+                thread.name for thread in set(threading.enumerate()) - before
+                if thread.name.startswith(('watch ', 'ThreadPoolExecutor'))
+            ],
+            []
+        )
+        self.assertEqual(
+            self.cluster.consul._adapter.http_adapter.in_flight, {}
+        )
+
+    def test_move_masters_from_waves(self):
+        self.fake.put_app(REPO_URL, 'dev', 'node-1', 'node-3')
+        self.fake.add_check('node-3', 'http', 'critical', service_id='web-1')
+        with OutputCapture() as output:
+            self.cluster.move_masters_from(
+                'node-1', timeout=5, ask_user=False, wave_size=1,
+                health_interval=0.01
+            )
+        self.assertIn(
+            "Wave 2: moving 1 service(s) to node-2, 0 left", output.captured
+        )
+        self.assertEqual(self.fake.get(self.key)['master'], 'node-2')
+        # target nodes checks are polled one node at a time
+        self.assertNotIn('GET health/state', self.fake.requests)
+        self.assertGreater(self.fake.requests['GET health/node'], 0)
+
+    def test_latency(self):
+        self.fake.latency = 0.2
+        with self.assertRaises(Exception):
+            cluster.Cluster(self.fake.url, read_timeout=0.05).nodes
+
+    def test_deploy_auto_place(self):
+        self.fake.add_check('node-3', 'serfHealth', 'critical')
+        # a failing service does not make its node unhealthy
+        self.fake.add_check('node-2', 'http', 'critical', service_id='web-1')
+        with OutputCapture() as output:
+            self.cluster.deploy(
+                'ssh://git@git.example.org/ns/new.git', 'prod',
+                auto_place=True, explain=True, ask_user=False, timeout=5
+            )
+        output.compare("\n".join([
+            "Node scores (master apps, slave apps, failing service checks, "
+            "failing node checks):",
+            " - node-1: 1, 0, 0, 0",
+            " - node-2: 0, 1, 1, 0",
+            " - node-3: 1, 0, 0, 1 (unhealthy)",
+            "Placement: [master: node-2 - replicate: node-1]",
+        ]))
+        app = self.fake.get(
+            cluster.app_key('ssh://git@git.example.org/ns/new', 'prod')
+        )
+        self.assertEqual((app['master'], app['slave']), ('node-2', 'node-1'))
+
+    def test_auto_place_requests(self):
+        self.cluster.nodes
+        self.fake.reset_stats()
+        self.assertEqual(
+            self.cluster.auto_place('new', 'prod'), ('node-2', 'node-1')
+        )
+        # a single registry scan and a single health checks fetch
+        self.assertEqual(
+            self.fake.requests, {'GET kv': 1, 'GET health/state': 1}
+        )
+
+    def test_deploy_auto_place_existing_service(self):
+        with self.assertRaises(RuntimeError):
+            self.cluster.deploy(
+                'repo-name', 'prod', auto_place=True, ask_user=False
+            )
@@ -1,3 +1,4 @@
+import json
 import pytest
 from testfixtures import OutputCapture
 from unittest import mock
@@ -36,7 +37,9 @@ class TestInspect(ClusterTestCase):
         with mock.patch(*command_line_args):
             with mock.patch('cluster.cluster.Cluster.inspect_node') as mo:
                 main()
-                mo.assert_called_once_with(node)
+                mo.assert_called_once_with(
+                    node, max_stale=None, slaves=False
+                )
 
     def test_command_output(self):
         node = 'node1'
@@ -71,3 +74,79 @@ class TestInspect(ClusterTestCase):
                         "Master apps of node {node}:".format(node=node),
                     ])
                 )
+
+    def test_command_output_many_nodes_with_slaves(self):
+        self.mocked_consul.configure_mock(**{
+            'kv.find': lambda state: self._app_kv,
+        })
+
+        with OutputCapture() as output:
+            with mock.patch(
+                    'sys.argv',
+                    ['cluster', 'inspect', '--slaves', 'node1', 'node3']
+            ):
+                main()
+        output.compare("\n".join([
+            "Master apps of node node1:",
+            "app1",
+            "app3",
+            "Slave apps of node node1:",
+            "app2",
+            "app4",
+            "Master apps of node node3:",
+            "app5",
+            "Slave apps of node node3:",
+            "",
+        ]))
+        self.mocked_consul.kv.find_index.assert_called_once_with('app/')
+
+    def test_command_output_all_nodes(self):
+        self.mocked_consul.configure_mock(**{
+            'kv.find': lambda state: self._app_kv,
+        })
+
+        with OutputCapture() as output:
+            with mock.patch('sys.argv', ['cluster', 'inspect', '--all']):
+                main()
+        output.compare("\n".join([
+            "Master apps of node node-1:",
+            "",
+            "Master apps of node node-2:",
+            "",
+            "Master apps of node node-3:",
+            "",
+            "Master apps of node node-4:",
+            "",
+        ]))
+
+    def test_command_line_requires_node(self):
+        with OutputCapture():
+            with mock.patch('sys.argv', ['cluster', 'inspect']):
+                with pytest.raises(SystemExit):
+                    main()
+
+    def test_command_output_ndjson(self):
+        self.mocked_consul.configure_mock(**{
+            'kv.find': lambda state: self._app_kv,
+        })
+
+        with OutputCapture() as output:
+            with mock.patch(
+                    'sys.argv',
+                    ['cluster', '--no-cache', 'inspect', '-s', '-o', 'ndjson',
+                     'node1']
+            ):
+                main()
+        self.assertEqual(
+            [
+                (app['key'], app['role'])
+                for app in map(json.loads, output.captured.splitlines())
+            ],
+            [
+                ('app1', 'master'),
+                ('app2', 'slave'),
+                ('app3', 'master'),
+                ('app4', 'slave'),
+            ]
+        )
+        self.mocked_consul.kv.iter_find.assert_called_once_with('app/')
@@ -199,16 +199,14 @@ class TestMigrate(ClusterTestCase):
     def test_finished_migrate(self):
         self.init_mocks()
 
-        def kv_get_record(_):
+        def records(keys):
+            app_key, maintenance_key = keys
             call_number = Counter.get('test_finished_migrate')
             if call_number > 1 and call_number <= 3:
-                return True
-            return None
-
-        self.mocked_consul.configure_mock(**{
-            'kv.get_record.side_effect': kv_get_record
-        })
+                return {app_key: None, maintenance_key: {'Value': ''}}
+            return {app_key: None, maintenance_key: None}
 
+        self.init_mock_kv_watch(records)
         self.cluster.migrate(
             'migrate-repo',
             'prod',
@@ -364,6 +362,10 @@ class TestMigrateIssue14(ClusterTestCase):
                     target_branch=target_branch
                 ),
             ]
+            self.mocked_consul.kv.get.side_effect = self.fixture_app_kv(
+                source_branch=source_branch,
+                target_branch=target_branch
+            ).get
 
             self.cluster.migrate(
                 self._repo,
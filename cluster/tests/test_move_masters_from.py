@@ -1,3 +1,7 @@
+import threading
+import time
+
+from collections import Counter
 from unittest import mock
 
 from cluster.client import main
@@ -6,6 +10,25 @@ from cluster.tests.cluster_test_case import ClusterTestCase
 
 from testfixtures import OutputCapture
 
+SERVICES = [
+    'repo-name_branch-name.739a5',
+    'migrate-repo_qualif.12345',
+    'migrate-repo_prod.12345',
+]
+
+
+def check(service, status='passing', name='http', node='node-2'):
+    """Health check record as returned by consul"""
+    return {
+        'Node': node,
+        'CheckID': '{}:{}'.format(service or 'node', name),
+        'Name': name,
+        'Status': status,
+        'Output': '',
+        'ServiceID': service,
+        'ServiceName': service,
+    }
+
 
 class TestMoveMastersFrom(ClusterTestCase):
 
@@ -31,9 +54,87 @@ class TestMoveMastersFrom(ClusterTestCase):
                     master='node-2',
                     no_wait=True,
                     timeout=5,
-                    ask_user=False
+                    ask_user=False,
+                    parallel=1,
+                    max_per_node=None,
+                    wave_size=None,
+                    health_timeout=cluster.DEFAULT_HEALTH_TIMEOUT
+                )
+
+    def test_command_line_parallel(self):
+        with mock.patch(
+                'sys.argv',
+                [
+                    'cluster',
+                    '-y',
+                    'move-masters-from',
+                    'node-1',
+                    '-p',
+                    '4',
+                    '--max-per-node',
+                    '2',
+                ]
+        ):
+            with mock.patch('cluster.cluster.Cluster.move_masters_from') as mo:
+                main()
+                mo.assert_called_once_with(
+                    'node-1',
+                    master=None,
+                    no_wait=False,
+                    timeout=cluster.DEFAULT_TIMEOUT,
+                    ask_user=False,
+                    parallel=4,
+                    max_per_node=2,
+                    wave_size=None,
+                    health_timeout=cluster.DEFAULT_HEALTH_TIMEOUT
                 )
 
+    def test_command_line_wave_size(self):
+        with mock.patch(
+                'sys.argv',
+                [
+                    'cluster',
+                    'move-masters-from',
+                    'node-1',
+                    '--wave-size',
+                    '2',
+                    '--health-timeout',
+                    '60',
+                ]
+        ):
+            with mock.patch('cluster.cluster.Cluster.move_masters_from') as mo:
+                main()
+                self.assertEqual(mo.call_args[1]['wave_size'], 2)
+                self.assertEqual(mo.call_args[1]['health_timeout'], 60)
+        for option in (['--no-wait'], ['-p', '2']):
+            with mock.patch(
+                    'sys.argv',
+                    ['cluster', 'move-masters-from', 'node-1',
+                     '--wave-size', '2'] + option
+            ):
+                with mock.patch(
+                        'cluster.cluster.Cluster.move_masters_from'
+                ) as mo:
+                    with OutputCapture():
+                        self.assertRaises(SystemExit, main)
+                    mo.assert_not_called()
+
+    def test_command_line_invalid_counts(self):
+        for args in (
+                ['move-masters-from', 'node-1', '-p', '0'],
+                ['move-masters-from', 'node-1', '--max-per-node', '-1'],
+                ['move-masters-from', 'node-1', '--wave-size', '0'],
+                ['rebalance', '--parallel', '-2'],
+                ['rebalance', '--max-per-node', '0'],
+                ['deploy', '--from-file', 'plan.json', '-p', 'two'],
+        ):
+            with mock.patch('sys.argv', ['cluster'] + args):
+                with mock.patch('cluster.cluster.Cluster') as mo:
+                    with OutputCapture(separate=True) as output:
+                        self.assertRaises(SystemExit, main)
+                    mo.assert_not_called()
+            self.assertIn('positive', output.stderr.getvalue())
+
     @mock.patch('cluster.util.get_input', return_value='yes')
     def test_move_masters_from(self, _):
         self.init_mocks(extra={
@@ -163,3 +264,245 @@ class TestMoveMastersFrom(ClusterTestCase):
         self.assertTrue(
             "Not confirmed, Aborting" in output.captured
         )
+
+    def test_move_masters_from_parallel(self):
+        self.init_mocks(extra={
+            "master": 'node-1',
+            "slave": 'node-2',
+        })
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            with OutputCapture() as output:
+                self.cluster.move_masters_from(
+                    'node-1', ask_user=False, parallel=3
+                )
+            self.assertEqual(mo.call_count, 3)
+            mo.assert_any_call(
+                'app/migrate-repo_prod.12345',
+                'ssh://git@git.example.org:2222/services/repo-name',
+                'prod',
+                'node-2',
+                slave='node-1',
+                no_wait=False,
+                timeout=cluster.DEFAULT_TIMEOUT,
+                update=False,
+            )
+        self.assertIn(
+            " - app/migrate-repo_prod.12345 "
+            "[master: node-2 - replicate: node-1]: done",
+            output.captured
+        )
+
+    def test_move_masters_from_parallel_report_timeout(self):
+        self.init_mocks(extra={
+            "master": 'node-1',
+            "slave": 'node-2',
+        })
+
+        def deploy(kv_key, *args, **kwargs):
+            if kv_key == 'app/migrate-repo_qualif.12345':
+                raise TimeoutError("too long")
+
+        with mock.patch(
+                'cluster.cluster.Cluster._deploy', side_effect=deploy
+        ) as mo:
+            with OutputCapture() as output:
+                self.assertRaises(
+                    RuntimeError,
+                    self.cluster.move_masters_from,
+                    'node-1',
+                    ask_user=False,
+                    parallel=2
+                )
+            self.assertEqual(mo.call_count, 3)
+        self.assertIn(
+            " - app/migrate-repo_qualif.12345 "
+            "[master: node-2 - replicate: node-1]: timeout",
+            output.captured
+        )
+        self.assertIn(
+            " - app/migrate-repo_prod.12345 "
+            "[master: node-2 - replicate: node-1]: done",
+            output.captured
+        )
+
+    def test_deploy_many_max_per_node(self):
+        running = Counter()
+        max_running = Counter()
+        lock = threading.Lock()
+
+        def deploy(kv_key, repo_url, branch, master, **kwargs):
+            with lock:
+                running[master] += 1
+                max_running[master] = max(
+                    max_running[master], running[master]
+                )
+            time.sleep(0.05)
+            with lock:
+                running[master] -= 1
+
+        deployments = [
+            cluster.Deployment(
+                'app/{}'.format(i), 'repo', 'branch', 'node-1', None
+            )
+            for i in range(6)
+        ] + [
+            cluster.Deployment(
+                'app/{}'.format(i), 'repo', 'branch', 'node-2', None
+            )
+            for i in range(6, 8)
+        ]
+        with mock.patch(
+                'cluster.cluster.Cluster._deploy', side_effect=deploy
+        ):
+            results = self.cluster._deploy_many(
+                deployments, parallel=4, max_per_node=2
+            )
+        self.assertEqual(len(results), 8)
+        self.assertFalse([error for _, error in results if error])
+        self.assertEqual(max_running, {'node-1': 2, 'node-2': 2})
+
+    def test_deploy_many_nothing_can_start(self):
+        deployments = [
+            cluster.Deployment('app/a', 'repo', 'branch', 'node-1', None)
+        ]
+        with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+            with self.assertRaisesRegex(RuntimeError, 'No deployment'):
+                self.cluster._deploy_many(
+                    deployments, parallel=2, max_per_node=-1
+                )
+            mo.assert_not_called()
+
+    def move_by_waves(self, checks, **kwargs):
+        """Move the 3 services of node-1 to node-2 by waves of 2 services,
+        ``checks`` are returned by successive ``Cluster._node_checks`` calls
+        then all services checks are passing
+
+        :return: ``_deploy`` mock, output and the raised RuntimeError if any
+        """
+        self.init_mocks(extra={
+            "master": 'node-1',
+            "slave": 'node-2',
+        })
+        checks = iter(checks)
+        error = None
+
+        def node_checks(node):
+            return next(checks, [check(service) for service in SERVICES])
+
+        with mock.patch(
+                'cluster.cluster.Cluster._node_checks', side_effect=node_checks
+        ):
+            with mock.patch('cluster.cluster.Cluster._deploy') as mo:
+                with OutputCapture() as output:
+                    try:
+                        self.cluster.move_masters_from(
+                            'node-1', ask_user=False, wave_size=2,
+                            health_interval=0.01, **kwargs
+                        )
+                    except RuntimeError as err:
+                        error = err
+        return mo, output, error
+
+    def test_move_masters_from_waves(self):
+        passing = [check(service) for service in SERVICES]
+        failing = [check(service, 'critical') for service in SERVICES]
+        # the first wave services checks take 2 polls to pass
+        mo, output, error = self.move_by_waves(
+            [[], failing, failing, passing]
+        )
+        self.assertIsNone(error)
+        self.assertEqual(mo.call_count, 3)
+        self.assertIn(
+            "Wave 1: moving 2 service(s) to node-2, 1 left", output.captured
+        )
+        self.assertIn(
+            "Wave 2: moving 1 service(s) to node-2, 0 left", output.captured
+        )
+        self.assertNotIn("slowing down", output.captured)
+
+    def test_move_masters_from_waves_failing_before(self):
+        # a check of another service failing before the wave is ignored
+        states = [check(service) for service in SERVICES] + [
+            check('other-service', 'critical')
+        ]
+        mo, output, error = self.move_by_waves([states] * 10)
+        self.assertIsNone(error)
+        self.assertEqual(mo.call_count, 3)
+        self.assertNotIn("slowing down", output.captured)
+
+    def test_move_masters_from_waves_unhealthy(self):
+        failing = [check(service, 'critical') for service in SERVICES]
+        mo, output, error = self.move_by_waves(
+            [failing] * 100, health_timeout=0.1
+        )
+        self.assertEqual(
+            str(error), "3 on 3 service(s) were not deployed"
+        )
+        # the second wave is not deployed
+        self.assertEqual(mo.call_count, 2)
+        self.assertIn(
+            "[master: node-2 - replicate: node-1]: failed (service not "
+            "healthy after 0.1s: failing checks: http)",
+            output.captured
+        )
+        self.assertIn(
+            "[master: node-2 - replicate: node-1]: failed (not deployed, "
+            "wave 1 failed)",
+            output.captured
+        )
+
+    def test_move_masters_from_waves_not_registered(self):
+        start = time.monotonic()
+        with self.assertLogs('cluster.cluster', 'WARNING') as logs:
+            mo, output, error = self.move_by_waves([[]] * 100)
+        # the deployment is confirmed by the registry, services without
+        # check are not waited
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIsNone(error)
+        self.assertEqual(mo.call_count, 3)
+        self.assertIn("without registered check", logs.output[0])
+
+    def test_deploy_waves_back_off(self):
+        deployments = [
+            cluster.Deployment(
+                'app/service-{}'.format(i), 'repo', 'branch', 'node-2', None
+            )
+            for i in range(4)
+        ]
+        node_failing = []
+
+        def deploy(*args, **kwargs):
+            # the node serf check fails once the first wave is deployed
+            node_failing.append(check('', 'critical', name='serfHealth'))
+
+        def node_checks(node):
+            return [
+                check('service-{}'.format(i)) for i in range(4)
+            ] + node_failing[:1]
+
+        with mock.patch(
+                'cluster.cluster.Cluster._deploy', side_effect=deploy
+        ):
+            with mock.patch(
+                    'cluster.cluster.Cluster._node_checks',
+                    side_effect=node_checks
+            ):
+                with OutputCapture() as output:
+                    results = self.cluster._deploy_waves(
+                        deployments, 2, health_interval=0.01
+                    )
+        self.assertFalse([error for _, error in results if error])
+        output.compare("\n".join([
+            "Wave 1: moving 2 service(s) to node-2, 2 left",
+            "Checks started failing: node:serfHealth (node-2), slowing "
+            "down to 1 service(s) per wave",
+            # the node check known as failing does not slow down next waves
+            "Wave 2: moving 1 service(s) to node-2, 1 left",
+            "Wave 3: moving 1 service(s) to node-2, 0 left",
+        ]))
+
+    def test_service_id(self):
+        self.assertEqual(
+            cluster.service_id('app/repo-name_prod.739a5'),
+            'repo-name_prod.739a5'
+        )
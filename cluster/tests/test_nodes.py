@@ -1,3 +1,6 @@
+from unittest import TestCase
+
+from cluster import consul_api
 from cluster.cluster import Cluster
 from cluster.tests.cluster_test_case import ClusterTestCase
 
@@ -10,3 +13,22 @@ class TestDeploy(ClusterTestCase):
             self.cluster.nodes,
             ['node-1', 'node-2', 'node-3', 'node-4']
         )
+
+
+class TestConsulClient(TestCase):
+
+    def test_pooled_adapter(self):
+        cluster = Cluster(
+            'http://fake.host:8500',
+            pool_size=3,
+            connect_timeout=1,
+            read_timeout=2
+        )
+        adapter = cluster.consul._adapter
+        self.assertIsInstance(adapter, consul_api.Request)
+        self.assertEqual(adapter.timeout, (1, 2))
+        self.assertEqual(
+            adapter.session.get_adapter('http://fake.host')._pool_maxsize,
+            3
+        )
+        self.assertIs(cluster.consul.kv._adapter, adapter)
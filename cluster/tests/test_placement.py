@@ -0,0 +1,155 @@
+import json
+import unittest
+
+from cluster import placement
+from cluster import registry
+from cluster import util
+
+
+def node_index(apps):
+    return registry.NodeIndex({
+        key: util.json2obj(json.dumps(value)) for key, value in apps.items()
+    })
+
+
+def score(masters, slaves, failing=0, node_failing=0):
+    return {
+        'masters': masters,
+        'slaves': slaves,
+        'failing': failing,
+        'node_failing': node_failing,
+    }
+
+
+class TestPlacement(unittest.TestCase):
+
+    def test_app_weight(self):
+        app = util.json2obj(
+            json.dumps({'master': 'n1', 'weight': 3, 'size': 'big'})
+        )
+        self.assertEqual(placement.app_weight(app), 1)
+        self.assertEqual(placement.app_weight(app, 'weight'), 3)
+        self.assertEqual(placement.app_weight(app, 'size'), 1)
+        self.assertEqual(placement.app_weight(app, 'missing'), 1)
+
+    def test_node_loads(self):
+        index = node_index({
+            'app/a': {'master': 'n1', 'weight': 2},
+            'app/b': {'master': 'n1', 'weight': 0.5},
+            'app/c': {'master': 'n2'},
+            'app/d': {'master': 'unknown'},
+        })
+        self.assertEqual(
+            placement.node_loads(index, ['n1', 'n2', 'n3']),
+            {'n1': 2, 'n2': 1, 'n3': 0}
+        )
+        loads = placement.node_loads(index, ['n1', 'n2', 'n3'], 'weight')
+        self.assertEqual(loads, {'n1': 2.5, 'n2': 1, 'n3': 0})
+        self.assertEqual(placement.imbalance(loads), 2.5)
+        self.assertEqual(placement.imbalance({}), 0)
+
+    def test_plan_rebalance(self):
+        index = node_index({
+            'app/a': {'master': 'n1', 'slave': 'n2'},
+            'app/b': {'master': 'n1', 'slave': 'n3'},
+            'app/c': {'master': 'n1', 'slave': None},
+            'app/d': {'master': 'n1', 'slave': 'n2'},
+            'app/e': {'master': 'n2', 'slave': 'n1'},
+        })
+        moves, loads = placement.plan_rebalance(index, ['n1', 'n2', 'n3'])
+        self.assertEqual(loads, {'n1': 2, 'n2': 2, 'n3': 1})
+        # n3 is the slave of app/b: master and slave are switched
+        self.assertEqual(moves[0], ('app/b', 'n3', 'n1'))
+        self.assertEqual(len(moves), 2)
+        key, master, slave = moves[1]
+        self.assertEqual(master, 'n2')
+        self.assertNotEqual(master, slave)
+        self.assertEqual(index.apps[key].master, 'n1')
+
+    def test_plan_rebalance_weight(self):
+        index = node_index({
+            'app/big': {'master': 'n1', 'slave': None, 'weight': 6},
+            'app/a': {'master': 'n1', 'slave': None, 'weight': 2},
+            'app/b': {'master': 'n1', 'slave': None, 'weight': 2},
+        })
+        moves, loads = placement.plan_rebalance(
+            index, ['n1', 'n2'], weight='weight'
+        )
+        # a single move gets the same imbalance than moving a and b
+        self.assertEqual(moves, [('app/big', 'n2', None)])
+        self.assertEqual(loads, {'n1': 4, 'n2': 6})
+
+    def test_plan_balanced(self):
+        index = node_index({
+            'app/a': {'master': 'n1', 'slave': 'n2'},
+            'app/b': {'master': 'n2', 'slave': 'n1'},
+            'app/c': {'master': 'n2', 'slave': 'n1'},
+        })
+        self.assertEqual(
+            placement.plan_rebalance(index, ['n1', 'n2']),
+            ([], {'n1': 1, 'n2': 2})
+        )
+
+    def test_node_scores(self):
+        index = node_index({
+            'app/a': {'master': 'n1', 'slave': 'n2'},
+            'app/b': {'master': 'n1', 'slave': None},
+            'app/c': {'master': 'n2', 'slave': 'n3'},
+        })
+        checks = {
+            'n2': {
+                '': {'checks': [('serfHealth', 'critical', '')], 'name': ''},
+            },
+            'n3': {
+                'web-1': {
+                    'checks': [('http', 'critical', '')], 'name': 'web'
+                },
+                'db-1': {'checks': [('tcp', 'warning', '')], 'name': 'db'},
+            },
+        }
+        self.assertEqual(
+            placement.node_scores(index, ['n1', 'n2', 'n3'], checks),
+            {
+                'n1': {
+                    'masters': 2, 'slaves': 0, 'failing': 0,
+                    'node_failing': 0,
+                },
+                'n2': {
+                    'masters': 1, 'slaves': 1, 'failing': 0,
+                    'node_failing': 1,
+                },
+                'n3': {
+                    'masters': 0, 'slaves': 1, 'failing': 2,
+                    'node_failing': 0,
+                },
+            }
+        )
+
+    def test_auto_place(self):
+        scores = {
+            'n1': score(2, 0),
+            'n2': score(1, 1),
+            'n3': score(0, 1, node_failing=1),
+            'n4': score(1, 2),
+        }
+        # n3 is the least loaded but unhealthy
+        self.assertEqual(placement.auto_place(scores), ('n2', 'n1'))
+
+    def test_auto_place_failing_services(self):
+        # failing checks of other services do not exclude nodes, they
+        # break ties
+        scores = {
+            'n1': score(1, 1, failing=3),
+            'n2': score(1, 1, failing=1),
+            'n3': score(1, 1, failing=2),
+        }
+        self.assertEqual(placement.auto_place(scores), ('n2', 'n3'))
+
+    def test_auto_place_single_healthy_node(self):
+        scores = {
+            'n1': score(2, 0, failing=1),
+            'n2': score(0, 0, node_failing=1),
+        }
+        self.assertEqual(placement.auto_place(scores), ('n1', None))
+        scores['n1']['node_failing'] = 1
+        self.assertRaises(RuntimeError, placement.auto_place, scores)
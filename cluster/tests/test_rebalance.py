@@ -0,0 +1,105 @@
+import json
+
+from unittest import mock
+
+from testfixtures import OutputCapture
+
+from cluster import cluster
+from cluster.client import main
+from cluster.tests.cluster_test_case import ClusterTestCase
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/{}'
+
+
+class TestRebalance(ClusterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        apps = {
+            'app/a_prod.1': ('node-1', 'node-2'),
+            'app/b_prod.2': ('node-1', 'node-3'),
+            'app/c_prod.3': ('node-1', None),
+            'app/d_prod.4': ('node-1', 'node-2'),
+            'app/e_prod.5': ('node-2', 'node-1'),
+        }
+        self.mocked_consul.configure_mock(**{
+            'kv.find.return_value': {
+                key: json.dumps({
+                    'repo_url': REPO_URL.format(key[4]),
+                    'branch': 'prod',
+                    'master': master,
+                    'slave': slave,
+                })
+                for key, (master, slave) in apps.items()
+            },
+        })
+
+    def test_command_line(self):
+        with mock.patch(
+                'sys.argv',
+                ['cluster', '-y', 'rebalance', '--weight', 'weight', '-n']
+        ):
+            with mock.patch('cluster.cluster.Cluster.rebalance') as mo:
+                main()
+                mo.assert_called_once_with(
+                    weight='weight',
+                    no_wait=False,
+                    timeout=cluster.DEFAULT_TIMEOUT,
+                    ask_user=False,
+                    parallel=cluster.DEFAULT_PARALLEL,
+                    max_per_node=None,
+                    dry_run=True
+                )
+
+    def test_dry_run(self):
+        with OutputCapture() as output:
+            with mock.patch('cluster.cluster.Cluster._deploy') as deploy:
+                self.cluster.rebalance(dry_run=True)
+        deploy.assert_not_called()
+        output.compare("\n".join([
+            "Master load per node:",
+            " - node-1: 4 -> 2",
+            " - node-2: 1 -> 1",
+            " - node-3: 0 -> 1",
+            " - node-4: 0 -> 1",
+            "Imbalance (max - min load): 4 -> 1",
+            "Moves:",
+            " - app/b_prod.2 from [master: node-1 - replicate: node-3] to "
+            "[master: node-3 - replicate: node-1]",
+            " - app/a_prod.1 from [master: node-1 - replicate: node-2] to "
+            "[master: node-4 - replicate: node-2]",
+        ]))
+
+    @mock.patch('cluster.util.get_input', return_value='yes')
+    def test_rebalance(self, _):
+        with OutputCapture() as output:
+            with mock.patch('cluster.cluster.Cluster._deploy') as deploy:
+                self.cluster.rebalance(parallel=2, timeout=5)
+        self.assertEqual(
+            sorted(deploy.call_args_list),
+            sorted([
+                mock.call(
+                    'app/a_prod.1', REPO_URL.format('a'), 'prod', 'node-4',
+                    slave='node-2', no_wait=False, timeout=5, update=False
+                ),
+                mock.call(
+                    'app/b_prod.2', REPO_URL.format('b'), 'prod', 'node-3',
+                    slave='node-1', no_wait=False, timeout=5, update=False
+                ),
+            ])
+        )
+        self.assertIn("Services outcome:", output.captured)
+
+    @mock.patch('cluster.util.get_input', return_value='no')
+    def test_not_confirmed(self, _):
+        with OutputCapture() as output:
+            with mock.patch('cluster.cluster.Cluster._deploy') as deploy:
+                self.cluster.rebalance()
+        deploy.assert_not_called()
+        self.assertIn("Not confirmed, Aborting", output.captured)
+
+    def test_balanced(self):
+        self.mocked_consul.kv.find.return_value = {}
+        with OutputCapture() as output:
+            self.cluster.rebalance(ask_user=False)
+        self.assertIn("Nodes are balanced, nothing to move", output.captured)
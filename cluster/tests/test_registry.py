@@ -0,0 +1,168 @@
+import os
+import time
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster.client import main
+from cluster import util
+from cluster.cluster import Cluster
+from cluster.registry import NodeIndex, repo_branches
+from cluster.tests.cluster_test_case import ClusterTestCase
+
+
+class TestRegistryCache(ClusterTestCase):
+
+    _app_kv = {
+        "app/app1": '{"master": "node1", "slave": "node2"}',
+        "app/app2": '{"master": "node2", "slave": "node1"}',
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.mocked_consul.configure_mock(**{
+            'kv.find.return_value': self._app_kv,
+        })
+        self.cluster = Cluster(
+            'http://fake.host', cache_dir=self.cache_dir.name
+        )
+
+    def test_no_cache(self):
+        self.assertEqual(
+            Cluster('http://fake.host').get_kv_registry(), self._app_kv
+        )
+        self.mocked_consul.kv.find.assert_called_once_with('app/')
+        self.assertFalse(os.listdir(self.cache_dir.name))
+
+    def test_download_once(self):
+        self.assertEqual(self.cluster.get_kv_registry(), self._app_kv)
+        self.assertEqual(self.cluster.get_kv_registry(), self._app_kv)
+        self.mocked_consul.kv.find_index.assert_called_once_with('app/')
+        self.mocked_consul.kv.keys_index.assert_called_once_with('app/')
+
+    def test_index_changed(self):
+        self.cluster.get_kv_registry()
+        self.mocked_consul.kv.keys_index.side_effect = None
+        self.mocked_consul.kv.keys_index.return_value = (2, [])
+        self.mocked_consul.kv.find_index.side_effect = None
+        self.mocked_consul.kv.find_index.return_value = (2, {})
+        self.assertEqual(self.cluster.get_kv_registry(), {})
+        self.assertEqual(self.mocked_consul.kv.find_index.call_count, 2)
+
+    def test_max_stale(self):
+        self.cluster.get_kv_registry()
+        self.assertEqual(
+            self.cluster.get_kv_registry(max_stale=60), self._app_kv
+        )
+        self.mocked_consul.kv.keys_index.assert_not_called()
+
+    def test_max_stale_too_old(self):
+        self.cluster.get_kv_registry()
+        old_date = time.time() - 120
+        os.utime(self.cluster._registry_cache.path, (old_date, old_date))
+        self.cluster.get_kv_registry(max_stale=60)
+        self.mocked_consul.kv.keys_index.assert_called_once_with('app/')
+        # revalidated cache is fresh again
+        self.assertLess(
+            time.time() - os.path.getmtime(self.cluster._registry_cache.path),
+            60
+        )
+
+    def test_corrupted_cache(self):
+        self.cluster.get_kv_registry()
+        with open(self.cluster._registry_cache.path, 'w') as cache_file:
+            cache_file.write('{"index"')
+        self.assertEqual(self.cluster.get_kv_registry(), self._app_kv)
+        self.assertEqual(self.mocked_consul.kv.find_index.call_count, 2)
+
+    def test_memory_ttl(self):
+        cluster = Cluster('http://fake.host', memory_ttl=60)
+        with mock.patch('time.monotonic', return_value=100):
+            self.assertEqual(cluster.get_kv_registry(), self._app_kv)
+            self.assertEqual(cluster.nodes[0], 'node-1')
+        with mock.patch('time.monotonic', return_value=160):
+            self.assertEqual(cluster.get_kv_registry(), self._app_kv)
+            cluster.nodes
+        self.mocked_consul.kv.find.assert_called_once_with('app/')
+        self.mocked_consul.catalog.nodes.assert_called_once_with()
+        with mock.patch('time.monotonic', return_value=161):
+            cluster.get_kv_registry()
+            cluster.nodes
+        self.assertEqual(self.mocked_consul.kv.find.call_count, 2)
+        self.assertEqual(self.mocked_consul.catalog.nodes.call_count, 2)
+
+    def test_refresh(self):
+        cluster = Cluster('http://fake.host', memory_ttl=60)
+        cluster.get_kv_registry()
+        cluster.nodes
+        cluster.refresh()
+        cluster.get_kv_registry()
+        cluster.nodes
+        self.assertEqual(self.mocked_consul.kv.find.call_count, 2)
+        self.assertEqual(self.mocked_consul.catalog.nodes.call_count, 2)
+
+    def test_no_memory_ttl(self):
+        cluster = Cluster('http://fake.host')
+        cluster.get_kv_registry()
+        cluster.get_kv_registry()
+        self.assertEqual(self.mocked_consul.kv.find.call_count, 2)
+
+    def test_command_line_max_stale(self):
+        with OutputCapture() as output:
+            with mock.patch(
+                    'sys.argv', ['cluster', 'inspect', 'node1']
+            ):
+                main()
+            with mock.patch(
+                    'sys.argv',
+                    ['cluster', 'inspect', '--max-stale', '60', 'node1']
+            ):
+                main()
+        output.compare("\n".join([
+            "Master apps of node node1:",
+            "app/app1",
+            "Master apps of node node1:",
+            "app/app1",
+        ]))
+        self.mocked_consul.kv.find_index.assert_called_once_with('app/')
+        self.mocked_consul.kv.keys_index.assert_not_called()
+
+    def test_command_line_no_cache(self):
+        with OutputCapture():
+            with mock.patch(
+                    'sys.argv', ['cluster', '--no-cache', 'inspect', 'node1']
+            ):
+                main()
+        self.mocked_consul.kv.find.assert_called_once_with('app/')
+        self.mocked_consul.kv.find_index.assert_not_called()
+
+
+class TestNodeIndex(ClusterTestCase):
+
+    def test_index(self):
+        index = NodeIndex({
+            'app/b': util.json2obj('{"master": "node1", "slave": "node2"}'),
+            'app/a': util.json2obj('{"master": "node1", "slave": null}'),
+            'app/c': util.json2obj('{"master": "node2"}'),
+        })
+        self.assertEqual(index.masters, {
+            'node1': ['app/a', 'app/b'],
+            'node2': ['app/c'],
+        })
+        self.assertEqual(index.slaves, {'node2': ['app/b']})
+        self.assertEqual(index.masters['node3'], [])
+
+
+class TestRepoBranches(ClusterTestCase):
+
+    def test_repo_branches(self):
+        self.assertEqual(
+            repo_branches({
+                'app/a': '{"repo_url": "ssh://h/n/Repo-A/", "branch": "prod"}',
+                'app/b': '{"repo_url": "ssh://h/ns/repo-a", "branch": "dev"}',
+                'app/c': '{"repo_url": "ssh://h/ns/repo-c", "branch": null}',
+                'app/d': '{"master": "node1"}',
+                'app/e': 'not json',
+            }),
+            {'repo-a': ['dev', 'prod'], 'repo-c': ['']}
+        )
@@ -0,0 +1,153 @@
+import io
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import shell
+from cluster.client import main
+from cluster.fake_consul import FakeConsul
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+class TestShell(unittest.TestCase):
+    """Run the shell against the fake consul"""
+
+    def setUp(self):
+        self.fake = FakeConsul(nodes=['node-1', 'node-2', 'other'])
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.key = self.fake.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.fake.put_app(REPO_URL, 'preprod', 'node-2')
+        self.fake.put_app(REPO_URL + '-other', 'prod', 'other')
+        self.argv = [
+            'cluster', '--consul', self.fake.url, '--no-cache', '-y', 'shell'
+        ]
+
+    def run_shell(self, *lines):
+        with mock.patch('sys.argv', self.argv):
+            with mock.patch('sys.stdin', io.StringIO(
+                    ''.join(line + '\n' for line in lines)
+            )):
+                with OutputCapture(separate=True) as output:
+                    main()
+        return output
+
+    def get_shell(self):
+        with mock.patch('sys.argv', self.argv):
+            with mock.patch.object(
+                    shell.Shell, 'cmdloop', autospec=True
+            ) as cmdloop:
+                main()
+        return cmdloop.call_args[0][0]
+
+    def test_reuse_cluster(self):
+        output = self.run_shell('inspect node-1', 'inspect -s node-2')
+        self.assertIn(self.key, output.stdout.getvalue())
+        self.assertEqual(self.fake.requests['GET kv'], 1)
+        self.assertEqual(self.fake.requests['GET catalog/nodes'], 0)
+
+    def test_refresh(self):
+        self.run_shell('inspect --all', 'refresh', 'inspect --all')
+        self.assertEqual(self.fake.requests['GET kv'], 2)
+        self.assertEqual(self.fake.requests['GET catalog/nodes'], 2)
+
+    def test_registry_dropped_after_deploy(self):
+        with mock.patch(
+                'cluster.cluster.Cluster.refresh', autospec=True
+        ) as refresh:
+            self.run_shell(
+                'inspect node-1',
+                'deploy repo-name prod --master other --slave node-1 -d',
+                'inspect node-1 other',
+            )
+        self.assertEqual(self.fake.events[0][0], 'deploy')
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_errors(self):
+        output = self.run_shell(
+            'foo', 'checks --bad', 'deploy unknown prod', 'checks'
+        )
+        stderr = output.stderr.getvalue()
+        self.assertIn("Unknown command: foo", stderr)
+        self.assertIn("unrecognized arguments: --bad", stderr)
+        self.assertIn("Error: ", stderr)
+        self.assertEqual(self.fake.requests['GET health/state'], 1)
+
+    def test_exit(self):
+        output = self.run_shell('exit', 'checks')
+        self.assertEqual(self.fake.requests['GET health/state'], 0)
+        self.assertEqual(output.stderr.getvalue(), '')
+
+    def test_empty_line(self):
+        self.run_shell('checks', '', '')
+        self.assertEqual(self.fake.requests['GET health/state'], 1)
+
+    def test_help(self):
+        output = self.run_shell('help', 'help move-masters-from')
+        stdout = output.stdout.getvalue()
+        self.assertIn("  move-masters-from", stdout)
+        self.assertIn("usage: cluster move-masters-from", stdout)
+
+    def complete(self, line):
+        shell_ = self.get_shell()
+        text = line.split(' ')[-1]
+        begidx = len(line) - len(text)
+        if not line[:begidx].strip():
+            return shell_.completenames(text)
+        return shell_.completedefault(text, line, begidx, len(line))
+
+    def test_complete_commands(self):
+        self.assertEqual(self.complete('m'), ['migrate', 'move-masters-from'])
+        self.assertEqual(self.complete('re'), ['rebalance', 'refresh'])
+
+    def test_complete_nodes(self):
+        self.assertEqual(self.complete('inspect no'), ['node-1', 'node-2'])
+        self.assertEqual(
+            self.complete('inspect node-1 -s node-'), ['node-1', 'node-2']
+        )
+        self.assertEqual(self.complete('move-masters-from o'), ['other'])
+        self.assertEqual(self.complete('move-masters-from other '), [])
+        self.assertEqual(
+            self.complete('move-masters-from other -m n'),
+            ['node-1', 'node-2']
+        )
+        self.assertEqual(
+            self.complete('deploy repo-name prod --slave '),
+            ['node-1', 'node-2', 'other']
+        )
+        self.assertEqual(self.complete('checks --node o'), ['other'])
+
+    def test_complete_repos(self):
+        self.assertEqual(
+            self.complete('deploy rep'), ['repo-name', 'repo-name-other']
+        )
+        self.assertEqual(
+            self.complete('deploy --master node-1 repo-name p'),
+            ['preprod', 'prod']
+        )
+        self.assertEqual(self.complete('deploy repo-name prod '), [])
+        self.assertEqual(
+            self.complete('migrate repo-name prod pr'), ['preprod', 'prod']
+        )
+        self.assertEqual(
+            self.complete('migrate repo-name prod --target-repo repo-name-o'),
+            ['repo-name-other']
+        )
+        self.assertEqual(
+            self.complete('migrate repo-name prod --target-repo '
+                          'repo-name-other '),
+            ['prod']
+        )
+
+    def test_complete_options(self):
+        self.assertEqual(self.complete('inspect --s'), ['--slaves'])
+        self.assertEqual(self.complete('deploy -t '), [])
+
+    def test_complete_consul_error(self):
+        shell_ = self.get_shell()
+        self.fake.stop()
+        self.assertEqual(
+            shell_.completedefault('n', 'inspect n', 8, 9), []
+        )
@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# modules slow to import that the command line must not load until a
+# command really needs to talk with consul
+HEAVY_MODULES = ['pkg_resources', 'consulate', 'requests']
+MAX_IMPORT_TIME = 0.5  # seconds, measured ~0.05s
+
+
+def run_python(code):
+    """Run code in a fresh interpreter, its last output line is json"""
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_client(self):
+        result = run_python(
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import cluster.client\n"
+            "duration = time.perf_counter() - start\n"
+            "print(json.dumps({{\n"
+            "    'duration': duration,\n"
+            "    'modules': [m for m in {} if m in sys.modules],\n"
+            "}}))\n".format(HEAVY_MODULES)
+        )
+        self.assertEqual(result['modules'], [])
+        self.assertLess(result['duration'], MAX_IMPORT_TIME)
+
+    def test_help(self):
+        result = run_python(
+            "import json, sys\n"
+            "sys.argv = ['cluster', '-h']\n"
+            "from cluster.client import main\n"
+            "try:\n"
+            "    main()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(json.dumps([m for m in {} if m in sys.modules]))\n".format(
+                HEAVY_MODULES
+            )
+        )
+        self.assertEqual(result, [])
@@ -0,0 +1,124 @@
+import json
+import tempfile
+import unittest
+
+from testfixtures import OutputCapture
+from unittest import mock
+
+from cluster import stats
+from cluster.client import main
+from cluster.cluster import Cluster
+from cluster.fake_consul import FakeConsul
+
+REPO_URL = 'ssh://git@git.example.org:2222/services/repo-name'
+
+
+class TestStats(unittest.TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(
+            stats.endpoint('GET', 'http://h:8500/v1/kv/app/key?recurse=1'),
+            'GET kv'
+        )
+        self.assertEqual(
+            stats.endpoint('GET', '/v1/kv/app/key?index=12&wait=30s'),
+            'GET kv (blocking)'
+        )
+        self.assertEqual(
+            stats.endpoint('GET', '/v1/health/state/any'),
+            'GET health/state'
+        )
+        self.assertEqual(stats.endpoint('PUT', '/v1/txn'), 'PUT txn')
+        for url in ('http://h:8500', '/', '/v1', '/v1/'):
+            self.assertEqual(stats.endpoint('GET', url), 'GET /')
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(stats.percentile(values, 50), 50)
+        self.assertEqual(stats.percentile(values, 99), 99)
+        self.assertEqual(stats.percentile([3], 90), 3)
+        self.assertIsNone(stats.percentile([], 90))
+
+    def test_report(self):
+        collected = stats.Stats()
+        with collected.phase('fire'):
+            pass
+        collected.add_phase('resolve', 0.5)
+        collected.add_phase('resolve', 0.25)
+        for latency in (0.1, 0.2, 0.3):
+            collected.record('GET', '/v1/catalog/nodes', 10, latency)
+        report = collected.report()
+        self.assertEqual(list(report['phases']), ['resolve', 'fire'])
+        self.assertEqual(
+            report['phases']['resolve'], {'count': 2, 'time': 0.75}
+        )
+        self.assertEqual(report['requests']['GET catalog/nodes'], {
+            'count': 3, 'bytes': 30, 'p50': 0.2, 'p90': 0.3, 'p99': 0.3,
+            'max': 0.3,
+        })
+        self.assertEqual(report['total'], {'count': 3, 'bytes': 30})
+        self.assertIn(
+            " - GET catalog/nodes: 3 requests, 30 bytes, latency "
+            "p50=0.200s p90=0.300s p99=0.300s max=0.300s",
+            collected.format()
+        )
+
+    def test_phase_exception(self):
+        collected = stats.Stats()
+        with self.assertRaises(TimeoutError):
+            with collected.phase('wait-until-kv-changed'):
+                raise TimeoutError()
+        self.assertEqual(
+            collected.report()['phases']['wait-until-kv-changed']['count'], 1
+        )
+
+
+class TestCommandStats(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeConsul(
+            nodes=['node-1', 'node-2'], maintenance_duration=0.3
+        )
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.fake.put_app(REPO_URL, 'prod', 'node-1', 'node-2')
+        self.fake.put_app(REPO_URL, 'qualif', 'node-1')
+        self.stats = stats.Stats()
+        self.cluster = Cluster(self.fake.url, stats=self.stats)
+
+    def test_deploy(self):
+        self.cluster.deploy('repo-name', 'prod', ask_user=False, timeout=5)
+        report = self.stats.report()
+        self.assertEqual(
+            list(report['phases']),
+            ['resolve', 'validate', 'fire', 'wait-until-kv-changed']
+        )
+        self.assertEqual(report['requests']['PUT event/fire']['count'], 1)
+        self.assertEqual(report['requests']['GET catalog/nodes']['count'], 1)
+        self.assertGreater(report['total']['bytes'], 0)
+
+    def test_migrate(self):
+        self.cluster.migrate(
+            'repo-name', 'prod', 'qualif', ask_user=False, timeout=5
+        )
+        self.assertEqual(
+            list(self.stats.report()['phases']),
+            ['resolve', 'fire', 'wait-maintenance-on', 'wait-maintenance-off']
+        )
+
+    def test_command_line(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            with mock.patch('sys.argv', [
+                'cluster', '--consul', self.fake.url, '--no-cache',
+                '--stats', '--stats-json', output.name,
+                'inspect', 'node-1',
+            ]):
+                with OutputCapture(separate=True) as captured:
+                    main()
+            report = json.load(output)
+        self.assertEqual(list(report['phases']), ['resolve'])
+        self.assertEqual(report['requests']['GET kv']['count'], 1)
+        self.assertIn(
+            "Master apps of node node-1:", captured.stdout.getvalue()
+        )
+        self.assertIn("Total: 1 requests", captured.stderr.getvalue())
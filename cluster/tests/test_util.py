@@ -42,3 +42,12 @@ class TestUtils(unittest.TestCase):
 
     def test_json2object_no_data(self):
         self.assertFalse(util.json2obj(None))
+
+    def test_json2object_reuse_types(self):
+        app1 = util.json2obj('{"master": "node-1", "slave": "node-2"}')
+        app2 = util.json2obj('{"master": "node-3", "slave": null}')
+        other = util.json2obj('{"slave": "node-1", "master": "node-2"}')
+        self.assertIs(type(app1), type(app2))
+        self.assertIsNot(type(app1), type(other))
+        self.assertEqual(app2.master, "node-3")
+        self.assertEqual(other.master, "node-2")
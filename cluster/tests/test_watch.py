@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+from cluster import cluster
+from cluster import watch
+from cluster.fake_consul import FakeConsul
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.kv = mock.MagicMock()
+
+    def test_wait_changes(self):
+        responses = {
+            'app/key': iter([(1, None), (2, {'Value': 'v2'})]),
+            'maintenance/key': iter([(5, None)]),
+        }
+
+        def get_record_index(key, index=None, wait=None):
+            return next(responses[key], (index, None))
+
+        self.kv.get_record_index.side_effect = get_record_index
+        with watch.Watch(self.kv, ['app/key', 'maintenance/key']) as kv:
+            while kv.records['app/key'] is None:
+                self.assertTrue(kv.wait(timeout=2))
+            self.assertEqual(kv.records['app/key'], {'Value': 'v2'})
+            self.assertIsNone(kv.records['maintenance/key'])
+
+    def test_states(self):
+        responses = iter([(1, None), (2, {'Value': ''}), (3, None)])
+        changed = threading.Event()
+
+        def get_record_index(key, index=None, wait=None):
+            response = next(responses, None)
+            if response is None:
+                changed.set()
+                return index, None
+            return response
+
+        self.kv.get_record_index.side_effect = get_record_index
+        with watch.Watch(self.kv, ['maintenance/key']) as kv:
+            changed.wait(timeout=2)
+            self.assertTrue(kv.wait(timeout=2))
+            # the maintenance set then removed is not missed
+            self.assertEqual(kv.states, [
+                {'maintenance/key': None},
+                {'maintenance/key': {'Value': ''}},
+                {'maintenance/key': None},
+            ])
+
+    def test_wait_timeout(self):
+        self.kv.get_record_index.side_effect = \
+            lambda key, index=None, wait=None: (1, None)
+        with watch.Watch(self.kv, ['app/key']) as kv:
+            self.assertTrue(kv.wait(timeout=1))
+            self.assertFalse(kv.wait(timeout=0.3))
+
+    def test_follow_failure(self):
+        self.kv.get_record_index.side_effect = ConnectionError("lost")
+        with watch.Watch(self.kv, ['app/key']) as kv:
+            self.assertRaises(ConnectionError, kv.wait, timeout=1)
+
+    def test_strategies(self):
+        self.assertIsInstance(
+            watch.watch(self.kv, ['app/key'], 'blocking'), watch.Watch
+        )
+        self.assertIsInstance(
+            watch.watch(self.kv, ['app/key'], 'backoff'), watch.Poll
+        )
+        self.assertRaises(
+            ValueError, watch.watch, self.kv, ['app/key'], 'unknown'
+        )
+
+
+class TestWatchStop(unittest.TestCase):
+    """Blocking queries in flight are interrupted on stop"""
+
+    def setUp(self):
+        self.fake = FakeConsul()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.kv = cluster.Cluster(self.fake.url).consul.kv
+
+    def watch_threads(self):
+        return [
+            thread for thread in threading.enumerate()
+            if thread.name.startswith('watch ')
+        ]
+
+    def test_stop(self):
+        with watch.Watch(self.kv, ['app/key', 'maintenance/key']) as kv:
+            self.assertTrue(kv.wait(timeout=2))
+            # let threads send their blocking queries
+            while self.fake.requests['GET kv (blocking)'] < 2:
+                time.sleep(0.01)
+            start = time.monotonic()
+        self.assertLess(time.monotonic() - start, watch.STOP_TIMEOUT)
+        self.assertEqual(self.watch_threads(), [])
+
+    def test_requests_after_stop(self):
+        for count in range(1, 4):
+            with watch.Watch(self.kv, ['app/key']) as kv:
+                kv.wait(timeout=2)
+                while self.fake.requests['GET kv (blocking)'] < count:
+                    time.sleep(0.01)
+        self.assertEqual(self.kv._adapter.http_adapter.in_flight, {})
+        # interrupted connections are not reused
+        self.assertIsNone(self.kv.get('app/key'))
+
+
+class TestSharedWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeConsul()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        consul = cluster.Cluster(self.fake.url).consul
+        self.shared = watch.SharedWatch(consul.kv, consul.txn)
+        self.addCleanup(self.shared.stop)
+
+    def test_follow(self):
+        changes = queue.Queue()
+        keys = ['app/{}'.format(i) for i in range(70)]
+        token = self.shared.follow(keys, changes.put)
+        self.assertEqual(changes.get(timeout=2), dict.fromkeys(keys))
+        self.fake.put('app/69', 'v')
+        records = changes.get(timeout=2)
+        self.assertEqual(records['app/69']['Value'], 'v')
+        # keys are read by transactions of at most 64 operations
+        self.assertEqual(self.fake.requests['PUT txn'], 4)
+        self.shared.unfollow(token)
+        self.fake.put('app/69', 'v2')
+        with self.assertRaises(queue.Empty):
+            changes.get(timeout=0.2)
+
+    def test_stop(self):
+        self.shared.follow(['app/key'], lambda records: None)
+        while self.fake.requests['GET kv (blocking)'] < 2:
+            time.sleep(0.01)
+        start = time.monotonic()
+        self.shared.stop()
+        self.assertLess(time.monotonic() - start, watch.STOP_TIMEOUT)
+        self.assertFalse(self.shared._thread.is_alive())
+
+
+class TestPoll(unittest.TestCase):
+
+    def test_fixed_intervals(self):
+        intervals = watch.fixed_intervals(2)
+        self.assertEqual([next(intervals) for _ in range(3)], [2, 2, 2])
+
+    def test_backoff_intervals(self):
+        intervals = watch.backoff_intervals(
+            initial=0.1, ceiling=1, factor=2, jitter=0
+        )
+        self.assertEqual(
+            [round(next(intervals), 3) for _ in range(6)],
+            [0.1, 0.2, 0.4, 0.8, 1, 1]
+        )
+
+    def test_backoff_jitter(self):
+        intervals = watch.backoff_intervals(
+            initial=1, ceiling=1, jitter=0.5
+        )
+        with mock.patch('random.random', side_effect=[0, 0.5, 1]):
+            self.assertEqual(
+                [next(intervals) for _ in range(3)], [1, 0.75, 0.5]
+            )
+
+    @mock.patch('time.sleep')
+    def test_wait(self, sleep):
+        with watch.Poll(watch.fixed_intervals(2)) as poll:
+            self.assertTrue(poll.wait())
+            sleep.assert_called_once_with(2)
+            self.assertTrue(poll.wait(timeout=10))
+            sleep.assert_called_with(2)
+
+    @mock.patch('time.sleep')
+    def test_wait_timeout(self, sleep):
+        poll = watch.Poll(watch.fixed_intervals(5))
+        # last poll right before the timeout
+        self.assertTrue(poll.wait(timeout=3))
+        sleep.assert_called_once_with(3 - watch.POLL_MARGIN)
+        self.assertFalse(poll.wait(timeout=watch.POLL_MARGIN))
+        self.assertEqual(sleep.call_count, 1)
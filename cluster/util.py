@@ -1,10 +1,28 @@
+import functools
 import json
 from collections import namedtuple
 
+PLAN_KEYS = {'repo', 'branch', 'master', 'slave', 'update'}
+# optional master and slave may be null, like absent keys
+PLAN_TYPES = {
+    'repo': str,
+    'branch': str,
+    'master': (str, type(None)),
+    'slave': (str, type(None)),
+    'update': bool,
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _record_type(keys):
+    # building a namedtuple class is expensive, there is usually only a few
+    # distinct kv value shapes so classes are reused per keys tuple
+    return namedtuple('X', keys)
+
 
 def _json_object_hook(data):
-    keys = [k.replace('-', '_').replace('.', '_') for k in data.keys()]
-    return namedtuple('X', keys)(*data.values())
+    keys = tuple(k.replace('-', '_').replace('.', '_') for k in data.keys())
+    return _record_type(keys)(*data.values())
 
 
 def json2obj(data):
@@ -13,5 +31,55 @@ def json2obj(data):
     return json.loads(data, object_hook=_json_object_hook)
 
 
+def load_plan(path):
+    """Load a deployment plan: a list of dicts with ``repo``, ``branch`` and
+    optional ``master``, ``slave`` and ``update`` keys, from a json or yaml
+    (requires PyYAML) file.
+    """
+    with open(path) as plan_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError(
+                    "PyYAML is required to read yaml plan files "
+                    "(pip install pyyaml), use a json file otherwise"
+                )
+            plan = yaml.safe_load(plan_file)
+        else:
+            plan = json.load(plan_file)
+    if not isinstance(plan, list):
+        raise RuntimeError(
+            "Deployment plan {} must be a list of services".format(path)
+        )
+    for entry in plan:
+        if not isinstance(entry, dict) or not {'repo', 'branch'} <= set(
+                entry
+        ):
+            raise RuntimeError(
+                "Each service of the deployment plan {} requires a repo and "
+                "a branch: {!r}".format(path, entry)
+            )
+        unknown = set(entry) - PLAN_KEYS
+        if unknown:
+            raise RuntimeError(
+                "Unknown keys {} in the deployment plan {}".format(
+                    sorted(unknown), path
+                )
+            )
+        invalid = sorted(
+            key for key, value in entry.items()
+            if not isinstance(value, PLAN_TYPES[key])
+        )
+        if invalid:
+            raise RuntimeError(
+                "Invalid {} in the deployment plan {}: {!r}, repo, branch, "
+                "master and slave must be strings, update a boolean".format(
+                    ', '.join(invalid), path, entry
+                )
+            )
+    return plan
+
+
 def get_input(prompt):
     return input(prompt)
@@ -0,0 +1,334 @@
+"""Wait for consul kv changes using consul blocking queries
+(https://www.consul.io/api/index.html#blocking-queries) or, where blocking
+queries are not suitable, polling at fixed or backed off intervals
+"""
+import logging
+import queue
+import random
+import threading
+import time
+
+DEFAULT_WAIT = '30s'
+# consul recommend to rate limit blocking queries loop
+MIN_QUERY_INTERVAL = 0.1
+STRATEGIES = ['blocking', 'fixed', 'backoff']
+DEFAULT_STRATEGY = 'blocking'
+DEFAULT_POLL_INTERVAL = 1
+BACKOFF_INITIAL = MIN_QUERY_INTERVAL
+BACKOFF_CEILING = 5
+BACKOFF_FACTOR = 2
+BACKOFF_JITTER = 0.5
+# time kept before a timeout to poll a last time
+POLL_MARGIN = 0.1
+# max time to wait watch threads end once their queries are interrupted
+STOP_TIMEOUT = 1
+STOP_INTERVAL = 0.05
+# consul transactions are limited to 64 operations
+TXN_MAX_OPERATIONS = 64
+logger = logging.getLogger(__name__)
+
+
+def watch(kv, keys, strategy=DEFAULT_STRATEGY):
+    """Build a watcher of the given keys using the given strategy
+
+    :param strategy: one of :py:data:`STRATEGIES`
+    :rtype: :py:class:`Watch` or :py:class:`Poll`
+    """
+    if strategy == 'blocking':
+        return Watch(kv, keys)
+    if strategy == 'fixed':
+        return Poll(fixed_intervals())
+    if strategy == 'backoff':
+        return Poll(backoff_intervals())
+    raise ValueError("Unknown wait strategy: {}".format(strategy))
+
+
+def fixed_intervals(interval=DEFAULT_POLL_INTERVAL):
+    while True:
+        yield interval
+
+
+def backoff_intervals(
+        initial=BACKOFF_INITIAL,
+        ceiling=BACKOFF_CEILING,
+        factor=BACKOFF_FACTOR,
+        jitter=BACKOFF_JITTER
+):
+    """Exponentially growing intervals up to ``ceiling``, each one reduced
+    by up to ``jitter`` (ratio) so many waiters do not poll in sync
+    """
+    interval = initial
+    while True:
+        yield interval * (1 - jitter * random.random())
+        interval = min(interval * factor, ceiling)
+
+
+class Watch:
+    """Follow a set of kv keys, each key is followed in its own thread
+    sending blocking queries, so the watcher is woken up as soon as one of
+    those keys changes::
+
+        with Watch(consul.kv, ['app/key', 'maintenance/key']) as watch:
+            while not done(watch.records):
+                watch.wait(timeout)
+    """
+
+    def __init__(self, kv, keys, wait=DEFAULT_WAIT):
+        self._kv = kv
+        self._wait = wait
+        self._changes = queue.Queue()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(
+                target=self._follow,
+                args=(key, ),
+                name='watch {}'.format(key),
+                daemon=True
+            )
+            for key in keys
+        ]
+        self.records = {key: None for key in keys}
+        # successive ``records`` received by the last :py:meth:`wait`
+        self.states = []
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stop following keys: blocking queries in flight are interrupted
+        (see :py:meth:`cluster.consul_api.KV.interrupt`) and threads joined, so
+        threads and connections are released at once
+
+        :param timeout: max time in second to wait threads end
+        """
+        self._stopped.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            _stop_thread(thread, self._kv, deadline)
+
+    def _follow(self, key):
+        index = None
+        while not self._stopped.is_set():
+            start = time.monotonic()
+            try:
+                new_index, record = self._kv.get_record_index(
+                    key, index=index, wait=self._wait
+                )
+            except Exception as err:
+                if not self._stopped.is_set():
+                    self._changes.put((key, err))
+                return
+            if index is None or new_index != index:
+                self._changes.put((key, record))
+            # index can go backward (ie: consul snapshot restored), in such
+            # case the index must be reset
+            index = new_index if index is None or new_index >= index else 0
+            elapsed = time.monotonic() - start
+            if elapsed < MIN_QUERY_INTERVAL:
+                self._stopped.wait(MIN_QUERY_INTERVAL - elapsed)
+
+    def wait(self, timeout=None):
+        """Wait until at least one key changes, ``records`` are updated
+        with all changes received meanwhile and ``states`` holds a copy of
+        ``records`` after each change, so short lived values are not missed.
+
+        :param timeout: max time to wait in second
+        :return: True if ``records`` changed, False on timeout
+        """
+        try:
+            changes = [self._changes.get(timeout=timeout)]
+        except queue.Empty:
+            return False
+        while True:
+            try:
+                changes.append(self._changes.get_nowait())
+            except queue.Empty:
+                break
+        self.states = []
+        for key, record in changes:
+            if isinstance(record, Exception):
+                raise record
+            logger.debug("Kv key %s changed: %r", key, record)
+            self.records[key] = record
+            self.states.append(dict(self.records))
+        return True
+
+
+def _stop_thread(thread, kv, deadline):
+    """Interrupt the blocking queries of a stopped watch thread until it
+    ends or ``deadline`` (monotonic time) is reached
+    """
+    while thread.is_alive():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning("Thread %s is still running", thread.name)
+            return
+        # a query may be sent after an interruption, until the thread sees
+        # the watch is stopped
+        kv.interrupt(thread.ident)
+        thread.join(min(STOP_INTERVAL, remaining))
+
+
+class SharedWatch:
+    """Follow kv keys of many waiters from a single thread: a blocking
+    query listing top level kv keys wakes it up on any kv change, then keys
+    of all waiters are read back in transactions. Keys are followed and
+    unfollowed while it runs::
+
+        shared = SharedWatch(consul.kv, consul.txn)
+        token = shared.follow(['app/key', 'maintenance/key'], notify)
+        ...
+        shared.unfollow(token)
+        shared.stop()
+
+    Records are read once the watch is woken up: unlike :py:class:`Watch`,
+    a value set then removed meanwhile is not seen.
+    """
+
+    def __init__(self, kv, txn, wait=DEFAULT_WAIT):
+        self._kv = kv
+        self._txn = txn
+        self._wait = wait
+        self._followers = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def follow(self, keys, notify):
+        """Notify changes of the given keys, changes happening before the
+        next wake up of the watch are not notified (the caller is expected
+        to read keys once followed)
+
+        :param notify: callable called from the watch thread with a dict of
+            records per key each time keys may have changed, or with the
+            exception raised querying consul
+        :return: a token to give to :py:meth:`unfollow`
+        """
+        token = object()
+        with self._condition:
+            self._followers[token] = (list(keys), notify)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._follow, name='shared watch', daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return token
+
+    def unfollow(self, token):
+        with self._condition:
+            self._followers.pop(token, None)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stop the watch thread interrupting its blocking query (see
+        :py:meth:`Watch.stop`)
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            _stop_thread(self._thread, self._kv, time.monotonic() + timeout)
+
+    def _follow(self):
+        index = None
+        while True:
+            with self._condition:
+                while not self._followers and not self._stopped:
+                    # the next query is sent from the current index
+                    index = None
+                    self._condition.wait()
+                if self._stopped:
+                    return
+            start = time.monotonic()
+            try:
+                new_index, _ = self._kv.keys_index(
+                    '', separator='/', index=index, wait=self._wait
+                )
+                if index is None or new_index != index:
+                    self._read()
+                # see Watch._follow
+                index = new_index if index is None or new_index >= index \
+                    else 0
+            except Exception as err:
+                if self._stopped:
+                    return
+                self._notify(
+                    [notify for _, notify in self._snapshot()], err
+                )
+                index = None
+            elapsed = time.monotonic() - start
+            if elapsed < MIN_QUERY_INTERVAL:
+                with self._condition:
+                    if not self._stopped:
+                        self._condition.wait(MIN_QUERY_INTERVAL - elapsed)
+
+    def _snapshot(self):
+        with self._condition:
+            return list(self._followers.values())
+
+    def _read(self):
+        followers = self._snapshot()
+        keys = sorted({key for keys, _ in followers for key in keys})
+        records = {}
+        for start in range(0, len(keys), TXN_MAX_OPERATIONS):
+            _, chunk = self._txn.get_records(
+                keys[start:start + TXN_MAX_OPERATIONS]
+            )
+            records.update(chunk)
+        for keys, notify in followers:
+            self._notify([notify], {key: records[key] for key in keys})
+
+    @staticmethod
+    def _notify(notifiers, value):
+        for notify in notifiers:
+            try:
+                notify(value)
+            except Exception:
+                # a waiter leaving (ie: its event loop is closed) must not
+                # stop others notifications
+                logger.exception("Can't notify a kv change")
+
+
+class Poll:
+    """:py:class:`Watch` replacement which does not send any request: the
+    caller is expected to read keys each time :py:meth:`wait` returns::
+
+        with Poll(backoff_intervals()) as poll:
+            while not done(read_keys()):
+                poll.wait(timeout)
+
+    :param intervals: iterator of times to wait in second between polls
+    """
+
+    def __init__(self, intervals):
+        self._intervals = intervals
+        self.records = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        pass
+
+    def wait(self, timeout=None):
+        """Wait the next poll interval, shortened to poll a last time right
+        before the timeout.
+
+        :param timeout: max time to wait in second
+        :return: True when it's time to poll, False on timeout
+        """
+        interval = next(self._intervals)
+        if timeout is not None:
+            if timeout <= POLL_MARGIN:
+                return False
+            interval = min(interval, timeout - POLL_MARGIN)
+        time.sleep(interval)
+        return True
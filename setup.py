@@ -30,7 +30,6 @@ setup(
     ),
     include_package_data=True,
     zip_safe=False,
-    namespace_packages=['cluster'],
     install_requires=requires,
     tests_require=requires + tests_requires,
     entry_points="""